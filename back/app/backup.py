@@ -0,0 +1,353 @@
+"""Online SQLite snapshots and restore.
+
+Run from ``back/``::
+
+    python -m app.backup snapshot              # every SQLite shard, now
+    python -m app.backup list
+    python -m app.backup prune                 # keep the newest BACKUP_KEEP per database
+    python -m app.backup restore SNAPSHOT [--to PATH] [--force]
+
+Snapshots use SQLite's online backup API, ``BACKUP_STEP_PAGES`` pages per step with a
+``BACKUP_STEP_PAUSE`` second pause in between. The source is only read-locked during a
+step, so writers keep committing while a snapshot is taken. In rollback-journal mode a
+write from another connection restarts the copy; each restart doubles the step so a
+busy database still finishes. In WAL mode the copy reads one snapshot throughout and
+never restarts. The copy is checked with ``PRAGMA quick_check``, then compressed (zstd when
+``zstandard`` is installed, else gzip) and renamed into place, so a listed snapshot is
+always complete.
+
+Snapshots are named ``<stem>-<path hash>-<UTC stamp>.db[.gz|.zst]``: the hash of the
+source file's path keeps same-named shards in different directories apart, and the
+stamp has microseconds. An existing snapshot is never overwritten.
+
+With ``BACKUP_INTERVAL`` set, the API takes snapshots on that schedule; one worker per
+interval does the work.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import asynccontextmanager, closing
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, AsyncIterator, Dict, List, Optional, Sequence
+
+from sqlalchemy.engine import Engine
+
+from .core.config import get_settings
+
+
+logger = logging.getLogger("backup")
+
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+STAMP = "%Y%m%dT%H%M%S.%fZ"
+CHUNK = 1 << 20
+
+
+@dataclass
+class Snapshot:
+    path: Path
+    database: str  # source database: file stem and path hash, see database_key
+    taken_at: datetime
+    size: int
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _compression(name: str) -> str:
+    if name == "auto":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return "gzip"
+        return "zstd"
+    if name not in SUFFIXES:
+        raise ValueError(f"Unsupported BACKUP_COMPRESSION: {name}")
+    return name
+
+
+def _open_compressed(path: Path, compression: str, mode: str) -> IO[bytes]:
+    if compression == "zstd":
+        import zstandard  # optional dependency, only for .zst snapshots
+
+        raw = open(path, mode)
+        if mode == "wb":
+            return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+
+def sqlite_path(bind: Engine) -> Optional[str]:
+    """The database file behind ``bind``, or None if it isn't a SQLite file."""
+    database = bind.url.database if bind.dialect.name == "sqlite" else None
+    return database if database and database != ":memory:" else None
+
+
+def database_key(path: str) -> str:
+    """``<stem>-<hash of the resolved path>``: what a database's snapshots are named and grouped by."""
+    digest = hashlib.sha1(os.path.realpath(path).encode()).hexdigest()[:8]
+    return f"{Path(path).stem}-{digest}"
+
+
+def backup_dir() -> Path:
+    """``BACKUP_DIR``, else ``backups/`` next to the shard 0 database."""
+    configured = get_settings().backup_dir
+    if configured:
+        return Path(configured)
+    from .db import engine
+
+    return Path(sqlite_path(engine) or ".").resolve().parent / "backups"
+
+
+def copy_online(source: str, target: str, pages: int, pause: float) -> int:
+    """Copy ``source`` into a new file ``target`` with the backup API; returns the restarts needed."""
+    restarts = 0
+    with closing(sqlite3.connect(source, timeout=30, isolation_level=None)) as src:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if wal:
+            # Pin one read snapshot for the whole copy: WAL readers don't block writers,
+            # and writes made meanwhile don't invalidate the pages already copied
+            src.execute("BEGIN")
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        try:
+            while True:
+                remaining_before: List[int] = []
+
+                def progress(status: int, remaining: int, total: int) -> None:
+                    # Another connection wrote to the source: SQLite started over
+                    if remaining_before and remaining > remaining_before[-1]:
+                        raise _Restarted()
+                    remaining_before.append(remaining)
+                    if remaining and pause:
+                        time.sleep(pause)
+
+                dst = sqlite3.connect(target)
+                try:
+                    src.backup(dst, pages=pages, progress=progress)
+                    return restarts
+                except _Restarted:
+                    restarts += 1
+                    pages = -1 if pages <= 0 or restarts >= 8 else pages * 2
+                    logger.info("Snapshot of %s restarted by a write; %s pages per step now", source, pages)
+                finally:
+                    dst.close()
+        finally:
+            if wal:
+                src.execute("COMMIT")
+
+
+def _quick_check(path: Path) -> str:
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("PRAGMA quick_check").fetchone()[0]
+
+
+def _compress(source: Path, target: Path, compression: str) -> None:
+    with open(source, "rb") as raw, _open_compressed(target, compression, "wb") as out:
+        shutil.copyfileobj(raw, out, CHUNK)
+
+
+def _publish(source: Path, final: Path) -> None:
+    # Unlike os.replace, a hard link fails with FileExistsError instead of overwriting
+    os.link(source, final)
+    source.unlink()
+
+
+def snapshot_database(path: str, directory: Optional[Path] = None, compression: Optional[str] = None) -> Snapshot:
+    """Take one snapshot of the SQLite file at ``path`` into ``directory``."""
+    settings = get_settings()
+    directory = directory or backup_dir()
+    compression = _compression(compression or settings.backup_compression)
+    directory.mkdir(parents=True, exist_ok=True)
+    database = database_key(path)
+    taken_at = datetime.now(timezone.utc)
+    final = directory / f"{database}-{taken_at.strftime(STAMP)}.db{SUFFIXES[compression]}"
+    if final.exists():
+        raise FileExistsError(f"Snapshot {final} already exists")
+    copy = directory / f".{final.name}.copy"
+    partial = directory / f".{final.name}.part"
+    started = time.perf_counter()
+    try:
+        restarts = copy_online(path, str(copy), settings.backup_step_pages, settings.backup_step_pause)
+        result = _quick_check(copy)
+        if result != "ok":
+            raise RuntimeError(f"Snapshot of {path} failed quick_check: {result}")
+        if compression == "none":
+            _publish(copy, final)
+        else:
+            _compress(copy, partial, compression)
+            _publish(partial, final)
+    finally:
+        copy.unlink(missing_ok=True)
+        partial.unlink(missing_ok=True)
+    size = final.stat().st_size
+    logger.info("Snapshot %s (%s bytes, %s restarts) in %.2fs", final.name, size, restarts, time.perf_counter() - started)
+    return Snapshot(final, database, taken_at, size)
+
+
+def snapshot_all(binds: Optional[Sequence[Engine]] = None, directory: Optional[Path] = None) -> List[Snapshot]:
+    """Snapshot every SQLite shard and prune old snapshots."""
+    if binds is None:
+        from .db import engines as binds
+    snapshots = []
+    for bind in binds:
+        path = sqlite_path(bind)
+        if path is None:
+            logger.warning("Skipping %s: only SQLite files are snapshotted", bind.url.render_as_string(hide_password=True))
+            continue
+        snapshots.append(snapshot_database(path, directory))
+    prune(directory)
+    return snapshots
+
+
+def parse_snapshot(path: Path) -> Optional[Snapshot]:
+    """``<stem>-<path hash>-<UTC stamp>.db[.gz|.zst]`` -> Snapshot; None for other files (and unfinished ones)."""
+    name = path.name
+    if name.startswith(".") or not any(name.endswith(f".db{suffix}") for suffix in SUFFIXES.values()):
+        return None
+    database, _, stamp = name[:name.rindex(".db")].rpartition("-")
+    try:
+        taken_at = datetime.strptime(stamp, STAMP).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return Snapshot(path, database, taken_at, path.stat().st_size if path.exists() else 0)
+
+
+def list_snapshots(directory: Optional[Path] = None) -> List[Snapshot]:
+    """Complete snapshots in ``directory``, oldest first."""
+    directory = directory or backup_dir()
+    if not directory.is_dir():
+        return []
+    snapshots = [snapshot for snapshot in map(parse_snapshot, directory.iterdir()) if snapshot is not None]
+    return sorted(snapshots, key=lambda s: (s.taken_at, s.path.name))
+
+
+def prune(directory: Optional[Path] = None, keep: Optional[int] = None) -> List[Snapshot]:
+    """Delete all but the newest ``keep`` snapshots of each database; returns the deleted ones."""
+    keep = get_settings().backup_keep if keep is None else keep
+    by_database: Dict[str, List[Snapshot]] = {}
+    for snapshot in list_snapshots(directory):
+        by_database.setdefault(snapshot.database, []).append(snapshot)
+    deleted = []
+    for snapshots in by_database.values():
+        for snapshot in snapshots[:max(0, len(snapshots) - keep)]:
+            snapshot.path.unlink(missing_ok=True)
+            deleted.append(snapshot)
+    return deleted
+
+
+def _compression_of(path: Path) -> str:
+    for compression, suffix in SUFFIXES.items():
+        if suffix and path.name.endswith(suffix):
+            return compression
+    return "none"
+
+
+def restore(snapshot: Path, target: str) -> None:
+    """Replace the database at ``target`` with ``snapshot``.
+
+    The snapshot is unpacked and checked next to the target, then written into it with
+    the backup API in one step, so other connections see either the old or the new
+    database. Stop the API and bot first anyway: their cached state is not reset.
+    """
+    unpacked = Path(f"{target}.restore")
+    try:
+        with _open_compressed(snapshot, _compression_of(snapshot), "rb") as packed, open(unpacked, "wb") as out:
+            shutil.copyfileobj(packed, out, CHUNK)
+        result = _quick_check(unpacked)
+        if result != "ok":
+            raise RuntimeError(f"{snapshot} failed quick_check: {result}")
+        with closing(sqlite3.connect(unpacked)) as src, closing(sqlite3.connect(target, timeout=30)) as dst:
+            src.backup(dst)
+    finally:
+        unpacked.unlink(missing_ok=True)
+    logger.info("Restored %s into %s", snapshot, target)
+
+
+def _due_in(interval: float) -> float:
+    return interval - time.time() % interval
+
+
+@asynccontextmanager
+async def backups_running(binds: Sequence[Engine]) -> AsyncIterator[None]:
+    """Snapshot every ``BACKUP_INTERVAL`` seconds for the app's lifespan.
+
+    Runs are aligned to multiples of the interval and each one is claimed in the
+    coordination backend, so only one of several workers takes it.
+    """
+    from .core.coordination import get_coordinator
+
+    interval = get_settings().backup_interval
+
+    async def loop() -> None:
+        coordinator = get_coordinator()
+        while True:
+            await asyncio.sleep(_due_in(interval))
+            slot = int(time.time() // interval)
+            if not await coordinator.claim(f"backup:{slot}", interval):
+                continue
+            try:
+                await asyncio.to_thread(snapshot_all, binds)
+            except Exception:
+                logger.exception("Scheduled snapshot failed")
+
+    task = asyncio.create_task(loop())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot")
+    commands.add_parser("list")
+    commands.add_parser("prune")
+    restore_cmd = commands.add_parser("restore")
+    restore_cmd.add_argument("snapshot", type=Path)
+    restore_cmd.add_argument("--to", help="Database file (default: the shard the snapshot was taken from)")
+    restore_cmd.add_argument("--force", action="store_true", help="Overwrite an existing database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    if args.command == "snapshot":
+        for snapshot in snapshot_all():
+            print(f"{snapshot.path} ({snapshot.size} bytes)")
+    elif args.command == "list":
+        for snapshot in list_snapshots():
+            print(f"{snapshot.taken_at:%Y-%m-%d %H:%M:%S} {snapshot.size:>12} {snapshot.path}")
+    elif args.command == "prune":
+        print(f"Deleted {len(prune())} snapshots")
+    else:
+        target = args.to
+        if target is None:
+            from .db import engines
+
+            parsed = parse_snapshot(args.snapshot)
+            matches = [path for path in map(sqlite_path, engines)
+                       if path and parsed is not None and database_key(path) == parsed.database]
+            if len(matches) != 1:
+                parser.error("can't tell which database the snapshot belongs to; pass --to")
+            target = matches[0]
+        if Path(target).exists() and Path(target).stat().st_size and not args.force:
+            parser.error(f"{target} exists; stop the API and bot, then pass --force to overwrite it")
+        restore(args.snapshot, target)
+        print(f"Restored {args.snapshot} into {target}")
+
+
+if __name__ == "__main__":
+    main()
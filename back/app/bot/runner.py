@@ -2,22 +2,36 @@ from __future__ import annotations
 
 import asyncio
 import os
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.filters import CommandStart
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 import logging
 
-from sqlmodel import Session, select
+from sqlmodel import Session, delete, select
+
+from ..core.metrics import (
+    OPENAI_LATENCY,
+    TELEGRAM_SEND_LATENCY,
+    instrument_engine,
+    record_openai_usage,
+    start_metrics_server,
+)
+from ..core.admission import LlmBusy, chat_completion
+from ..core.ai import close_openai_clients, openai_available, resolve_ai_settings
+from ..core.config import get_settings
+from ..core.coordination import get_coordinator
+from ..db import engines, session_for
+from ..deps import visible_rows
+from ..models import ChatMessage, Task, Project
+from ..reminders import TelegramSender, run_reminders
+
+if TYPE_CHECKING:
+    from aiogram.types import Message, ReplyKeyboardMarkup
 
-from ..db import engine
-from ..models import ChatMessage, AiSettings, Task, Project
 logger = logging.getLogger("bot")
 
+BUSY_REPLY = "Сейчас слишком много запросов к ChatGPT. Попробуйте ещё раз через минуту."
+
 
 def _setup_logging() -> None:
     level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -35,13 +49,10 @@ def _mask_secret(value: Optional[str]) -> str:
         return "*" * len(value)
     return value[:3] + "*" * (len(value) - 6) + value[-3:]
 
-try:
-    from openai import OpenAI  # type: ignore
-except Exception:
-    OpenAI = None  # type: ignore
-
 
 def _reply_kb() -> ReplyKeyboardMarkup:
+    from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+
     return ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="Очистить контекст")]],
         resize_keyboard=True,
@@ -51,9 +62,10 @@ def _reply_kb() -> ReplyKeyboardMarkup:
 
 def _build_tasks_context(session: Session, owner_id: Optional[int]) -> str:
     statement = select(Task, Project).join(Project, isouter=True)
-    if owner_id is not None:
-        statement = statement.where((Task.owner_id == owner_id) | (Task.owner_id.is_(None)))
-    rows = session.exec(statement).all()
+    if owner_id is None:
+        rows = session.exec(statement).all()
+    else:
+        rows = visible_rows(session, Task, owner_id, lambda s, where: s.exec(statement.where(where)).all())
     lines: List[str] = []
     for task, project in rows:
         lines.append(
@@ -77,34 +89,6 @@ def _build_tasks_context(session: Session, owner_id: Optional[int]) -> str:
     return "\n".join(["Текущие открытые задачи:"] + lines)
 
 
-def _get_ai_settings(session: Session, owner_id: Optional[int]) -> AiSettings:
-    logger.debug("Fetching AiSettings for owner_id=%s", owner_id)
-    owner_settings = None
-    if owner_id is not None:
-        owner_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == owner_id)).first()
-        logger.debug("Owner-specific AiSettings found=%s", bool(owner_settings))
-    global_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == 0)).first()
-    logger.debug("Global AiSettings found=%s", bool(global_settings))
-
-    # Prefer owner settings if it has a non-empty key; otherwise fallback to global with key
-    def has_key(s: Optional[AiSettings]) -> bool:
-        return bool(s and s.openai_api_key and len(s.openai_api_key) > 0)
-
-    chosen = owner_settings if has_key(owner_settings) else (global_settings if has_key(global_settings) else (owner_settings or global_settings))
-    if not chosen:
-        chosen = AiSettings(owner_id=owner_id or 0)
-        session.add(chosen)
-        session.commit()
-        session.refresh(chosen)
-        logger.debug("Created new AiSettings row for owner_id=%s", chosen.owner_id)
-
-    logger.info("AiSettings resolved: owner_id=%s, has_key=%s, model=%s",
-                chosen.owner_id,
-                bool(chosen.openai_api_key and len(chosen.openai_api_key) > 0),
-                chosen.openai_model)
-    return chosen
-
-
 def _estimate_context_usage_chars(messages: List[Dict[str, str]], max_chars: int) -> float:
     total = 0
     for m in messages:
@@ -113,6 +97,12 @@ def _estimate_context_usage_chars(messages: List[Dict[str, str]], max_chars: int
 
 
 async def main() -> None:
+    # aiogram is only needed by the polling process, not by modules that import helpers from here
+    from aiogram import Bot, Dispatcher, F
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.filters import CommandStart
+
     _setup_logging()
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
@@ -136,11 +126,10 @@ async def main() -> None:
     @dp.message(F.text.casefold() == "/clear")
     async def on_clear(message: Message) -> None:
         owner_id = message.from_user.id if message.from_user else 0
-        with Session(engine) as session:
-            msgs = session.exec(select(ChatMessage).where(ChatMessage.owner_id == (owner_id or 0))).all()
-            for m in msgs:
-                session.delete(m)
+        with session_for(owner_id) as session:
+            removed = session.exec(delete(ChatMessage).where(ChatMessage.owner_id == (owner_id or 0))).rowcount
             session.commit()
+        logger.info("Cleared context for owner_id=%s, removed=%s", owner_id, removed)
         await message.answer("Контекст очищен.", reply_markup=_reply_kb())
 
     @dp.message(F.text)
@@ -150,18 +139,19 @@ async def main() -> None:
         chat_id = message.chat.id
         logger.info("Incoming message: from=%s chat=%s len=%s", owner_id, chat_id, len(text))
 
-        with Session(engine) as session:
+        with session_for(owner_id) as session:
             # Persist user message
             if text:
                 session.add(ChatMessage(owner_id=owner_id, role="user", content=text, created_at=datetime.utcnow()))
                 session.commit()
 
-            ai = _get_ai_settings(session, owner_id)
-            if not ai.openai_api_key:
+            ai = resolve_ai_settings(session, owner_id)
+            logger.info("AiSettings resolved: owner_id=%s, has_key=%s, model=%s", ai.owner_id, bool(ai.api_key), ai.model)
+            if not ai.api_key:
                 logger.warning("No OpenAI API key for owner_id=%s; replying with hint", owner_id)
                 await message.answer("Не задан API токен ChatGPT. Задайте его в настройках приложения.", reply_markup=_reply_kb())
                 return
-            if OpenAI is None:
+            if not openai_available():
                 await message.answer("OpenAI клиент не установлен на сервере.", reply_markup=_reply_kb())
                 return
 
@@ -177,28 +167,66 @@ async def main() -> None:
         if usage >= 0.85:
             await message.answer("Внимание: контекст диалога достиг 85% от лимита. Рекомендуется очистить контекст.", reply_markup=_reply_kb())
 
+        model = ai.model or "gpt-4o"
+        started = time.perf_counter()
         try:
-            client = OpenAI(api_key=ai.openai_api_key)
-            completion = client.chat.completions.create(
-                model=ai.openai_model or "gpt-4o",
+            completion = await chat_completion(
+                ai.api_key,
+                owner_id,
+                model=model,
                 messages=messages,
                 temperature=0.2,
             )
             answer = completion.choices[0].message.content or ""
-            logger.info("OpenAI call ok: model=%s answer_len=%s", ai.openai_model, len(answer))
+            OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="ok")
+            record_openai_usage(model, getattr(completion, "usage", None))
+            logger.info("OpenAI call ok: model=%s answer_len=%s", ai.model, len(answer))
+        except LlmBusy:
+            OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="busy")
+            await message.answer(BUSY_REPLY, reply_markup=_reply_kb())
+            return
         except Exception as e:
+            OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="error")
             logger.exception("OpenAI call failed: %s", e)
             await message.answer(f"Ошибка при обращении к ChatGPT API: {e}", reply_markup=_reply_kb())
             return
 
         # store assistant reply
-        with Session(engine) as session:
+        with session_for(owner_id) as session:
             session.add(ChatMessage(owner_id=owner_id, role="assistant", content=answer, created_at=datetime.utcnow()))
             session.commit()
 
-        await message.answer(answer, reply_markup=_reply_kb())
-
-    await dp.start_polling(bot)
+        with TELEGRAM_SEND_LATENCY.time(outcome="ok"):
+            await message.answer(answer, reply_markup=_reply_kb())
+
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
+        logger.info("Metrics served on :%s/metrics", metrics_port)
+    for bind in engines:
+        instrument_engine(bind)
+    # Hear the API workers' AI settings invalidations: needs the API's backend, which the
+    # default coordination.db next to a shared SQLite database is (else set COORDINATION_URL)
+    coordinator = get_coordinator()
+    await coordinator.start()
+    reminders: Optional[asyncio.Task] = None
+    if get_settings().reminders == "bot":
+        sender = TelegramSender.from_settings()
+        if sender is not None:
+            reminders = asyncio.create_task(run_reminders(engines, sender))
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if reminders is not None:
+            reminders.cancel()
+            try:
+                await reminders
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception("Reminder scheduler failed")
+        await close_openai_clients()
+        await coordinator.close()
 
 
 if __name__ == "__main__":
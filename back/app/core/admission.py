@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from .ai import openai_client
+from .config import get_settings
+from .coordination import get_coordinator
+from .metrics import LLM_ADMISSION, LLM_RETRIES, QUEUE_DEPTH
+
+
+logger = logging.getLogger("llm-admission")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LlmBusy(Exception):
+    """The call was not admitted: queue full or waited too long. Tell the user to retry later."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self) -> None:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Upstream said back off: drain the bucket so nobody starts for ``seconds``."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class KeyGate:
+    """Admission for one API key.
+
+    At most ``max_in_flight`` calls run at once, at most ``owner_in_flight`` of them per
+    owner. Waiters queue per owner and free slots are handed out round-robin across
+    owners, so one user's burst can't starve the rest. Starts are paced by a token
+    bucket sized to the key's requests-per-minute quota.
+    """
+
+    def __init__(self, max_in_flight: int, owner_in_flight: int, max_queue: int, owner_queue: int, rpm: float) -> None:
+        self.max_in_flight = max_in_flight
+        self.owner_in_flight = owner_in_flight
+        self.max_queue = max_queue
+        self.owner_queue = owner_queue
+        self.in_flight = 0
+        self.running: Dict[int, int] = {}
+        self.waiting: "OrderedDict[int, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+        self.bucket = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0))
+
+    def _can_start(self, owner: int) -> bool:
+        return self.in_flight < self.max_in_flight and self.running.get(owner, 0) < self.owner_in_flight
+
+    def _start(self, owner: int) -> None:
+        self.in_flight += 1
+        self.running[owner] = self.running.get(owner, 0) + 1
+
+    async def acquire(self, owner: int, timeout: float) -> None:
+        if not self.waiting and self._can_start(owner):
+            self._start(owner)
+            return
+        queue = self.waiting.get(owner)
+        if self.queued >= self.max_queue or (queue is not None and len(queue) >= self.owner_queue):
+            LLM_ADMISSION.inc(outcome="rejected")
+            raise LlmBusy("queue full")
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(owner, deque()).append(future)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Admitted just as the timeout fired: hand the slot back
+                self.release(owner)
+            else:
+                future.cancel()
+                self._forget(owner, future)
+            LLM_ADMISSION.inc(outcome="timeout")
+            raise LlmBusy("waited too long")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(owner)
+            else:
+                future.cancel()
+                self._forget(owner, future)
+            raise
+
+    def _forget(self, owner: int, future: asyncio.Future) -> None:
+        queue = self.waiting.get(owner)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self.waiting[owner]
+
+    def release(self, owner: int) -> None:
+        self.in_flight -= 1
+        self.running[owner] -= 1
+        if not self.running[owner]:
+            del self.running[owner]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # One pass over owners in round-robin order; a served owner moves to the back
+        for owner in list(self.waiting):
+            if self.in_flight >= self.max_in_flight:
+                break
+            if not self._can_start(owner):
+                continue
+            queue = self.waiting.pop(owner)
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.waiting[owner] = queue
+            self._start(owner)
+            future.set_result(None)
+
+    def learn(self, headers: Any) -> None:
+        """Resize the bucket from OpenAI's ``x-ratelimit-*-requests`` response headers."""
+        try:
+            limit = float(headers.get("x-ratelimit-limit-requests") or 0)
+        except (TypeError, ValueError):
+            return
+        if limit > 0 and abs(limit / 60.0 - self.bucket.rate) > 1e-9:
+            self.bucket.rate = limit / 60.0
+            self.bucket.capacity = max(1.0, limit / 60.0)
+
+
+# One set of gates per event loop, like the client pool
+_gates: Dict[int, Dict[str, KeyGate]] = {}
+
+
+def key_gate(api_key: str) -> KeyGate:
+    gates = _gates.setdefault(id(asyncio.get_running_loop()), {})
+    digest = hashlib.sha256(api_key.encode()).hexdigest()
+    gate = gates.get(digest)
+    if gate is None:
+        s = get_settings()
+        gate = gates[digest] = KeyGate(s.llm_key_concurrency, s.llm_owner_concurrency, s.llm_queue_size,
+                                       s.llm_owner_queue, s.llm_key_rpm)
+    return gate
+
+
+async def _shared_wait(api_key: str, rpm: float) -> float:
+    """Count a call in fixed one-minute windows held by the coordination backend, so workers share
+    the key's RPM. Returns 0 when this window had room, else the seconds until the next one."""
+    coordinator = get_coordinator()
+    if not coordinator.shared:
+        return 0.0
+    digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    now = time.time()
+    window = int(now // 60)
+    if await coordinator.incr(f"llm:{digest}:{window}", 1, ttl=120) <= rpm:
+        return 0.0
+    return (window + 1) * 60 - now + random.uniform(0, 1)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # APIConnectionError / APITimeoutError carry no status
+    return type(error).__name__ in {"APIConnectionError", "APITimeoutError"}
+
+
+async def chat_completion(api_key: str, owner_id: Optional[int], **params: Any) -> Any:
+    """``chat.completions.create`` behind admission control, with jittered retries on 429/5xx.
+
+    Raises ``LlmBusy`` when the key's queue is full or the wait for a slot, or for room in the
+    shared per-minute window, exceeds ``LLM_QUEUE_TIMEOUT``.
+    """
+    settings = get_settings()
+    owner = owner_id or 0
+    gate = key_gate(api_key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.llm_queue_timeout
+    await gate.acquire(owner, settings.llm_queue_timeout)
+    held = True
+    QUEUE_DEPTH.set(gate.queued, queue="llm")
+    LLM_ADMISSION.inc(outcome="admitted")
+    try:
+        with openai_client(api_key) as client:
+            for attempt in range(settings.llm_max_retries + 1):
+                await gate.bucket.take()
+                while True:
+                    wait = await _shared_wait(api_key, gate.bucket.rate * 60)
+                    if not wait:
+                        break
+                    # The key's shared window is full: wait for the next one without holding a
+                    # slot, and only if it opens within what is left of LLM_QUEUE_TIMEOUT
+                    gate.release(owner)
+                    held = False
+                    if loop.time() + wait > deadline:
+                        LLM_ADMISSION.inc(outcome="timeout")
+                        raise LlmBusy("rate limit window full")
+                    await asyncio.sleep(wait)
+                    await gate.acquire(owner, max(0.0, deadline - loop.time()))
+                    held = True
+                try:
+                    raw = await client.chat.completions.with_raw_response.create(**params)
+                except Exception as e:
+                    if attempt >= settings.llm_max_retries or not _retryable(e):
+                        raise
+                    # Full jitter: sleep U(0, base * 2^attempt), at least what the server asked for
+                    delay = max(random.uniform(0, 0.5 * 2 ** attempt), _retry_after(e) or 0.0)
+                    if getattr(e, "status_code", None) == 429:
+                        gate.bucket.pause(delay)
+                    LLM_RETRIES.inc(reason=str(getattr(e, "status_code", None) or type(e).__name__))
+                    logger.warning("OpenAI call failed (%s), retry %s in %.2fs", e, attempt + 1, delay)
+                    await asyncio.sleep(delay)
+                    deadline = loop.time() + settings.llm_queue_timeout
+                    continue
+                gate.learn(raw.headers)
+                return raw.parse()
+    finally:
+        if held:
+            gate.release(owner)
+        QUEUE_DEPTH.set(gate.queued, queue="llm")
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import importlib.util
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, ContextManager, Dict, Iterator, NamedTuple, Optional, Set, Tuple
+
+from sqlmodel import Session, select
+
+from ..db import global_session
+from ..models import AiSettings
+from .config import get_settings
+from .coordination import get_coordinator, subscribe
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# openai is imported on the first client, not at startup: it is the slowest import in the app
+_openai_installed: Optional[bool] = None
+
+
+def openai_available() -> bool:
+    global _openai_installed
+    if _openai_installed is None:
+        _openai_installed = importlib.util.find_spec("openai") is not None
+    return _openai_installed
+
+
+class ResolvedAi(NamedTuple):
+    owner_id: int  # row the values came from (0 = global)
+    api_key: Optional[str]
+    model: str
+
+
+def _has_key(s: Optional[AiSettings]) -> bool:
+    return bool(s and s.openai_api_key and len(s.openai_api_key) > 0)
+
+
+def _resolve(session: Session, owner_id: Optional[int]) -> ResolvedAi:
+    owner_settings = None
+    if owner_id is not None:
+        owner_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == owner_id)).first()
+    with global_session(session) as home:
+        global_settings = home.exec(select(AiSettings).where(AiSettings.owner_id == 0)).first()
+    # Prefer owner settings if it has a non-empty key; otherwise fallback to global with key
+    chosen = owner_settings if _has_key(owner_settings) else (global_settings if _has_key(global_settings) else (owner_settings or global_settings))
+    if not chosen:
+        chosen = AiSettings(owner_id=owner_id or 0)
+        session.add(chosen)
+        session.commit()
+        session.refresh(chosen)
+    return ResolvedAi(chosen.owner_id, chosen.openai_api_key, chosen.openai_model)
+
+
+class _SettingsCache:
+    """owner_id -> ResolvedAi; entries expire after ``ttl`` so other processes' writes show up."""
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, ResolvedAi]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner_id: int) -> Optional[ResolvedAi]:
+        with self._lock:
+            hit = self._entries.get(owner_id)
+            if hit is None or time.monotonic() - hit[0] > self.ttl:
+                return None
+            self._entries.move_to_end(owner_id)
+            return hit[1]
+
+    def put(self, owner_id: int, value: ResolvedAi) -> None:
+        with self._lock:
+            self._entries[owner_id] = (time.monotonic(), value)
+            self._entries.move_to_end(owner_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, owner_id: Optional[int]) -> None:
+        with self._lock:
+            if not owner_id:
+                # The global row is every owner's fallback
+                self._entries.clear()
+            else:
+                self._entries.pop(owner_id, None)
+
+
+_settings_cache: Optional[_SettingsCache] = None
+
+
+def _cache() -> _SettingsCache:
+    global _settings_cache
+    if _settings_cache is None:
+        settings = get_settings()
+        _settings_cache = _SettingsCache(settings.ai_settings_cache_size, settings.ai_settings_cache_ttl)
+    return _settings_cache
+
+
+def resolve_ai_settings(session: Session, owner_id: Optional[int]) -> ResolvedAi:
+    """Effective OpenAI key/model for ``owner_id``: own key, else the global one. Cached."""
+    key = owner_id or 0
+    resolved = _cache().get(key)
+    if resolved is None:
+        resolved = _resolve(session, owner_id)
+        _cache().put(key, resolved)
+    return resolved
+
+
+@subscribe("ai_settings")
+def _on_invalidate(message: str) -> None:
+    _cache().invalidate(int(message))
+
+
+def invalidate_ai_settings(owner_id: Optional[int]) -> None:
+    """Drop ``owner_id``'s entry (all entries for the global row) in every worker."""
+    get_coordinator().broadcast("ai_settings", str(owner_id or 0))
+
+
+class _ClientPool:
+    """Long-lived AsyncOpenAI clients keyed by API key, so turns reuse keep-alive connections.
+
+    Clients are leased; one evicted while a lease holds it is closed when the last lease ends.
+    """
+
+    def __init__(self, max_clients: int) -> None:
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[str, AsyncOpenAI]" = OrderedDict()
+        self._leases: "Dict[AsyncOpenAI, int]" = {}
+        self._retired: "Set[AsyncOpenAI]" = set()
+
+    def _get(self, api_key: str) -> "AsyncOpenAI":
+        # Keyed by a digest so the pool never holds keys in plain text as dict keys
+        digest = hashlib.sha256(api_key.encode()).hexdigest()
+        client = self._clients.get(digest)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            # Retries are done by core.admission, which knows about other callers on the key
+            client = self._clients[digest] = AsyncOpenAI(api_key=api_key, max_retries=0)
+            while len(self._clients) > self.max_clients:
+                _, evicted = self._clients.popitem(last=False)
+                if evicted in self._leases:
+                    self._retired.add(evicted)
+                else:
+                    _close_later(evicted)
+        self._clients.move_to_end(digest)
+        return client
+
+    @contextmanager
+    def lease(self, api_key: str) -> Iterator["AsyncOpenAI"]:
+        client = self._get(api_key)
+        self._leases[client] = self._leases.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            left = self._leases.pop(client) - 1
+            if left:
+                self._leases[client] = left
+            elif client in self._retired:
+                self._retired.discard(client)
+                _close_later(client)
+
+    async def aclose(self) -> None:
+        clients = [*self._clients.values(), *self._retired]
+        self._clients, self._retired = OrderedDict(), set()
+        for client in clients:
+            await client.close()
+
+
+def _close_later(client: "AsyncOpenAI") -> None:
+    try:
+        asyncio.get_running_loop().create_task(client.close())
+    except RuntimeError:
+        pass
+
+
+# One pool per event loop: httpx connections can't cross loops
+_pools: Dict[int, _ClientPool] = {}
+
+
+def openai_client(api_key: str) -> ContextManager["AsyncOpenAI"]:
+    """Lease the pooled client for ``api_key`` for the duration of a ``with`` block."""
+    if not openai_available():
+        raise RuntimeError("openai package is not installed")
+    loop_id = id(asyncio.get_running_loop())
+    pool = _pools.get(loop_id)
+    if pool is None:
+        pool = _pools[loop_id] = _ClientPool(get_settings().openai_client_pool_size)
+    return pool.lease(api_key)
+
+
+async def close_openai_clients() -> None:
+    pool = _pools.pop(id(asyncio.get_running_loop()), None)
+    if pool is not None:
+        await pool.aclose()
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from .config import get_settings
+from .coordination import get_coordinator, subscribe
+
+
+class CalendarFeed(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: float
+    built_at: float
+
+
+class CalendarCache:
+    """Rendered ``.ics`` feeds per owner, LRU-bounded, dropped on writes or after ``ttl`` seconds.
+
+    Invalidations are broadcast to the other workers (and from the bot) through the
+    coordination backend; the TTL bounds staleness if a broadcast is missed.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._feeds: "OrderedDict[int, CalendarFeed]" = OrderedDict()
+        # Owners whose feed some worker started building, and when; writes of other owners
+        # have nothing to invalidate
+        self._built: Dict[int, float] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, owner_id: int) -> Optional[CalendarFeed]:
+        with self._lock:
+            feed = self._feeds.get(owner_id)
+            if feed is None:
+                return None
+            if time.time() - feed.built_at > self.ttl:
+                return None
+            self._feeds.move_to_end(owner_id)
+            return feed
+
+    def expired(self, owner_id: int) -> Optional[CalendarFeed]:
+        """The entry ``get`` declined because of its age, if any."""
+        with self._lock:
+            return self._feeds.get(owner_id)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, owner_id: int, body: bytes, generation: int, previous: Optional[CalendarFeed] = None) -> CalendarFeed:
+        """Store a freshly rendered body unless a write invalidated the cache while it was rendering."""
+        now = time.time()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        # Same content as before (e.g. a TTL refresh): keep validators so clients still get 304s
+        last_modified = previous.last_modified if previous is not None and previous.etag == etag else now
+        feed = CalendarFeed(body, etag, last_modified, now)
+        with self._lock:
+            if generation == self._generation:
+                self._feeds[owner_id] = feed
+                self._feeds.move_to_end(owner_id)
+                while len(self._feeds) > self.max_entries:
+                    self._feeds.popitem(last=False)
+        return feed
+
+    def building(self, owner_id: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._built[owner_id] = now
+            if len(self._built) > self.max_entries:
+                self._built = {o: at for o, at in self._built.items() if now - at <= self.ttl}
+
+    def cached(self, owner_id: Optional[int]) -> bool:
+        """Whether a worker may hold a feed of ``owner_id`` (``None``: of anyone)."""
+        now = time.time()
+        with self._lock:
+            if owner_id is None:
+                return any(now - at <= self.ttl for at in self._built.values())
+            at = self._built.get(owner_id)
+            return at is not None and now - at <= self.ttl
+
+    def invalidate(self, owner_ids: Iterable[Optional[int]]) -> None:
+        """Drop feeds of ``owner_ids``; ``None`` (global rows, in every feed) clears everything."""
+        with self._lock:
+            self._generation += 1
+            for owner_id in owner_ids:
+                if owner_id is None:
+                    self._feeds.clear()
+                    return
+                self._feeds.pop(owner_id, None)
+
+    def clear(self) -> None:
+        self.invalidate([None])
+
+
+_cache: Optional[CalendarCache] = None
+_cache_lock = threading.Lock()
+
+
+def calendar_cache() -> CalendarCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = get_settings()
+                _cache = CalendarCache(settings.calendar_cache_size, settings.calendar_cache_ttl)
+    return _cache
+
+
+@subscribe("calendar")
+def _on_invalidate(message: str) -> None:
+    calendar_cache().invalidate(json.loads(message))
+
+
+@subscribe("calendar_building")
+def _on_building(message: str) -> None:
+    calendar_cache().building(int(message))
+
+
+def invalidate_calendar(*owner_ids: Optional[int]) -> None:
+    """Drop the feeds in this and every other worker."""
+    get_coordinator().broadcast("calendar", json.dumps(list(owner_ids)))
+
+
+def announce_feed(owner_id: int) -> None:
+    """Tell every worker that ``owner_id``'s feed is being cached, before reading its rows,
+    so their commits touching that owner invalidate it from then on."""
+    get_coordinator().broadcast("calendar_building", str(owner_id))
+
+
+_PENDING = "calendar_owners"
+
+
+def _collect_owners(session: Session, flush_context, instances=None) -> None:
+    from ..models import Project, Task
+
+    owners: Set[Optional[int]] = session.info.setdefault(_PENDING, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Task, Project)):
+            owners.add(obj.owner_id)
+
+
+def _apply(session: Session) -> None:
+    owners = session.info.pop(_PENDING, None)
+    cache = calendar_cache()
+    owners = [owner for owner in owners or () if cache.cached(owner)]
+    if owners:
+        invalidate_calendar(*owners)
+
+
+def _discard(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING, None)
+
+
+_installed = False
+
+
+def install_calendar_invalidation(sessions: sessionmaker) -> None:
+    """Invalidate feeds when a session from ``sessions`` commits Task/Project changes: one
+    broadcast per commit, for the owners with a cached feed (idempotent).
+
+    Bulk Core statements bypass the unit of work and call ``invalidate_calendar`` themselves.
+    """
+    global _installed
+    if _installed:
+        return
+    event.listen(sessions, "before_flush", _collect_owners)
+    event.listen(sessions, "after_commit", _apply)
+    event.listen(sessions, "after_soft_rollback", _discard)
+    _installed = True
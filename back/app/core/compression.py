@@ -0,0 +1,153 @@
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import HTTP_BYTES_RAW, HTTP_BYTES_SENT, route_path
+
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover - optional at runtime
+    brotli = None  # type: ignore
+
+
+# Already-compressed payloads gain nothing from a second pass
+INCOMPRESSIBLE_TYPES = ("application/gzip", "application/zstd", "application/zip", "image/", "video/", "audio/")
+
+# route path -> [responses, bytes before compression, bytes sent]
+_route_bytes: Dict[str, List[int]] = {}
+
+
+def record_bytes(route: str, raw: int, sent: int) -> None:
+    entry = _route_bytes.setdefault(route, [0, 0, 0])
+    entry[0] += 1
+    entry[1] += raw
+    entry[2] += sent
+    HTTP_BYTES_RAW.inc(raw, route=route)
+    HTTP_BYTES_SENT.inc(sent, route=route)
+
+
+def compression_stats() -> Dict[str, Dict[str, int]]:
+    return {
+        route: {"responses": n, "bytes_raw": raw, "bytes_sent": sent, "bytes_saved": raw - sent}
+        for route, (n, raw, sent) in sorted(_route_bytes.items())
+    }
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    offered: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._br is not None:
+            return self._br.process(data)
+        return self._gz.compress(data)
+
+    def flush(self) -> bytes:
+        if self._br is not None:
+            return self._br.finish()
+        return self._gz.flush()
+
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli response compression with a minimum-size threshold.
+
+    Responses that already carry a Content-Encoding or a compressed media type
+    are passed through untouched.
+    Raw and sent body sizes are tallied per route for ``compression_stats``.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = _choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        raw = 0
+        sent = 0
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal start, compressor, passthrough, raw, sent
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            raw += len(body)
+
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                small = not more_body and len(body) < self.minimum_size
+                compressed = headers.get("content-type", "").startswith(INCOMPRESSIBLE_TYPES)
+                if encoding is None or small or compressed or "content-encoding" in headers:
+                    passthrough = True
+                else:
+                    compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if more_body:
+                        del headers["Content-Length"]
+                    else:
+                        body = compressor.compress(body) + compressor.flush()
+                        headers["Content-Length"] = str(len(body))
+                await send(start)
+                start = None
+                if not more_body:
+                    sent += len(body)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+            if passthrough:
+                sent += len(body)
+                await send(message)
+                return
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            sent += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            record_bytes(route_path(scope), raw, sent)
+
@@ -9,8 +9,77 @@ class Settings(BaseModel):
     jwt_secret: str = os.getenv("JWT_SECRET", "change-me-in-prod")
     jwt_algorithm: str = "HS256"
     telegram_bot_token: str | None = os.getenv("TELEGRAM_BOT_TOKEN")
+    telegram_api_base: str = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
     public_url: str | None = os.getenv("PUBLIC_URL")
     allow_anon: bool = os.getenv("ALLOW_ANON", "1").lower() in {"1", "true", "yes"}
+    # Serve list routes as raw rows encoded with orjson, skipping pydantic re-validation
+    fast_responses: bool = os.getenv("FAST_RESPONSES", "0").lower() in {"1", "true", "yes"}
+    # Responses smaller than this many bytes are sent uncompressed
+    compression_min_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+    # Enables /debug endpoints and on-demand request profiling when set
+    admin_token: str | None = os.getenv("ADMIN_TOKEN")
+    profile_sample_rates: str = os.getenv("PROFILE_SAMPLE_RATES", "")
+    profile_buffer_size: int = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+    # off|warn|raise: check each request against its route's @query_budget
+    query_budget_mode: str = os.getenv("QUERY_BUDGET_MODE", "off").lower()
+    # Rows per transaction for POST /import
+    import_batch_size: int = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+    # Rendered /calendar feeds kept in memory: max owners and seconds before a rebuild
+    calendar_cache_size: int = int(os.getenv("CALENDAR_CACHE_SIZE", "1000"))
+    calendar_cache_ttl: int = int(os.getenv("CALENDAR_CACHE_TTL", "300"))
+    # Resolved per-owner OpenAI key/model cache (PUT /settings/ai invalidates it in every worker)
+    ai_settings_cache_size: int = int(os.getenv("AI_SETTINGS_CACHE_SIZE", "10000"))
+    ai_settings_cache_ttl: int = int(os.getenv("AI_SETTINGS_CACHE_TTL", "60"))
+    # Distinct API keys with a live AsyncOpenAI client (one connection pool each)
+    openai_client_pool_size: int = int(os.getenv("OPENAI_CLIENT_POOL_SIZE", "32"))
+    # LLM admission control, per API key: concurrent calls (and per owner), requests/minute
+    # (replaced by the key's x-ratelimit-limit-requests once seen), queue bounds and retries
+    llm_key_concurrency: int = int(os.getenv("LLM_KEY_CONCURRENCY", "8"))
+    llm_owner_concurrency: int = int(os.getenv("LLM_OWNER_CONCURRENCY", "1"))
+    llm_key_rpm: float = float(os.getenv("LLM_KEY_RPM", "60"))
+    llm_queue_size: int = int(os.getenv("LLM_QUEUE_SIZE", "100"))
+    llm_owner_queue: int = int(os.getenv("LLM_OWNER_QUEUE", "3"))
+    llm_queue_timeout: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    # Where the reminder scheduler runs: bot|app|off (app: one worker at a time holds the lease)
+    reminders: str = os.getenv("REMINDERS", "bot").lower()
+    reminder_event_lead_minutes: int = int(os.getenv("REMINDER_EVENT_LEAD_MINUTES", "15"))
+    reminder_deadline_hour: int = int(os.getenv("REMINDER_DEADLINE_HOUR", "9"))
+    reminder_utc_offset_minutes: int = int(os.getenv("REMINDER_UTC_OFFSET_MINUTES", "0"))
+    # Window of fire times held in memory, how often it slides, and how often it is fully re-read
+    reminder_lookahead_seconds: int = int(os.getenv("REMINDER_LOOKAHEAD_SECONDS", "900"))
+    reminder_scan_seconds: int = int(os.getenv("REMINDER_SCAN_SECONDS", "60"))
+    reminder_resync_seconds: int = int(os.getenv("REMINDER_RESYNC_SECONDS", "300"))
+    # Telegram allows ~30 messages/s per bot
+    reminder_send_rate: float = float(os.getenv("REMINDER_SEND_RATE", "25"))
+    # auto: create/upgrade the schema on startup (once per deployment, under a lock);
+    # off: the deploy step runs `python -m app.db` before starting workers
+    init_db: str = os.getenv("INIT_DB", "auto").lower()
+    # hash: owner_id -> shard by a stable hash; directory: looked up in shardassignment (movable)
+    shard_routing: str = os.getenv("SHARD_ROUTING", "hash").lower()
+    shard_directory_ttl: float = float(os.getenv("SHARD_DIRECTORY_TTL", "60"))
+    # Server processes started by `python -m app.serve`
+    workers: int = int(os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or "1")
+    # memory:// | sqlite:///path | redis://host:port/db; empty: coordination.db next to a
+    # SQLite DATABASE_URL file, else memory (one worker only)
+    coordination_url: str = os.getenv("COORDINATION_URL", "")
+    coordination_poll_interval: float = float(os.getenv("COORDINATION_POLL_INTERVAL", "0.5"))
+    # Seconds a Telegram update_id is remembered (retries of a handled update are dropped)
+    webhook_dedup_ttl: int = int(os.getenv("WEBHOOK_DEDUP_TTL", "3600"))
+    # Upper bound on one chat's handling; updates of the same chat wait for each other, for at
+    # most chat_lock_wait seconds before the sender is told to retry
+    chat_lock_ttl: float = float(os.getenv("CHAT_LOCK_TTL", "120"))
+    chat_lock_wait: float = float(os.getenv("CHAT_LOCK_WAIT", "5"))
+    # Online SQLite snapshots: where (default backups/ next to the database), every how many
+    # seconds from the API (0: only `python -m app.backup snapshot`), how many to keep per database
+    backup_dir: str = os.getenv("BACKUP_DIR", "")
+    backup_interval: int = int(os.getenv("BACKUP_INTERVAL", "0"))
+    backup_keep: int = int(os.getenv("BACKUP_KEEP", "7"))
+    # auto (zstd if zstandard is installed, else gzip) | zstd | gzip | none
+    backup_compression: str = os.getenv("BACKUP_COMPRESSION", "auto").lower()
+    # Pages copied per step and the pause between steps, during which writers get the database
+    backup_step_pages: int = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+    backup_step_pause: float = float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
 
 
 @lru_cache
@@ -0,0 +1,474 @@
+"""State shared between worker processes: invalidation broadcasts, locks, counters, dedup.
+
+The backend is picked by ``COORDINATION_URL``:
+
+* ``memory://``: in this process only; the default with a single worker and a
+  database that isn't a SQLite file.
+* ``sqlite:///path``: a small SQLite file, for several workers, the bot and CLI tools
+  on one host with no extra service. This is the default when the main database is
+  a SQLite file, stored next to it.
+* ``redis://host:port/db``: networked, for workers on several hosts (needs ``redis``).
+
+Every process broadcasts through ``get_coordinator().broadcast``; handlers registered
+with ``@subscribe`` run in the sending process at once, and in other processes once
+their listener (started by the app lifespan) picks the message up.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import get_settings
+
+
+logger = logging.getLogger("coordination")
+
+Handler = Callable[[str], None]
+_handlers: Dict[str, List[Handler]] = {}
+
+
+def subscribe(channel: str) -> Callable[[Handler], Handler]:
+    """Register ``handler(message)`` to run in every process on ``broadcast(channel, message)``."""
+    def register(handler: Handler) -> Handler:
+        _handlers.setdefault(channel, []).append(handler)
+        return handler
+    return register
+
+
+def _dispatch(channel: str, message: str) -> None:
+    for handler in _handlers.get(channel, ()):
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Handler for %s failed", channel)
+
+
+class LockTimeout(Exception):
+    """The lock stayed taken for longer than the caller was willing to wait."""
+
+
+class Coordinator:
+    shared = True  # False when other processes can't see this state
+
+    def __init__(self) -> None:
+        self.origin = uuid.uuid4().hex
+
+    async def start(self) -> None:
+        """Start delivering other processes' broadcasts to local handlers."""
+
+    async def close(self) -> None:
+        pass
+
+    def broadcast(self, channel: str, message: str = "") -> None:
+        """Run ``channel``'s handlers here now and in every other process soon. Callable from any thread."""
+        _dispatch(channel, message)
+        if self.shared:
+            try:
+                self._send(channel, message)
+            except Exception:
+                # Other workers fall back to their caches' TTLs
+                logger.exception("Broadcast on %s failed", channel)
+
+    def _send(self, channel: str, message: str) -> None:
+        raise NotImplementedError
+
+    async def try_acquire(self, name: str, token: str, ttl: float) -> bool:
+        """Take lock ``name`` for ``ttl`` seconds; re-taking with the same token extends it."""
+        raise NotImplementedError
+
+    async def release(self, name: str, token: str) -> None:
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30.0, timeout: float = 10.0) -> AsyncIterator[None]:
+        """Hold ``name`` across processes. ``ttl`` bounds how long a crashed holder blocks others."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while not await self.try_acquire(name, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        try:
+            yield
+        finally:
+            await self.release(name, token)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to a shared counter and return the new value; ``ttl`` starts with the first increment."""
+        raise NotImplementedError
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        """True for the first caller to claim ``key`` within ``ttl`` seconds, False after that."""
+        raise NotImplementedError
+
+    async def unclaim(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCoordinator(Coordinator):
+    shared = False
+
+    PRUNE_INTERVAL = 60.0  # seconds between sweeps of expired locks, counters and claims
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._locks: Dict[str, Tuple[str, float]] = {}
+        self._counters: Dict[str, Tuple[int, float]] = {}
+        self._claims: Dict[str, float] = {}
+        self._next_prune = 0.0
+
+    def _prune(self, now: float) -> None:
+        # Called on writes with self._lock held; one key per webhook update would otherwise pile up
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.PRUNE_INTERVAL
+        for entries in (self._locks, self._counters):
+            for key in [key for key, (_, expires) in entries.items() if expires <= now]:
+                del entries[key]
+        for key in [key for key, expires in self._claims.items() if expires <= now]:
+            del self._claims[key]
+
+    def _send(self, channel: str, message: str) -> None:
+        pass
+
+    async def try_acquire(self, name: str, token: str, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            holder = self._locks.get(name)
+            if holder is not None and holder[0] != token and holder[1] > now:
+                return False
+            self._locks[name] = (token, now + ttl)
+            return True
+
+    async def release(self, name: str, token: str) -> None:
+        with self._lock:
+            if self._locks.get(name, ("",))[0] == token:
+                del self._locks[name]
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            value, expires = self._counters.get(key, (0, math.inf))
+            if expires <= now:
+                value, expires = 0, math.inf
+            if value == 0 and ttl is not None:
+                expires = now + ttl
+            self._counters[key] = (value + amount, expires)
+            return value + amount
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if self._claims.get(key, 0.0) > now:
+                return False
+            self._claims[key] = now + ttl
+            return True
+
+    async def unclaim(self, key: str) -> None:
+        with self._lock:
+            self._claims.pop(key, None)
+
+
+class SqliteCoordinator(Coordinator):
+    """Coordination through one SQLite file (WAL) that every process on the host opens.
+
+    Broadcasts are rows in ``coord_event`` that listeners poll every ``poll_interval``
+    seconds; locks, counters and claims are rows with an expiry, changed by single
+    upserts so concurrent processes never both win.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS coord_event (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL,"
+        " message TEXT NOT NULL, origin TEXT NOT NULL, created_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS coord_lock (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS coord_counter (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL)",
+        "CREATE TABLE IF NOT EXISTS coord_claim (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)",
+    )
+    EVENT_RETENTION = 300.0  # seconds; a listener that falls further behind only loses cache invalidations
+
+    def __init__(self, path: str, poll_interval: float = 0.5) -> None:
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._listener: Optional["asyncio.Task[None]"] = None
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._db_lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                for statement in self.SCHEMA:
+                    self._conn.execute(statement)
+            return self._conn.execute(sql, params)
+
+    def _send(self, channel: str, message: str) -> None:
+        self._execute(
+            "INSERT INTO coord_event (channel, message, origin, created_at) VALUES (?, ?, ?, ?)",
+            (channel, message, self.origin, time.time()),
+        )
+
+    async def start(self) -> None:
+        if self._listener is None:
+            last_id = await asyncio.to_thread(lambda: self._execute("SELECT coalesce(max(id), 0) FROM coord_event").fetchone()[0])
+            self._listener = asyncio.create_task(self._listen(last_id))
+
+    def _poll(self, last_id: int) -> List[Tuple[int, str, str, str]]:
+        return self._execute(
+            "SELECT id, channel, message, origin FROM coord_event WHERE id > ? ORDER BY id", (last_id,),
+        ).fetchall()
+
+    def _prune(self) -> None:
+        now = time.time()
+        self._execute("DELETE FROM coord_event WHERE created_at < ?", (now - self.EVENT_RETENTION,))
+        self._execute("DELETE FROM coord_lock WHERE expires_at < ?", (now,))
+        self._execute("DELETE FROM coord_counter WHERE expires_at < ?", (now,))
+        self._execute("DELETE FROM coord_claim WHERE expires_at < ?", (now,))
+
+    async def _listen(self, last_id: int) -> None:
+        pruned = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for event_id, channel, message, origin in await asyncio.to_thread(self._poll, last_id):
+                    last_id = event_id
+                    if origin != self.origin:
+                        _dispatch(channel, message)
+                if time.monotonic() - pruned > self.EVENT_RETENTION:
+                    await asyncio.to_thread(self._prune)
+                    pruned = time.monotonic()
+            except sqlite3.Error:
+                logger.exception("Polling %s failed", self.path)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def try_acquire(self, name: str, token: str, ttl: float) -> bool:
+        def run() -> bool:
+            now = time.time()
+            cursor = self._execute(
+                "INSERT INTO coord_lock (name, token, expires_at) VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE"
+                " SET token = excluded.token, expires_at = excluded.expires_at"
+                " WHERE coord_lock.expires_at < ? OR coord_lock.token = excluded.token",
+                (name, token, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+        return await asyncio.to_thread(run)
+
+    async def release(self, name: str, token: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM coord_lock WHERE name = ? AND token = ?", (name, token))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        def run() -> int:
+            now = time.time()
+            expires = now + ttl if ttl is not None else None
+            return self._execute(
+                "INSERT INTO coord_counter (key, value, expires_at) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET"
+                " value = CASE WHEN coord_counter.expires_at < ? THEN excluded.value ELSE coord_counter.value + excluded.value END,"
+                " expires_at = CASE WHEN coord_counter.expires_at < ? THEN excluded.expires_at ELSE coord_counter.expires_at END"
+                " RETURNING value",
+                (key, amount, expires, now, now),
+            ).fetchone()[0]
+        return await asyncio.to_thread(run)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        def run() -> bool:
+            now = time.time()
+            cursor = self._execute(
+                "INSERT INTO coord_claim (key, expires_at) VALUES (?, ?) ON CONFLICT(key) DO UPDATE"
+                " SET expires_at = excluded.expires_at WHERE coord_claim.expires_at < ?",
+                (key, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+        return await asyncio.to_thread(run)
+
+    async def unclaim(self, key: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM coord_claim WHERE key = ?", (key,))
+
+
+class RedisCoordinator(Coordinator):
+    """Coordination through Redis: pub/sub broadcasts, ``SET NX PX`` locks and claims, ``INCRBY``."""
+
+    def __init__(self, url: Optional[str] = None, client: Any = None, prefix: str = "coord:") -> None:
+        super().__init__()
+        if client is None:
+            import redis.asyncio as redis  # optional dependency, only for this backend
+
+            client = redis.from_url(url, decode_responses=True)
+        self.url = url
+        self.client = client
+        self.prefix = prefix
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional["asyncio.Task[None]"] = None
+        self._pending: Set["asyncio.Future[Any]"] = set()
+
+    def _payload(self, message: str) -> str:
+        return json.dumps({"origin": self.origin, "message": message})
+
+    def _send(self, channel: str, message: str) -> None:
+        topic, payload = f"{self.prefix}event:{channel}", self._payload(message)
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Outside the app (CLI tools): a one-off connection on a private loop
+            asyncio.run(self._publish_once(topic, payload))
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            task = loop.create_task(self.client.publish(topic, payload))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(self.client.publish(topic, payload), loop)
+
+    async def _publish_once(self, topic: str, payload: str) -> None:
+        if self.url is None:
+            await self.client.publish(topic, payload)
+            return
+        import redis.asyncio as redis
+
+        client = redis.from_url(self.url, decode_responses=True)
+        try:
+            await client.publish(topic, payload)
+        finally:
+            await client.aclose()
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._loop = asyncio.get_running_loop()
+            pubsub = self.client.pubsub()
+            await pubsub.psubscribe(f"{self.prefix}event:*")
+            self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub: Any) -> None:
+        skip = len(f"{self.prefix}event:")
+        try:
+            while True:
+                item = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if item is None:
+                    continue
+                try:
+                    body = json.loads(item["data"])
+                except (TypeError, ValueError):
+                    continue
+                if body.get("origin") != self.origin:
+                    _dispatch(item["channel"][skip:], body.get("message", ""))
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self.client.aclose()
+
+    async def _if_holder(self, key: str, token: str, action: Callable[[Any], None]) -> bool:
+        from redis.exceptions import WatchError
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.get(key) != token:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                action(pipe)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def try_acquire(self, name: str, token: str, ttl: float) -> bool:
+        key, ms = f"{self.prefix}lock:{name}", max(1, int(ttl * 1000))
+        if await self.client.set(key, token, nx=True, px=ms):
+            return True
+        return await self._if_holder(key, token, lambda pipe: pipe.pexpire(key, ms))
+
+    async def release(self, name: str, token: str) -> None:
+        key = f"{self.prefix}lock:{name}"
+        await self._if_holder(key, token, lambda pipe: pipe.delete(key))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        full = f"{self.prefix}counter:{key}"
+        value = await self.client.incrby(full, amount)
+        if ttl is not None and value == amount:
+            await self.client.pexpire(full, max(1, int(ttl * 1000)))
+        return int(value)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        return bool(await self.client.set(f"{self.prefix}claim:{key}", self.origin, nx=True, px=max(1, int(ttl * 1000))))
+
+    async def unclaim(self, key: str) -> None:
+        await self.client.delete(f"{self.prefix}claim:{key}")
+
+
+def _default_url() -> str:
+    from ..db import DATABASE_URL
+
+    if DATABASE_URL.startswith("sqlite:///") and not DATABASE_URL.endswith(":memory:"):
+        # The bot and CLI tools open the same database file, so they share this one too
+        directory = os.path.dirname(DATABASE_URL[len("sqlite:///"):]) or "."
+        return f"sqlite:///{os.path.join(directory, 'coordination.db')}"
+    if get_settings().workers > 1:
+        raise RuntimeError("WORKERS > 1 needs COORDINATION_URL (sqlite:///path or redis://...)")
+    return "memory://"
+
+
+def create_coordinator(url: str) -> Coordinator:
+    if url.startswith("memory:"):
+        return MemoryCoordinator()
+    if url.startswith("sqlite:///"):
+        return SqliteCoordinator(url[len("sqlite:///"):], get_settings().coordination_poll_interval)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCoordinator(url)
+    raise ValueError(f"Unsupported COORDINATION_URL: {url}")
+
+
+_coordinator: Optional[Coordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator() -> Coordinator:
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = create_coordinator(get_settings().coordination_url or _default_url())
+    return _coordinator
+
+
+def set_coordinator(coordinator: Optional[Coordinator]) -> None:
+    """Swap the process-wide backend, e.g. for a stand-in in tests."""
+    global _coordinator
+    _coordinator = coordinator
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from typing import Any, Iterable, List, Sequence
+import json
+
+from fastapi import Response
+from sqlalchemy import Select
+from sqlmodel import Session
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional at runtime
+    orjson = None  # type: ignore
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def rows_as_dicts(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[dict]:
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _field_defaults(model: Any) -> dict:
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is None and not field.is_required():
+            defaults[name] = field.default
+    return defaults
+
+
+def compact_rows(rows: List[dict], model: Any) -> List[dict]:
+    # Drop nulls and fields equal to their model default; clients fill them back in.
+    defaults = _field_defaults(model)
+    missing = object()
+    return [
+        {k: v for k, v in row.items() if v is not None and defaults.get(k, missing) != v}
+        for row in rows
+    ]
+
+
+def table_rows(session: Session, statement: Select, model: Any) -> List[dict]:
+    # Re-target an entity select at the bare table columns: rows come back as
+    # plain tuples, skipping ORM identity-map work and pydantic re-validation.
+    columns = list(model.__table__.columns)
+    stmt = statement.with_only_columns(*columns)
+    keys = [c.name for c in columns]
+    return rows_as_dicts(keys, session.execute(stmt))
+
+
+def rows_json(rows: List[dict], model: Any, compact: bool = False) -> Response:
+    # Returning a Response bypasses FastAPI's response_model validation, so the
+    # route keeps its declared schema for OpenAPI while the body is encoded here.
+    if compact:
+        rows = compact_rows(rows, model)
+    return Response(content=dumps(rows), media_type="application/json")
@@ -0,0 +1,229 @@
+import asyncio
+import cProfile
+import functools
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .security import admin_token_matches
+
+
+class ProfileCapture:
+    def __init__(self, profile_id: int, route: str) -> None:
+        self.id = profile_id
+        self.route = route
+        self.profiler = cProfile.Profile()
+        self.sql: List[Tuple[str, float]] = []
+        self.handler_seconds = 0.0
+
+
+class ProfileRecord:
+    def __init__(self, method: str, path: str, capture: ProfileCapture, status: int, seconds: float) -> None:
+        self.id = capture.id
+        self.method = method
+        self.path = path
+        self.route = capture.route
+        self.status = status
+        self.seconds = seconds
+        self.handler_seconds = capture.handler_seconds
+        self.sql = capture.sql
+        self.created_at = datetime.utcnow()
+        capture.profiler.create_stats()
+        self.pstats = marshal.dumps(capture.profiler.stats)
+        out = io.StringIO()
+        pstats.Stats(capture.profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        self.text = out.getvalue()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "seconds": self.seconds,
+            "handler_seconds": self.handler_seconds,
+            "sql_count": len(self.sql),
+            "sql_seconds": sum(d for _, d in self.sql),
+            "created_at": self.created_at.isoformat(),
+        }
+
+    def detail(self) -> Dict[str, Any]:
+        data = self.summary()
+        data["sql"] = [{"statement": s, "seconds": d} for s, d in self.sql]
+        data["profile"] = self.text
+        return data
+
+
+class _RequestState:
+    __slots__ = ("forced", "capture")
+
+    def __init__(self, forced: bool) -> None:
+        self.forced = forced
+        self.capture: Optional[ProfileCapture] = None
+
+
+_state: ContextVar[Optional[_RequestState]] = ContextVar("profile_state", default=None)
+# cProfile hooks one profiler per thread and the event loop thread is shared, so
+# only one request is profiled at a time; others simply run unprofiled.
+_capture_lock = threading.Lock()
+_ids = itertools.count(1)
+_records: Deque[ProfileRecord] = deque(maxlen=20)
+_sample_rates: Dict[str, float] = {}
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    return [r.summary() for r in reversed(_records)]
+
+
+def get_profile(profile_id: int) -> Optional[ProfileRecord]:
+    for record in _records:
+        if record.id == profile_id:
+            return record
+    return None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    # "/tasks/=0.01,/events/=0.1" -> {"/tasks/": 0.01, "/events/": 0.1}
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        route, sep, rate = part.strip().rpartition("=")
+        if sep and route:
+            rates[route] = float(rate)
+    return rates
+
+
+def _start_capture(route: str) -> Optional[ProfileCapture]:
+    state = _state.get()
+    if state is None or state.capture is not None:
+        return None
+    if not state.forced and random.random() >= _sample_rates.get(route, 0.0):
+        return None
+    if not _capture_lock.acquire(blocking=False):
+        return None
+    state.capture = ProfileCapture(next(_ids), route)
+    return state.capture
+
+
+def _profiled(call: Callable, route: str) -> Callable:
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            capture = _start_capture(route)
+            if capture is None:
+                return await call(*args, **kwargs)
+            started = time.perf_counter()
+            capture.profiler.enable()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                capture.profiler.disable()
+                capture.handler_seconds = time.perf_counter() - started
+        async_wrapper._profiled = True  # type: ignore[attr-defined]
+        return async_wrapper
+
+    # Sync routes run in a threadpool worker; profiling here covers that thread.
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        capture = _start_capture(route)
+        if capture is None:
+            return call(*args, **kwargs)
+        started = time.perf_counter()
+        capture.profiler.enable()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            capture.profiler.disable()
+            capture.handler_seconds = time.perf_counter() - started
+    wrapper._profiled = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    state = _state.get()
+    if state is not None and state.capture is not None:
+        conn.info["profile_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    state = _state.get()
+    started = conn.info.pop("profile_query_start", None)
+    if state is not None and state.capture is not None and started is not None:
+        state.capture.sql.append((statement, time.perf_counter() - started))
+
+
+class ProfilingMiddleware:
+    """Marks requests for profiling and files finished captures in the ring buffer.
+
+    A request is profiled when it carries ``X-Profile: 1`` with a valid
+    ``X-Admin-Token``, or when its route is sampled via ``PROFILE_SAMPLE_RATES``.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        forced = headers.get("x-profile") == "1" and admin_token_matches(headers.get("x-admin-token"))
+        state = _RequestState(forced)
+        token = _state.set(state)
+        status = 500
+        started = time.perf_counter()
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if state.capture is not None and forced:
+                    MutableHeaders(raw=message["headers"])["X-Profile-Id"] = str(state.capture.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            _state.reset(token)
+            capture = state.capture
+            if capture is not None:
+                try:
+                    _records.append(ProfileRecord(
+                        scope.get("method", ""), scope.get("path", ""),
+                        capture, status, time.perf_counter() - started,
+                    ))
+                finally:
+                    _capture_lock.release()
+
+
+def install_profiling(app: FastAPI, engines: Sequence[Engine], sample_rates: Dict[str, float], buffer_size: int) -> None:
+    """Wrap route handlers and SQL hooks; call after all routers are included."""
+    global _records
+    _records = deque(_records, maxlen=buffer_size)
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates)
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not route.path.startswith("/debug"):
+            if not getattr(route.dependant.call, "_profiled", False):
+                route.dependant.call = _profiled(route.dependant.call, route.path)
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(ProfilingMiddleware)
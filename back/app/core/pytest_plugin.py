@@ -0,0 +1,31 @@
+"""pytest fixtures for SQL query budgets.
+
+Enable with ``pytest -p app.core.pytest_plugin`` or ``pytest_plugins = ["app.core.pytest_plugin"]``.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from .config import get_settings
+from .querybudget import QueryBudget
+
+
+@pytest.fixture
+def query_budget():
+    """Factory: ``with query_budget(2): client.get("/tasks/")`` fails on the 3rd statement."""
+    return QueryBudget
+
+
+@pytest.fixture
+def budgeted_client():
+    """TestClient whose routes answer 500 with a shape report when over their ``@query_budget``."""
+    from ..main import create_app
+
+    settings = get_settings()
+    previous = settings.query_budget_mode
+    settings.query_budget_mode = "raise"
+    try:
+        app = create_app()
+    finally:
+        settings.query_budget_mode = previous
+    with TestClient(app) as client:
+        yield client
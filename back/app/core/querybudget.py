@@ -0,0 +1,215 @@
+import json
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+logger = logging.getLogger("query-budget")
+
+_BUDGET_ATTR = "__query_budget__"
+
+
+def query_budget(limit: Optional[int]) -> Callable:
+    """Declare the maximum number of SQL statements a route may issue.
+
+    ``None`` marks a route whose statement count scales with its input (bulk
+    import/export) as deliberately unbounded.
+    """
+    def decorator(fn: Callable) -> Callable:
+        setattr(fn, _BUDGET_ATTR, limit)
+        return fn
+    return decorator
+
+
+def route_budget(route) -> Optional[int]:
+    return getattr(getattr(route, "endpoint", None), _BUDGET_ATTR, None)
+
+
+def routes_without_budget(app: FastAPI) -> List[str]:
+    return [
+        f"{','.join(sorted(r.methods))} {r.path}"
+        for r in app.routes
+        if isinstance(r, APIRoute) and not hasattr(r.endpoint, _BUDGET_ATTR)
+    ]
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    # Collapse literals and IN-lists so repeated per-row queries group together.
+    shape = _LITERALS.sub("?", statement)
+    shape = _IN_LISTS.sub("(...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    def __init__(self, limit: int, statements: List[str], label: str = "") -> None:
+        self.limit = limit
+        self.statements = statements
+        self.label = label
+        super().__init__(self.report())
+
+    def repeated_shapes(self) -> List[Tuple[str, int]]:
+        counts = Counter(statement_shape(s) for s in self.statements)
+        return [(shape, n) for shape, n in counts.most_common() if n > 1]
+
+    def report(self) -> str:
+        where = f" in {self.label}" if self.label else ""
+        lines = [f"{len(self.statements)} SQL statements{where}, budget is {self.limit}"]
+        repeated = self.repeated_shapes()
+        if repeated:
+            lines.append("Repeated statement shapes:")
+            lines.extend(f"  {n}x {shape}" for shape, n in repeated)
+        else:
+            lines.append("Statements:")
+            lines.extend(f"  {statement_shape(s)}" for s in self.statements)
+        return "\n".join(lines)
+
+
+class _Recorder:
+    __slots__ = ("statements",)
+
+    def __init__(self) -> None:
+        self.statements: List[str] = []
+
+
+# Block-scoped budgets watch every statement on the engine regardless of thread,
+# so they also see work done by TestClient's portal thread. Request-scoped
+# recorders are bound to the request context instead.
+_global_recorders: List[_Recorder] = []
+_global_lock = threading.Lock()
+_request_recorder: ContextVar[Optional[_Recorder]] = ContextVar("query_budget_recorder", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    options = context.execution_options if context is not None else conn.get_execution_options()
+    if options.get("skip_query_budget"):
+        return
+    if _global_recorders:
+        with _global_lock:
+            for recorder in _global_recorders:
+                recorder.statements.append(statement)
+    recorder = _request_recorder.get()
+    if recorder is not None:
+        recorder.statements.append(statement)
+
+
+def install(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class QueryBudget(ContextDecorator):
+    """Fail when the wrapped block issues more than ``limit`` SQL statements.
+
+    Usable as ``with QueryBudget(3): ...`` or as a ``@QueryBudget(3)`` decorator.
+    """
+
+    def __init__(self, limit: int, engine: Optional[Engine] = None, label: str = "") -> None:
+        self.limit = limit
+        self.engine = engine
+        self.label = label
+        self._recorder: Optional[_Recorder] = None
+
+    @property
+    def statements(self) -> List[str]:
+        return list(self._recorder.statements) if self._recorder else []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __enter__(self) -> "QueryBudget":
+        if self.engine is None:
+            # Every shard, so budgets count statements wherever the owner's rows live
+            from ..db import engines
+            for engine in engines:
+                install(engine)
+        else:
+            install(self.engine)
+        self._recorder = _Recorder()
+        with _global_lock:
+            _global_recorders.append(self._recorder)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        with _global_lock:
+            _global_recorders.remove(self._recorder)
+        if exc_type is None and self.count > self.limit:
+            raise QueryBudgetExceeded(self.limit, self.statements, self.label)
+        return False
+
+
+class QueryBudgetMiddleware:
+    """Check each request against its route's ``@query_budget``.
+
+    ``mode="warn"`` logs the report; ``mode="raise"`` replaces the response with
+    a 500 carrying the report, so over-budget routes fail loudly in development.
+    """
+
+    def __init__(self, app: ASGIApp, mode: str = "warn") -> None:
+        self.app = app
+        self.mode = mode
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = _Recorder()
+        token = _request_recorder.set(recorder)
+        suppressed = False
+
+        def over_budget() -> Optional[QueryBudgetExceeded]:
+            limit = route_budget(scope.get("route"))
+            if limit is None or len(recorder.statements) <= limit:
+                return None
+            label = f"{scope.get('method', '')} {getattr(scope.get('route'), 'path', '')}"
+            return QueryBudgetExceeded(limit, list(recorder.statements), label)
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal suppressed
+            if suppressed:
+                return
+            if message["type"] == "http.response.start":
+                exceeded = over_budget()
+                if exceeded is not None:
+                    logger.warning("%s", exceeded.report())
+                    if self.mode == "raise":
+                        suppressed = True
+                        body = json.dumps({"detail": exceeded.report()}).encode()
+                        await send({
+                            "type": "http.response.start",
+                            "status": 500,
+                            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                        })
+                        await send({"type": "http.response.body", "body": body})
+                        return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            _request_recorder.reset(token)
+
+
+def install_query_budgets(app: FastAPI, engines: Sequence[Engine], mode: str) -> None:
+    for engine in engines:
+        install(engine)
+    missing = routes_without_budget(app)
+    if missing:
+        logger.warning("Routes without a query budget: %s", ", ".join(missing))
+    app.add_middleware(QueryBudgetMiddleware, mode=mode)
@@ -2,12 +2,11 @@ import hashlib
 import hmac
 import json
 import time
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from urllib.parse import parse_qsl
 
 import jwt
 from fastapi import HTTPException, status
-from init_data_py import InitData
 
 from .config import get_settings
 
@@ -22,7 +21,9 @@ def verify_telegram_webapp_data(init_data: str) -> Dict[str, Any]:
     if not settings.telegram_bot_token:
         raise HTTPException(status_code=500, detail="TELEGRAM_BOT_TOKEN is not configured")
 
-    # Parse and validate using init-data-py
+    # Parse and validate using init-data-py; imported here, only logins need it
+    from init_data_py import InitData
+
     try:
         parsed = InitData.parse(init_data)
     except Exception:
@@ -72,3 +73,30 @@ def decode_access_token(token: str) -> Dict[str, Any]:
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+
+def admin_token_matches(token: Optional[str]) -> bool:
+    settings = get_settings()
+    if not settings.admin_token or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.admin_token.encode())
+
+
+def _calendar_signature(owner_id: int) -> str:
+    secret = get_settings().jwt_secret.encode()
+    return hmac.new(secret, f"calendar:{owner_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def create_calendar_token(owner_id: int) -> str:
+    # Stateless and long-lived: calendar apps can't refresh tokens. Rotating JWT_SECRET revokes all.
+    return f"{owner_id}-{_calendar_signature(owner_id)}"
+
+
+def calendar_token_owner(token: str) -> Optional[int]:
+    owner, _, signature = token.partition("-")
+    try:
+        owner_id = int(owner)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature.encode(), _calendar_signature(owner_id).encode()):
+        return None
+    return owner_id
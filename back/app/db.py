@@ -1,19 +1,272 @@
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import ContextManager, Dict, Iterator, List, Optional, Set, Tuple
+import threading
+import time
+import zlib
+
+from sqlalchemy import Table, case, event, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel, create_engine, Session
+import logging
 import os
 
+from .core.config import get_settings
+from .core.coordination import subscribe
+from .models import IdBlock, Project, ShardAssignment, Task
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
+# Extra databases to spread owners over, comma-separated; DATABASE_URL is always shard 0
+DATABASE_SHARD_URLS = [url.strip() for url in os.getenv("DATABASE_SHARD_URLS", "").split(",") if url.strip()]
+
+
+def _create_engine(url: str) -> Engine:
+    return create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+
+
+# Shard 0 also holds global rows (owner_id NULL/0) and the shard directory
+engine = _create_engine(DATABASE_URL)
+engines: List[Engine] = [engine] + [_create_engine(url) for url in DATABASE_SHARD_URLS]
+
+logger = logging.getLogger("db")
+
+
+def hash_shard(owner_id: int, shard_count: int) -> int:
+    return zlib.crc32(str(owner_id).encode()) % shard_count
+
+
+class ShardRouter:
+    """Maps an owner to the database holding all of their rows.
+
+    ``hash`` routing is stateless; changing the shard count needs a rebalance
+    (``python -m app.shards rebalance``). ``directory`` routing reads the owner's shard
+    from ``shardassignment`` on shard 0 (new owners start on their hash shard), caches
+    it for ``ttl`` seconds, and lets owners be moved one at a time.
+    """
+
+    def __init__(self, engines: List[Engine], mode: str = "hash", ttl: float = 60.0) -> None:
+        self.engines = engines
+        self.mode = mode
+        self.ttl = ttl
+        self._directory: Dict[int, Tuple[float, int]] = {}
+        self._id_blocks: Dict[str, Tuple[int, int]] = {}
+        self._id_floors: Set[str] = set()
+        self._lock = threading.Lock()
+        # Lookups only happen on cache misses; keep them out of per-route query budgets
+        self._directory_bind = engines[0].execution_options(skip_query_budget=True)
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.engines) > 1
+
+    def shard_for(self, owner_id: Optional[int]) -> int:
+        if not owner_id or len(self.engines) == 1:
+            return 0
+        owner_id = int(owner_id)
+        if self.mode != "directory":
+            return hash_shard(owner_id, len(self.engines))
+        with self._lock:
+            hit = self._directory.get(owner_id)
+        if hit is not None and time.monotonic() - hit[0] <= self.ttl:
+            return hit[1]
+        shard = self._lookup(owner_id)
+        with self._lock:
+            self._directory[owner_id] = (time.monotonic(), shard)
+        return shard
+
+    def _lookup(self, owner_id: int) -> int:
+        with Session(self._directory_bind) as session:
+            row = session.get(ShardAssignment, owner_id)
+            if row is None:
+                row = ShardAssignment(owner_id=owner_id, shard=hash_shard(owner_id, len(self.engines)),
+                                      assigned_at=datetime.utcnow())
+                session.add(row)
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another worker assigned this owner first
+                    session.rollback()
+                    row = session.get(ShardAssignment, owner_id)
+            return row.shard
+
+    def forget(self, owner_id: Optional[int] = None) -> None:
+        with self._lock:
+            if owner_id is None:
+                self._directory.clear()
+            else:
+                self._directory.pop(owner_id, None)
+
+    def engine_for(self, owner_id: Optional[int]) -> Engine:
+        return self.engines[self.shard_for(owner_id)]
+
+    ID_BLOCK = 1000  # ids reserved per round trip to shard 0
+
+    def new_ids(self, table: Table, count: int = 1, connection: Optional[Connection] = None) -> List[int]:
+        """``count`` ids for new ``table`` rows that no shard has used, reserved in ``idblock`` on shard 0.
+
+        Lists merge shard 0's global rows with an owner's own, and routes look rows up by
+        id, so ids must be unique across shards. ``connection`` is the inserting one: on
+        shard 0 the ids are reserved in its transaction (a second connection would wait
+        on its write lock) and vanish with it on rollback; elsewhere blocks of
+        ``ID_BLOCK`` are reserved on their own and handed out from memory.
+        """
+        if connection is not None and connection.engine.url == self.engines[0].url:
+            start = self._reserve_ids(connection, table, count)
+            return list(range(start, start + count))
+        with self._lock:
+            start, end = self._id_blocks.get(table.name, (0, 0))
+            if end - start < count:
+                size = max(count, self.ID_BLOCK)
+                while True:
+                    try:
+                        with self._directory_bind.begin() as conn:
+                            start = self._reserve_ids(conn, table, size)
+                        break
+                    except IntegrityError:
+                        continue  # another process created the table's row first
+                end = start + size
+            self._id_blocks[table.name] = (start + count, end)
+            return list(range(start, start + count))
+
+    def _max_id(self, table: Table) -> int:
+        highest = 0
+        for bind in self.engines:
+            with bind.execution_options(skip_query_budget=True).connect() as conn:
+                highest = max(highest, conn.execute(select(func.max(table.c.id))).scalar() or 0)
+        return highest
+
+    def _reserve_ids(self, conn: Connection, table: Table, count: int) -> int:
+        blocks = IdBlock.__table__
+        options = {"skip_query_budget": True}
+        # Once per process, skip past every id in use: rows may predate the reservations
+        floor = 0 if table.name in self._id_floors else self._max_id(table) + 1
+        bump = case((blocks.c.next_id > floor, blocks.c.next_id), else_=floor) + count
+        statement = update(blocks).where(blocks.c.name == table.name).values(next_id=bump).returning(blocks.c.next_id)
+        end = conn.execute(statement, execution_options=options).scalar()
+        if end is None:
+            end = (floor or self._max_id(table) + 1) + count
+            conn.execute(insert(blocks).values(name=table.name, next_id=end), execution_options=options)
+        self._id_floors.add(table.name)
+        return end - count
+
+
+shard_router = ShardRouter(engines, get_settings().shard_routing, get_settings().shard_directory_ttl)
+
+
+@event.listens_for(Project, "before_insert")
+@event.listens_for(Task, "before_insert")
+def _shard_unique_id(mapper, connection: Connection, target) -> None:
+    if target.id is None and shard_router.sharded:
+        target.id = shard_router.new_ids(mapper.local_table, 1, connection)[0]
+
+
+@subscribe("shard_directory")
+def _on_directory_change(message: str) -> None:
+    # Moves made by `python -m app.shards` or another worker
+    shard_router.forget(int(message) if message else None)
+
+
+# Sessions opened by the app and the bot; session-level hooks (calendar invalidation) listen here
+app_sessions = sessionmaker(class_=Session)
+
+
+def session_for(owner_id: Optional[int]) -> Session:
+    """Session on the shard holding ``owner_id``'s rows (shard 0 for global rows)."""
+    return app_sessions(bind=shard_router.engine_for(owner_id))
+
+
+def global_session(session: Session) -> ContextManager[Session]:
+    """``session`` itself if it is on shard 0, else a new session there, for reading global rows."""
+    return nullcontext(session) if session.get_bind() is engine else app_sessions(bind=engine)
+
+
+# Arbitrary key for pg_advisory_lock, shared by every process running init_db
+INIT_LOCK_KEY = 0x7A5B_0001
+
+
+@contextmanager
+def _init_lock(bind: Engine) -> Iterator[None]:
+    """Serialize schema work across processes: workers started together wait for the first one."""
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": INIT_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INIT_LOCK_KEY})
+        return
+    database = bind.url.database if bind.dialect.name == "sqlite" else None
+    if not database or database == ":memory:":
+        yield
+        return
+    import fcntl
+
+    with open(f"{database}.init.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def schema_is_current(bind: Engine) -> bool:
+    """All tables and indexes of the models exist and every migration is recorded."""
+    from .migrations import MIGRATIONS
+    from .models import SchemaVersion
+
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    tables = SQLModel.metadata.sorted_tables
+    if any(table.name not in existing for table in tables):
+        return False
+    indexes: Set[str] = set()
+    for table in tables:
+        indexes.update(ix["name"] for ix in inspector.get_indexes(table.name))
+    if any(index.name not in indexes for table in tables for index in table.indexes):
+        return False
+    with bind.connect() as conn:
+        applied = conn.execute(select(func.count()).select_from(SchemaVersion.__table__)).scalar_one()
+    return applied >= len(MIGRATIONS)
+
+
+def init_db(bind: Engine = engine) -> None:
+    """Create missing tables and indexes and apply pending migrations.
+
+    Cheap when nothing changed (a few catalog reads), so it is safe to run from every
+    worker's startup; the first process to take the lock does the work.
+    """
+    from .migrations import migrate
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+    if schema_is_current(bind):
+        return
+    with _init_lock(bind):
+        # Another worker may have finished while we waited for the lock
+        if schema_is_current(bind):
+            return
+        logger.info("Upgrading database schema")
+        existing = set(inspect(bind).get_table_names())
+        SQLModel.metadata.create_all(bind)
+        migrate(bind, existing)
+        # create_all skips existing tables, so indexes added to models later need creating here
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind, checkfirst=True)
 
 
-def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+def init_shards() -> None:
+    for bind in engines:
+        init_db(bind)
 
 
 def get_session():
+    """Session on shard 0; owner-scoped routes use ``deps.get_owner_session`` instead."""
     with Session(engine) as session:
         yield session
 
 
+if __name__ == "__main__":
+    # Deploy step for INIT_DB=off: upgrade the schema once before starting workers
+    logging.basicConfig(level=logging.INFO)
+    init_shards()
@@ -1,8 +1,16 @@
-from fastapi import Header, HTTPException, status
-from typing import Dict, Any, Optional
+from fastapi import Depends, Header, HTTPException, Query, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .core.security import decode_access_token
+from .core.security import admin_token_matches, decode_access_token
 from .core.config import get_settings
+from .db import global_session, session_for, shard_router
+from .models import LevelName
+
+
+_level = TypeAdapter(LevelName)
 
 
 def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dict[str, Any]:
@@ -29,3 +37,82 @@ def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dic
 
     return user
 
+
+def get_owner_session(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """Session on the current user's shard."""
+    with session_for(current_user.get("id")) as session:
+        yield session
+
+
+def global_rows_apart(owner_id: Optional[int]) -> bool:
+    """Whether ``owner_id``'s global rows (``owner_id`` NULL) have to be read from shard 0 separately."""
+    return owner_id is not None and shard_router.sharded
+
+
+def visible_to(model: Any, owner_id: Optional[int]):
+    """Rows owned by ``owner_id`` plus global rows (``owner_id`` NULL).
+
+    With several shards the global rows live on shard 0 only, so this matches just the
+    owner's own; ``visible_rows`` adds the global ones back.
+    """
+    if global_rows_apart(owner_id):
+        return model.owner_id == owner_id
+    return (model.owner_id == owner_id) | (model.owner_id.is_(None))
+
+
+def visible_rows(session: Any, model: Any, owner_id: Optional[int], fetch: Callable[[Any, Any], Iterable[Any]]) -> List[Any]:
+    """``fetch(session, where)`` with ``where = visible_to(model, owner_id)``, plus, when the
+    global rows live apart, ``fetch`` on shard 0 for them (appended, so re-sort if needed)."""
+    return list(iter_visible_rows(session, model, owner_id, fetch))
+
+
+def iter_visible_rows(session: Any, model: Any, owner_id: Optional[int], fetch: Callable[[Any, Any], Iterable[Any]]) -> Iterator[Any]:
+    """``visible_rows`` one row at a time, for streamed results."""
+    yield from fetch(session, visible_to(model, owner_id))
+    if global_rows_apart(owner_id):
+        with global_session(session) as home:
+            yield from fetch(home, model.owner_id.is_(None))
+
+
+@contextmanager
+def visible_row(session: Any, model: Any, row_id: int, owner_id: Optional[int]) -> Iterator[Tuple[Optional[Any], Any]]:
+    """``(row, session holding it)`` for ``row_id``: from the owner's shard, else, when the
+    global rows live apart, the global row with that id on shard 0. Ids are unique across shards."""
+    row = session.get(model, row_id)
+    if row is not None or not global_rows_apart(owner_id):
+        yield row, session
+        return
+    with global_session(session) as home:
+        row = home.get(model, row_id)
+        yield (row if row is not None and row.owner_id is None else None), home
+
+
+def wants_compact(
+    compact: bool = Query(default=False, description="Omit null and default-valued fields"),
+    x_compact_json: Optional[str] = Header(default=None),
+) -> bool:
+    if compact:
+        return True
+    return (x_compact_json or "").lower() in {"1", "true", "yes"}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    if not get_settings().admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not admin_token_matches(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def check_levels(task: Any) -> None:
+    """422 for a ``priority``/``importance`` outside low|medium|high.
+
+    Table models used as a request body skip validation, so their Literal isn't enforced.
+    """
+    errors = []
+    for field in ("priority", "importance"):
+        try:
+            _level.validate_python(getattr(task, field))
+        except ValidationError as exc:
+            errors.extend(dict(error, loc=("body", field)) for error in exc.errors(include_url=False))
+    if errors:
+        raise RequestValidationError(errors)
@@ -0,0 +1,104 @@
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def unfold(lines: Iterable[str]) -> Iterator[str]:
+    # RFC 5545 3.1: a line starting with a space or tab continues the previous one
+    current: Optional[str] = None
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    head, _, value = line.partition(":")
+    name, *params = head.split(";")
+    parsed: Dict[str, str] = {}
+    for p in params:
+        k, _, v = p.partition("=")
+        parsed[k.upper()] = v
+    return name.upper(), parsed, value
+
+
+def unescape_text(value: str) -> str:
+    out: List[str] = []
+    it = iter(value)
+    for ch in it:
+        if ch == "\\":
+            nxt = next(it, "")
+            out.append("\n" if nxt in ("n", "N") else nxt)
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def to_iso(value: str, params: Dict[str, str]) -> str:
+    """``20240131`` / ``20240131T093000[Z]`` -> ISO string; TZID is ignored (naive local time)."""
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return f"{value[0:4]}-{value[4:6]}-{value[6:8]}"
+    iso = f"{value[0:4]}-{value[4:6]}-{value[6:8]}T{value[9:11]}:{value[11:13]}:{value[13:15]}"
+    return iso + "Z" if value.endswith("Z") else iso
+
+
+def iter_components(lines: Iterable[str], kinds: Tuple[str, ...] = ("VEVENT", "VTODO")) -> Iterator[Tuple[str, Dict[str, Tuple[Dict[str, str], str]]]]:
+    """Yield ``(component, {PROPERTY: (params, value)})`` for each matching component."""
+    component: Optional[str] = None
+    props: Dict[str, Tuple[Dict[str, str], str]] = {}
+    depth = 0
+    for line in unfold(lines):
+        if not line:
+            continue
+        name, params, value = parse_property(line)
+        if name == "BEGIN":
+            if component is None and value.upper() in kinds:
+                component, props, depth = value.upper(), {}, 0
+            elif component is not None:
+                depth += 1  # nested VALARM etc.
+        elif name == "END" and component is not None:
+            if depth:
+                depth -= 1
+            elif value.upper() == component:
+                yield component, props
+                component = None
+        elif component is not None and not depth and name not in props:
+            props[name] = (params, value)
+
+
+def escape_text(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    # RFC 5545 3.1: lines longer than 75 octets are split, continuations start with a space
+    raw = line.encode()
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts: List[str] = []
+    start, limit = 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            end -= 1
+        parts.append(raw[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_date(value: date) -> str:
+    return value.strftime("%Y%m%d")
+
+
+def format_datetime(value: datetime) -> str:
+    """Aware datetimes are written in UTC (``...Z``), naive ones as floating local time."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return value.strftime("%Y%m%dT%H%M%S")
@@ -1,7 +1,17 @@
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .core.ai import close_openai_clients
+from .core.calendar_cache import install_calendar_invalidation
+from .core.compression import CompressionMiddleware
 from .core.config import get_settings
+from .core.coordination import get_coordinator
+from .core.metrics import MetricsMiddleware, instrument_engine
+from .core.profiling import install_profiling, parse_sample_rates
+from .core.querybudget import install_query_budgets, query_budget
 from .routers import health as health_router
 from .routers import auth as auth_router
 from .routers import users as users_router
@@ -11,13 +21,45 @@ from .routers import settings as settings_router
 from .routers import stats as stats_router
 from .routers import telegram as telegram_router
 from .routers import events as events_router
-from .db import init_db
+from .routers import imports as imports_router
+from .routers import export as export_router
+from .routers import calendar as calendar_router
+from .routers import metrics as metrics_router
+from .routers import debug as debug_router
+from .db import app_sessions, engines, init_shards
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    # Schema work happens here rather than at import, so importing the app stays cheap
+    if settings.init_db != "off":
+        init_shards()
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(close_openai_clients)
+        coordinator = get_coordinator()
+        await coordinator.start()
+        stack.push_async_callback(coordinator.close)
+        if settings.reminders == "app":
+            from .reminders import reminders_running
+
+            await stack.enter_async_context(reminders_running(engines))
+        if settings.backup_interval > 0:
+            from .backup import backups_running
+
+            await stack.enter_async_context(backups_running(engines))
+        yield
 
 
 def create_app() -> FastAPI:
     settings = get_settings()
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
+    for bind in engines:
+        instrument_engine(bind)
+    install_calendar_invalidation(app_sessions)
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+    app.add_middleware(MetricsMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.cors_origins,
@@ -27,6 +69,7 @@ def create_app() -> FastAPI:
     )
 
     app.include_router(health_router.router)
+    app.include_router(metrics_router.router)
     app.include_router(auth_router.router)
     app.include_router(users_router.router)
     app.include_router(projects_router.router)
@@ -34,15 +77,32 @@ def create_app() -> FastAPI:
     app.include_router(settings_router.router)
     app.include_router(stats_router.router)
     app.include_router(events_router.router)
+    app.include_router(imports_router.router)
+    app.include_router(export_router.router)
+    app.include_router(calendar_router.router)
     app.include_router(telegram_router.router)
+    app.include_router(debug_router.router)
 
     @app.get("/")
+    @query_budget(0)
     def root():
         return {"name": settings.app_name}
 
+    if settings.query_budget_mode in {"warn", "raise"}:
+        install_query_budgets(app, engines, settings.query_budget_mode)
+
+    # Profiling hooks are only installed when an admin token is configured,
+    # so there is no per-request cost otherwise.
+    if settings.admin_token:
+        install_profiling(
+            app,
+            engines,
+            parse_sample_rates(settings.profile_sample_rates),
+            settings.profile_buffer_size,
+        )
+
     return app
 
 
-init_db()
 app = create_app()
 
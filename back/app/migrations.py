@@ -0,0 +1,68 @@
+"""Schema changes to tables that already exist.
+
+``init_db`` creates missing tables and indexes but never alters an existing table, so
+such changes are listed here in order and recorded in ``schemaversion``. A database
+created from scratch already has the latest schema and is only stamped.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Set, Tuple
+
+from sqlalchemy import Integer, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from .models import LEVEL_CODES, SchemaVersion, Task
+
+
+logger = logging.getLogger("migrations")
+
+
+def _level_case(column: str) -> str:
+    whens = " ".join(f"WHEN '{name}' THEN {code}" for name, code in LEVEL_CODES.items())
+    return f"CASE lower({column}) {whens} ELSE {LEVEL_CODES['medium']} END"
+
+
+def _levels_to_integers(conn: Connection) -> None:
+    """task.priority/importance: 'low|medium|high' strings -> 0|1|2."""
+    columns = {c["name"]: c["type"] for c in inspect(conn).get_columns("task")}
+    if isinstance(columns["priority"], Integer) and isinstance(columns["importance"], Integer):
+        return
+    if conn.dialect.name != "sqlite":
+        for column in ("priority", "importance"):
+            conn.execute(text(f"ALTER TABLE task ALTER COLUMN {column} TYPE SMALLINT USING {_level_case(column)}"))
+        return
+    # SQLite can't change a column's type: rebuild the table and copy rows over
+    for index in inspect(conn).get_indexes("task"):
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    conn.execute(text("ALTER TABLE task RENAME TO task_old"))
+    Task.__table__.create(conn)
+    names = [c.name for c in Task.__table__.columns if c.name in columns]
+    values = [_level_case(n) if n in ("priority", "importance") else n for n in names]
+    conn.execute(text(f"INSERT INTO task ({', '.join(names)}) SELECT {', '.join(values)} FROM task_old"))
+    conn.execute(text("DROP TABLE task_old"))
+
+
+# (version, description, upgrade); append only
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "task priority/importance as small integers", _levels_to_integers),
+]
+
+
+def migrate(engine: Engine, existing_tables: Set[str]) -> None:
+    """Apply pending migrations. ``existing_tables``: tables present before ``create_all`` ran."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            # pysqlite only opens a transaction before DML, so DDL (like the table rebuild in
+            # migration 1) would autocommit statement by statement; make the whole run atomic
+            conn.exec_driver_sql("BEGIN")
+        applied = set(conn.execute(select(SchemaVersion.version)).scalars())
+        fresh = "task" not in existing_tables
+        for version, description, upgrade in MIGRATIONS:
+            if version in applied:
+                continue
+            if not fresh:
+                logger.info("Applying migration %s: %s", version, description)
+                upgrade(conn)
+            conn.execute(insert(SchemaVersion.__table__).values(
+                version=version, description=description, applied_at=datetime.utcnow(),
+            ))
@@ -1,8 +1,42 @@
 from datetime import datetime, date
-from typing import Optional
+from typing import Any, Literal, Optional
+from sqlalchemy import Index, SmallInteger, UniqueConstraint
+from sqlalchemy.types import TypeDecorator
 from sqlmodel import SQLModel, Field, Relationship
 
 
+LEVELS = ("low", "medium", "high")
+LEVEL_CODES = {name: code for code, name in enumerate(LEVELS)}
+LevelName = Literal["low", "medium", "high"]
+
+
+class Level(TypeDecorator):
+    """low|medium|high in Python and JSON, 0|1|2 in the database so SQL can sort and index it."""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Any) -> Optional[int]:
+        if value is None:
+            return None
+        if isinstance(value, int) and not isinstance(value, bool):
+            if 0 <= value < len(LEVELS):
+                return value
+        elif str(value).lower() in LEVEL_CODES:
+            return LEVEL_CODES[str(value).lower()]
+        raise ValueError(f"level must be one of {'|'.join(LEVELS)}, got {value!r}")
+
+    def process_result_value(self, value: Any, dialect: Any) -> Optional[str]:
+        if value is None:
+            return None
+        if isinstance(value, str) and not value.isdigit():
+            return value  # row written before migration 1
+        code = int(value)
+        if not 0 <= code < len(LEVELS):
+            raise ValueError(f"stored level {code} is outside 0..{len(LEVELS) - 1}")
+        return LEVELS[code]
+
+
 class Project(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     owner_id: Optional[int] = Field(index=True, default=None)
@@ -14,18 +48,21 @@ class Project(SQLModel, table=True):
 
 
 class Task(SQLModel, table=True):
+    # Serves GET /tasks/matrix: one index seek per (owner, importance, priority) cell, in deadline order
+    __table_args__ = (Index("ix_task_matrix", "owner_id", "importance", "priority", "deadline"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     owner_id: Optional[int] = Field(index=True, default=None)
     title: str
     description: str = ""
     deadline: Optional[date] = Field(default=None, index=True)
     duration_hours: float = 1.0
-    priority: str = "medium"  # low|medium|high
-    importance: str = "medium"  # low|medium|high
+    priority: LevelName = Field(default="medium", sa_type=Level)
+    importance: LevelName = Field(default="medium", sa_type=Level)
     kind: str = "task"  # task|event
-    event_start: Optional[datetime] = None
+    event_start: Optional[datetime] = Field(default=None, index=True)
     event_end: Optional[datetime] = None
-    project_id: Optional[int] = Field(default=None, foreign_key="project.id")
+    project_id: Optional[int] = Field(default=None, foreign_key="project.id", index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     project: Optional[Project] = Relationship(back_populates="tasks")
@@ -36,8 +73,8 @@ class TaskUpdate(SQLModel):
     description: Optional[str] = None
     deadline: Optional[date] = None
     duration_hours: Optional[float] = None
-    priority: Optional[str] = None  # low|medium|high
-    importance: Optional[str] = None  # low|medium|high
+    priority: Optional[LevelName] = None
+    importance: Optional[LevelName] = None
     kind: Optional[str] = None  # task|event
     event_start: Optional[datetime] = None
     event_end: Optional[datetime] = None
@@ -76,3 +113,44 @@ class ChatMessage(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class ReminderSettings(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int = Field(index=True, unique=True)
+    enabled: bool = True
+    # Task times are naive local times; this maps them to UTC
+    utc_offset_minutes: int = 0
+    # Local hours [quiet_start, quiet_end) with no reminders; equal values disable
+    quiet_start: int = 22
+    quiet_end: int = 8
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SentReminder(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("task_id", "kind", "due"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int
+    task_id: int
+    kind: str  # event|deadline
+    due: datetime = Field(index=True)  # local event start / deadline reminder time it was sent for
+    sent_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SchemaVersion(SQLModel, table=True):
+    version: int = Field(primary_key=True)
+    description: str = ""
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IdBlock(SQLModel, table=True):
+    """Next unreserved id per table, so rows on different shards never share one; only used on shard 0."""
+    name: str = Field(primary_key=True)
+    next_id: int
+
+
+class ShardAssignment(SQLModel, table=True):
+    """Shard directory (``SHARD_ROUTING=directory``); only used on shard 0."""
+    owner_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    shard: int = Field(index=True)
+    assigned_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,451 @@
+"""Deadline and event reminders.
+
+Upcoming event starts and deadlines are read with range scans over the indexed
+``Task.event_start`` / ``Task.deadline`` columns, one sliding window at a time, into a
+heap keyed by fire time. Due reminders are grouped per user, deferred past quiet
+hours, sent through Telegram ``sendMessage`` under a global rate limit, and recorded
+in ``SentReminder`` so a restart does not send them again.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, time as dtime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import httpx
+from sqlalchemy import Index, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel
+
+from .core.config import Settings, get_settings
+from .core.metrics import QUEUE_DEPTH, REMINDERS_SENT, TELEGRAM_SEND_LATENCY
+from .models import ReminderSettings, SentReminder, Task
+
+
+logger = logging.getLogger("reminders")
+
+EVENT = "event"
+DEADLINE = "deadline"
+# Per-user reminders merged into one Telegram message
+MAX_PER_MESSAGE = 20
+MAX_ATTEMPTS = 3
+DEFAULT_QUIET = (ReminderSettings.__fields__["quiet_start"].default, ReminderSettings.__fields__["quiet_end"].default)
+
+Key = Tuple[int, str, datetime]  # (task_id, kind, due)
+
+
+@dataclass(order=True)
+class Reminder:
+    fire_at: datetime  # UTC
+    task_id: int = field(compare=False)
+    kind: str = field(compare=False)
+    due: datetime = field(compare=False)  # user-local event start / deadline reminder time
+    owner_id: int = field(compare=False)
+    title: str = field(compare=False)
+    offset: timedelta = field(compare=False)
+    quiet: Tuple[int, int] = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+    @property
+    def key(self) -> Key:
+        return self.task_id, self.kind, self.due
+
+
+def quiet_until(local: datetime, start: int, end: int) -> Optional[datetime]:
+    """End of the quiet period ``[start, end)`` (local hours, may wrap midnight) containing ``local``."""
+    if start == end:
+        return None
+    hour = local.hour
+    inside = start <= hour < end if start < end else (hour >= start or hour < end)
+    if not inside:
+        return None
+    until = datetime.combine(local.date(), dtime(end))
+    return until if until > local else until + timedelta(days=1)
+
+
+def ensure_schema(engine: Engine) -> None:
+    """Create reminder tables and the event_start index on databases that predate them."""
+    SQLModel.metadata.create_all(engine, tables=[ReminderSettings.__table__, SentReminder.__table__])
+    for index in Task.__table__.indexes:
+        if isinstance(index, Index) and [c.name for c in index.columns] == ["event_start"]:
+            index.create(engine, checkfirst=True)
+
+
+class ReminderScheduler:
+    def __init__(self, engine: Engine, settings: Optional[Settings] = None) -> None:
+        self.engine = engine
+        self.settings = settings or get_settings()
+        self.lead = timedelta(minutes=self.settings.reminder_event_lead_minutes)
+        self.default_offset = timedelta(minutes=self.settings.reminder_utc_offset_minutes)
+        self.heap: List[Reminder] = []
+        self.queued: Set[Key] = set()
+        self.horizon: Optional[datetime] = None  # fire times up to here are loaded
+        self.resynced_at: Optional[datetime] = None
+
+    # -- loading ---------------------------------------------------------------
+
+    def next_scan(self) -> Optional[datetime]:
+        if self.horizon is None:
+            return None
+        return self.horizon - timedelta(seconds=self.settings.reminder_lookahead_seconds - self.settings.reminder_scan_seconds)
+
+    def scan(self, now: datetime) -> int:
+        """Slide the window to ``now + lookahead``; re-read all of it every resync interval.
+
+        The full re-read picks up tasks created or moved inside the already loaded window.
+        """
+        resync = timedelta(seconds=self.settings.reminder_resync_seconds)
+        full = self.horizon is None or self.resynced_at is None or now - self.resynced_at >= resync
+        # On a full pass, look back far enough to catch reminders whose quiet hours just ended
+        lo = now - timedelta(hours=24) if full else self.horizon
+        hi = now + timedelta(seconds=self.settings.reminder_lookahead_seconds)
+        added = self._load(lo, hi, now)
+        self.horizon = hi
+        if full:
+            self.resynced_at = now
+        QUEUE_DEPTH.set(len(self.heap), queue="reminders")
+        return added
+
+    def _offset_span(self, session: Session) -> Tuple[timedelta, timedelta]:
+        lo, hi = session.execute(select(
+            func.min(ReminderSettings.utc_offset_minutes), func.max(ReminderSettings.utc_offset_minutes),
+        )).one()
+        offsets = [self.default_offset] + [timedelta(minutes=m) for m in (lo, hi) if m is not None]
+        return min(offsets), max(offsets)
+
+    def _load(self, lo: datetime, hi: datetime, now: datetime) -> int:
+        """Queue reminders with a UTC fire time in ``(lo, hi]`` that were not sent yet."""
+        deadline_at = dtime(self.settings.reminder_deadline_hour)
+        prefs = (ReminderSettings.enabled, ReminderSettings.utc_offset_minutes,
+                 ReminderSettings.quiet_start, ReminderSettings.quiet_end)
+        added = 0
+        with Session(self.engine) as session:
+            min_off, max_off = self._offset_span(session)
+            # local = utc + offset, so the local range covering (lo, hi] in every timezone is:
+            local_lo, local_hi = lo + min_off, hi + max_off
+            events = (
+                select(Task.id, Task.owner_id, Task.title, Task.event_start, *prefs)
+                .outerjoin(ReminderSettings, ReminderSettings.owner_id == Task.owner_id)
+                .where(Task.kind == "event", Task.owner_id.is_not(None))
+                .where(Task.event_start > local_lo + self.lead, Task.event_start <= local_hi + self.lead)
+            )
+            deadlines = (
+                select(Task.id, Task.owner_id, Task.title, Task.deadline, *prefs)
+                .outerjoin(ReminderSettings, ReminderSettings.owner_id == Task.owner_id)
+                .where(Task.kind != "event", Task.owner_id.is_not(None))
+                .where(Task.deadline >= local_lo.date(), Task.deadline <= local_hi.date())
+            )
+            sent = set(session.execute(
+                select(SentReminder.task_id, SentReminder.kind, SentReminder.due)
+                .where(SentReminder.due > local_lo - timedelta(days=1), SentReminder.due <= local_hi + self.lead)
+            ).all())
+            candidates: List[Tuple[str, Tuple]] = [(EVENT, r) for r in session.execute(events)]
+            candidates += [(DEADLINE, r) for r in session.execute(deadlines)]
+
+        for kind, (task_id, owner_id, title, when, enabled, offset_minutes, quiet_start, quiet_end) in candidates:
+            if enabled is False:
+                continue
+            if kind == EVENT:
+                due = when
+                local_fire = due - self.lead
+            else:
+                due = local_fire = datetime.combine(when, deadline_at)
+            offset = timedelta(minutes=offset_minutes) if offset_minutes is not None else self.default_offset
+            fire_at = local_fire - offset
+            key = (task_id, kind, due)
+            if not lo < fire_at <= hi or key in sent or key in self.queued:
+                continue
+            if self._expired(kind, due, now + offset):
+                continue
+            quiet = (quiet_start, quiet_end) if enabled is not None else DEFAULT_QUIET
+            heapq.heappush(self.heap, Reminder(fire_at, task_id, kind, due, owner_id, title, offset, quiet))
+            self.queued.add(key)
+            added += 1
+        return added
+
+    @staticmethod
+    def _expired(kind: str, due: datetime, local_now: datetime) -> bool:
+        # Events are pointless once started; deadlines stay relevant until their day ends
+        if kind == EVENT:
+            return local_now >= due
+        return local_now.date() > due.date()
+
+    # -- firing ----------------------------------------------------------------
+
+    def next_fire(self) -> Optional[datetime]:
+        return self.heap[0].fire_at if self.heap else None
+
+    def pop_due(self, now: datetime) -> List[Reminder]:
+        """Reminders whose time has come; those in quiet hours are pushed back to the hours' end."""
+        due: List[Reminder] = []
+        while self.heap and self.heap[0].fire_at <= now:
+            reminder = heapq.heappop(self.heap)
+            local_now = now + reminder.offset
+            if self._expired(reminder.kind, reminder.due, local_now):
+                self.queued.discard(reminder.key)
+                continue
+            until = quiet_until(local_now, *reminder.quiet)
+            if until is not None:
+                reminder.fire_at = until - reminder.offset
+                heapq.heappush(self.heap, reminder)
+                continue
+            due.append(reminder)
+        QUEUE_DEPTH.set(len(self.heap), queue="reminders")
+        return due
+
+    def _still_valid(self, reminders: List[Reminder]) -> List[Reminder]:
+        """Drop reminders whose task was deleted or rescheduled since it was queued.
+
+        Their keys leave ``queued`` too: a task moved back to its old time must be queued again.
+        """
+        ids = {r.task_id for r in reminders}
+        with Session(self.engine) as session:
+            rows = {
+                row.id: row for row in session.execute(
+                    select(Task.id, Task.kind, Task.deadline, Task.event_start).where(Task.id.in_(ids))
+                )
+            }
+        deadline_at = dtime(self.settings.reminder_deadline_hour)
+        valid = []
+        for r in reminders:
+            row = rows.get(r.task_id)
+            current = None
+            if row is not None and (row.kind == "event") == (r.kind == EVENT):
+                current = row.event_start if r.kind == EVENT else (
+                    datetime.combine(row.deadline, deadline_at) if row.deadline else None)
+            if current == r.due:
+                valid.append(r)
+            else:
+                self.queued.discard(r.key)
+        return valid
+
+    def mark_sent(self, reminders: Iterable[Reminder]) -> None:
+        rows = [{"owner_id": r.owner_id, "task_id": r.task_id, "kind": r.kind, "due": r.due,
+                 "sent_at": datetime.utcnow()} for r in reminders]
+        if not rows:
+            return
+        with Session(self.engine) as session:
+            try:
+                session.execute(insert(SentReminder.__table__), rows)
+                session.commit()
+            except IntegrityError:
+                # Another scheduler (or a previous run) got there first for some of them
+                session.rollback()
+                for row in rows:
+                    try:
+                        session.execute(insert(SentReminder.__table__), row)
+                        session.commit()
+                    except IntegrityError:
+                        session.rollback()
+
+    async def deliver(self, reminders: List[Reminder], sender: "TelegramSender", now: datetime) -> None:
+        reminders = await asyncio.to_thread(self._still_valid, reminders)
+        by_owner: Dict[int, List[Reminder]] = {}
+        for r in reminders:
+            items = by_owner.setdefault(r.owner_id, [])
+            if len(items) < MAX_PER_MESSAGE:
+                items.append(r)
+            else:
+                heapq.heappush(self.heap, r)  # goes out in the next message
+        messages = {owner: format_message(items) for owner, items in by_owner.items()}
+        outcomes = await sender.send_many(messages)
+
+        done: List[Reminder] = []
+        for owner, items in by_owner.items():
+            outcome = outcomes.get(owner, "error")
+            if outcome in ("ok", "forbidden"):
+                # A user who blocked the bot won't get it on retry either
+                done.extend(items)
+            for r in items:
+                if outcome in ("ok", "forbidden"):
+                    REMINDERS_SENT.inc(kind=r.kind, outcome=outcome)
+                    continue
+                r.attempts += 1
+                if r.attempts >= MAX_ATTEMPTS:
+                    REMINDERS_SENT.inc(kind=r.kind, outcome="gave_up")
+                    self.queued.discard(r.key)
+                else:
+                    r.fire_at = now + timedelta(seconds=30 * 2 ** r.attempts)
+                    heapq.heappush(self.heap, r)
+        await asyncio.to_thread(self.mark_sent, done)
+        for r in done:
+            self.queued.discard(r.key)
+
+
+def format_message(reminders: List[Reminder]) -> str:
+    lines = ["⏰ Напоминание:"]
+    for r in sorted(reminders, key=lambda r: r.due):
+        if r.kind == EVENT:
+            lines.append(f"• {r.due:%H:%M} — {r.title}")
+        else:
+            lines.append(f"• Дедлайн {r.due:%d.%m} — {r.title}")
+    return "\n".join(lines)
+
+
+class TelegramSender:
+    """Sends many messages over one connection pool, at most ``rate`` per second overall."""
+
+    def __init__(self, token: str, api_base: str, rate: float, concurrency: int = 10) -> None:
+        self.url = f"{api_base}/bot{token}/sendMessage"
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.concurrency = concurrency
+        self._next_slot = 0.0
+        self._slot_lock = asyncio.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Settings] = None) -> Optional["TelegramSender"]:
+        settings = settings or get_settings()
+        if not settings.telegram_bot_token:
+            return None
+        return cls(settings.telegram_bot_token, settings.telegram_api_base, settings.reminder_send_rate)
+
+    async def _slot(self) -> None:
+        async with self._slot_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def send(self, chat_id: int, text: str) -> str:
+        """``ok``, ``forbidden`` (bot blocked / chat gone) or ``error``."""
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self._client = httpx.AsyncClient(timeout=20, limits=limits)
+        for _ in range(MAX_ATTEMPTS):
+            await self._slot()
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                resp = await self._client.post(self.url, json={"chat_id": chat_id, "text": text})
+                outcome = "ok" if resp.is_success else str(resp.status_code)
+            except httpx.HTTPError as e:
+                logger.warning("sendMessage to %s failed: %s", chat_id, e)
+                return "error"
+            finally:
+                TELEGRAM_SEND_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
+            if resp.status_code == 429:
+                # Flood control: Telegram tells us how long to back off
+                try:
+                    retry_after = float(resp.json().get("parameters", {}).get("retry_after", 1))
+                except ValueError:
+                    retry_after = 1.0
+                async with self._slot_lock:
+                    self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+                continue
+            if resp.status_code in (400, 403):
+                return "forbidden"
+            return "ok" if resp.is_success else "error"
+        return "error"
+
+    async def send_many(self, messages: Dict[int, str]) -> Dict[int, str]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(chat_id: int, text: str) -> Tuple[int, str]:
+            async with semaphore:
+                return chat_id, await self.send(chat_id, text)
+
+        return dict(await asyncio.gather(*(one(c, t) for c, t in messages.items())))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+
+async def run_reminders(engines: Sequence[Engine], sender: TelegramSender, stop: Optional[asyncio.Event] = None) -> None:
+    """Scheduler loop over every shard; runs until ``stop`` is set or the task is cancelled."""
+    stop = stop or asyncio.Event()
+    schedulers = [ReminderScheduler(engine) for engine in engines]
+    for engine in engines:
+        await asyncio.to_thread(ensure_schema, engine)
+    batch = max(1, int(get_settings().reminder_send_rate * 10))
+    logger.info("Reminder scheduler started")
+    try:
+        while not stop.is_set():
+            now = datetime.utcnow()
+            for scheduler in schedulers:
+                next_scan = scheduler.next_scan()
+                if next_scan is None or now >= next_scan:
+                    try:
+                        added = await asyncio.to_thread(scheduler.scan, now)
+                        if added:
+                            logger.info("Queued %s reminders (%s pending)", added, len(scheduler.heap))
+                    except Exception:
+                        logger.exception("Reminder scan failed")
+                due = scheduler.pop_due(now)
+                for i in range(0, len(due), batch):
+                    try:
+                        await scheduler.deliver(due[i:i + batch], sender, now)
+                    except Exception:
+                        logger.exception("Reminder delivery failed")
+            wake = [t for scheduler in schedulers for t in (scheduler.next_scan(), scheduler.next_fire()) if t is not None]
+            delay = min([(t - datetime.utcnow()).total_seconds() for t in wake] + [30.0])
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=max(delay, 0.5))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await sender.aclose()
+        logger.info("Reminder scheduler stopped")
+
+
+LEADER_LOCK = "reminders:leader"
+LEADER_TTL = 30.0
+
+
+async def _lead_reminders(engines: Sequence[Engine], stop: asyncio.Event) -> None:
+    """Run the scheduler while this process holds the leader lease, so one worker of many sends."""
+    from .core.coordination import get_coordinator
+
+    coordinator = get_coordinator()
+    token = coordinator.origin
+    while not stop.is_set():
+        if await coordinator.try_acquire(LEADER_LOCK, token, LEADER_TTL):
+            sender = TelegramSender.from_settings()
+            term = asyncio.Event()
+            task = asyncio.create_task(run_reminders(engines, sender, term))
+            logger.info("Holding the reminder lease")
+            try:
+                while not stop.is_set() and not task.done():
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=LEADER_TTL / 3)
+                    except asyncio.TimeoutError:
+                        pass
+                    if not stop.is_set() and not await coordinator.try_acquire(LEADER_LOCK, token, LEADER_TTL):
+                        logger.warning("Lost the reminder lease")
+                        break
+            finally:
+                term.set()
+                try:
+                    await task
+                except Exception:
+                    logger.exception("Reminder scheduler failed")
+                await coordinator.release(LEADER_LOCK, token)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LEADER_TTL / 3)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def reminders_running(engines: Sequence[Engine]) -> AsyncIterator[None]:
+    """Run the scheduler inside the API process for the app's lifespan (``REMINDERS=app``).
+
+    With several workers they take turns through a lease in the coordination backend.
+    """
+    if TelegramSender.from_settings() is None:
+        logger.warning("REMINDERS=app but TELEGRAM_BOT_TOKEN is not set; reminders disabled")
+        yield
+        return
+    stop = asyncio.Event()
+    task = asyncio.create_task(_lead_reminders(engines, stop))
+    try:
+        yield
+    finally:
+        stop.set()
+        await task
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from ..core.querybudget import query_budget
 from ..core.security import create_access_token, verify_telegram_webapp_data
 from ..schemas import AuthRequest, AuthResponse
 
@@ -8,6 +9,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/telegram", response_model=AuthResponse)
+@query_budget(0)
 def auth_telegram(req: AuthRequest):
     verified = verify_telegram_webapp_data(req.init_data)
     user = verified.get("user") or {}
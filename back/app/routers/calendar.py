@@ -0,0 +1,126 @@
+from datetime import timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Iterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import and_, or_, select
+from sqlmodel import Session
+
+from ..core.calendar_cache import announce_feed, calendar_cache
+from ..core.config import get_settings
+from ..core.querybudget import query_budget
+from ..core.security import calendar_token_owner, create_calendar_token
+from ..db import session_for
+from ..deps import get_current_user, iter_visible_rows
+from ..ical import escape_text, fold, format_date, format_datetime
+from ..models import Project, Task
+
+
+router = APIRouter(prefix="/calendar", tags=["calendar"])
+
+MEDIA_TYPE = "text/calendar; charset=utf-8"
+# RFC 5545 PRIORITY, mirroring the mapping used by POST /import
+PRIORITIES = {"high": 1, "medium": 5, "low": 9}
+YIELD_PER = 1000
+
+
+def _feed_rows(session: Session, owner_id: int):
+    def fetch(s: Session, where):
+        stmt = (
+            select(
+                Task.id, Task.title, Task.description, Task.kind, Task.deadline, Task.event_start, Task.event_end,
+                Task.priority, Task.created_at, Project.name,
+            )
+            .outerjoin(Project, Task.project_id == Project.id)
+            .where(where)
+            .where(or_(
+                and_(Task.kind == "event", Task.event_start.is_not(None)),
+                and_(Task.kind != "event", Task.deadline.is_not(None)),
+            ))
+            .order_by(Task.id)
+        )
+        return s.connection().execute(stmt.execution_options(yield_per=YIELD_PER))
+
+    return iter_visible_rows(session, Task, owner_id, fetch)
+
+
+def _component(row: Any, host: str) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:task-{row.id}@{host}"
+    yield f"DTSTAMP:{format_datetime(row.created_at)}Z"
+    if row.kind == "event":
+        yield f"DTSTART:{format_datetime(row.event_start)}"
+        yield f"DTEND:{format_datetime(row.event_end or row.event_start)}"
+    else:
+        # Deadlines become all-day entries on their due date
+        yield f"DTSTART;VALUE=DATE:{format_date(row.deadline)}"
+        yield f"DTEND;VALUE=DATE:{format_date(row.deadline + timedelta(days=1))}"
+        yield f"PRIORITY:{PRIORITIES.get(row.priority, 5)}"
+        yield "TRANSP:TRANSPARENT"
+    yield f"SUMMARY:{escape_text(row.title)}"
+    if row.description:
+        yield f"DESCRIPTION:{escape_text(row.description)}"
+    if row.name:
+        yield f"CATEGORIES:{escape_text(row.name)}"
+    yield "END:VEVENT"
+
+
+def render_calendar(rows, host: str, name: str) -> Iterator[str]:
+    """Yield folded iCalendar lines, one row at a time."""
+    for line in ("BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:-//{name}//calendar//EN", "CALSCALE:GREGORIAN",
+                 f"X-WR-CALNAME:{escape_text(name)}", "X-PUBLISHED-TTL:PT15M"):
+        yield fold(line)
+    for row in rows:
+        for line in _component(row, host):
+            yield fold(line)
+    yield fold("END:VCALENDAR")
+
+
+def _not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")) or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@router.get("/token")
+@query_budget(0)
+def calendar_token(request: Request, current_user=Depends(get_current_user)):
+    if current_user.get("id") is None:
+        raise HTTPException(status_code=400, detail="Calendar feeds need a signed-in user")
+    token = create_calendar_token(int(current_user["id"]))
+    base = get_settings().public_url or str(request.base_url)
+    return {"token": token, "url": f"{base.rstrip('/')}/calendar/{token}.ics"}
+
+
+@router.get("/{token}.ics")
+@query_budget(2)  # 1 unless sharded: the global rows are read from shard 0
+def calendar_feed(token: str, request: Request):
+    """Subscribable feed of events and dated deadlines; rendered once per change, then served from cache."""
+    owner_id = calendar_token_owner(token)
+    if owner_id is None:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    cache = calendar_cache()
+    feed = cache.get(owner_id)
+    if feed is None:
+        announce_feed(owner_id)
+        generation = cache.generation()
+        previous = cache.expired(owner_id)
+        name = get_settings().app_name
+        with session_for(owner_id) as session:
+            body = "".join(render_calendar(_feed_rows(session, owner_id), request.url.hostname or name, name)).encode()
+        feed = cache.put(owner_id, body, generation, previous)
+    headers = {
+        "ETag": feed.etag,
+        "Last-Modified": formatdate(feed.last_modified, usegmt=True),
+        "Cache-Control": "private, max-age=300",
+    }
+    if _not_modified(request, feed.etag, feed.last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=feed.body, media_type=MEDIA_TYPE, headers=headers)
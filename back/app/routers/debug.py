@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+
+from ..core.profiling import get_profile, list_profiles
+from ..core.querybudget import query_budget
+from ..deps import require_admin
+from ..shards import shard_stats
+
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiles")
+@query_budget(0)
+def profiles():
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+@query_budget(0)
+def profile_detail(profile_id: int):
+    record = get_profile(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return record.detail()
+
+
+@router.get("/profiles/{profile_id}/pstats")
+@query_budget(0)
+def profile_pstats(profile_id: int):
+    # marshal-ed pstats data, loadable with pstats.Stats(path) or snakeviz
+    record = get_profile(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=record.pstats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{record.id}.prof"'},
+    )
+
+
+@router.get("/shards")
+@query_budget(None)
+def shards():
+    """Owner and row counts per shard, with totals across shards."""
+    return shard_stats()
@@ -4,8 +4,10 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 
-from ..db import get_session
-from ..deps import get_current_user
+from ..core.config import get_settings
+from ..core.fastjson import rows_json, table_rows
+from ..core.querybudget import query_budget
+from ..deps import check_levels, get_current_user, get_owner_session, visible_rows, wants_compact
 from ..models import Task
 
 
@@ -13,23 +15,34 @@ router = APIRouter(prefix="/events", tags=["events"])
 
 
 @router.get("/", response_model=List[Task])
+@query_budget(2)  # 1 unless sharded: the global rows are read from shard 0
 def list_events(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_owner_session),
     current_user=Depends(get_current_user),
     start: Optional[datetime] = Query(default=None),
     end: Optional[datetime] = Query(default=None),
+    compact: bool = Depends(wants_compact),
 ):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
-    stmt = select(Task).where(((Task.owner_id == owner_id) | (Task.owner_id.is_(None))) & (Task.kind == "event"))
-    if start is not None:
-        stmt = stmt.where(Task.event_end >= start)
-    if end is not None:
-        stmt = stmt.where(Task.event_start <= end)
-    return session.exec(stmt).all()
+
+    def statement(where):
+        stmt = select(Task).where(where & (Task.kind == "event"))
+        if start is not None:
+            stmt = stmt.where(Task.event_end >= start)
+        if end is not None:
+            stmt = stmt.where(Task.event_start <= end)
+        return stmt
+
+    if compact or get_settings().fast_responses:
+        rows = visible_rows(session, Task, owner_id, lambda s, where: table_rows(s, statement(where), Task))
+        return rows_json(rows, Task, compact=compact)
+    return visible_rows(session, Task, owner_id, lambda s, where: s.exec(statement(where)).all())
 
 
 @router.post("/", response_model=Task)
-def create_event(event: Task, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(2)
+def create_event(event: Task, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    check_levels(event)
     event.id = None
     event.kind = "event"
     event.owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
@@ -0,0 +1,161 @@
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from typing import Any, Iterator, List, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from ..core.fastjson import dumps
+from ..core.querybudget import query_budget
+from ..db import session_for
+from ..deps import get_current_user, iter_visible_rows
+from ..models import AiSettings, ChatMessage, Project, Task, UserSettings
+
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+SECTIONS = ("projects", "tasks", "events", "settings", "chat")
+DEFAULT_SECTIONS = "projects,tasks,events,settings"
+YIELD_PER = 1000
+FLUSH_BYTES = 64 * 1024
+# Never exported: secrets stay on the server
+EXCLUDED_COLUMNS = {AiSettings.__table__.c.openai_api_key}
+
+
+def _section_query(section: str):
+    """(record type, model, columns, statement for a visibility filter) for a section shared with global rows."""
+    if section == "projects":
+        model, kind = Project, None
+    elif section in ("tasks", "events"):
+        model, kind = Task, (Task.kind == "event") if section == "events" else (Task.kind != "event")
+    else:
+        raise ValueError(section)
+    columns = list(model.__table__.columns)
+
+    def statement(where):
+        stmt = select(*columns).where(where)
+        if kind is not None:
+            stmt = stmt.where(kind)
+        return stmt.order_by(model.id)
+
+    return section[:-1], model, columns, statement
+
+
+def _owner_queries(section: str, owner_id: Optional[int]):
+    """(record type, columns, statement) for sections holding only the caller's rows."""
+    if section == "chat":
+        columns = list(ChatMessage.__table__.columns)
+        yield "chat", columns, select(*columns).where(ChatMessage.owner_id == (owner_id or 0)).order_by(ChatMessage.id)
+        return
+    for record_type, model in (("user_settings", UserSettings), ("ai_settings", AiSettings)):
+        columns = [c for c in model.__table__.columns if c not in EXCLUDED_COLUMNS]
+        yield record_type, columns, select(*columns).where(model.owner_id == (owner_id or 0))
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def _stream(session, stmt):
+    return session.connection().execute(stmt.execution_options(stream_results=True, yield_per=YIELD_PER))
+
+
+def _records(owner_id: Optional[int], sections: Sequence[str]) -> Iterator[tuple]:
+    """Yield (record type, column names, row) with a server-side cursor, YIELD_PER rows at a time.
+
+    Projects, tasks and events are filtered like the list routes: the caller's rows, then
+    the global ones (read from shard 0 when they live apart), each by id.
+    """
+    with session_for(owner_id) as session:
+        for section in sections:
+            if section in ("projects", "tasks", "events"):
+                record_type, model, columns, statement = _section_query(section)
+                keys = [c.name for c in columns]
+                for row in iter_visible_rows(session, model, owner_id, lambda s, where: _stream(s, statement(where))):
+                    yield record_type, keys, row
+                continue
+            for record_type, columns, stmt in _owner_queries(section, owner_id):
+                keys = [c.name for c in columns]
+                for row in _stream(session, stmt):
+                    yield record_type, keys, row
+
+
+def _ndjson(records: Iterator[tuple]) -> Iterator[bytes]:
+    for record_type, keys, row in records:
+        yield dumps({"type": record_type, "data": dict(zip(keys, row))}) + b"\n"
+
+
+def _csv(records: Iterator[tuple]) -> Iterator[bytes]:
+    # Each section starts with its own header row ("type", columns...). A single
+    # tasks section is therefore a plain CSV that POST /import accepts back.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    current = None
+    for record_type, keys, row in records:
+        if record_type != current:
+            writer.writerow(["type", *keys])
+            current = record_type
+        writer.writerow([record_type, *(_cell(v) for v in row)])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _chunked(parts: Iterator[bytes]) -> Iterator[bytes]:
+    buf: List[bytes] = []
+    size = 0
+    for part in parts:
+        buf.append(part)
+        size += len(part)
+        if size >= FLUSH_BYTES:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def _gzipped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+@router.get("")
+@query_budget(None)
+def export_data(
+    current_user=Depends(get_current_user),
+    format: str = Query(default="ndjson", description="ndjson|csv"),
+    sections: str = Query(default=DEFAULT_SECTIONS, description="Comma list of projects,tasks,events,settings,chat"),
+    include_chat: bool = Query(default=False, description="Shortcut for adding the chat section"),
+    gzip: bool = Query(default=False, description="Return a .gz file compressed on the fly"),
+):
+    """Stream the caller's data with constant memory, whatever its volume."""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    chosen = [s.strip() for s in sections.split(",") if s.strip()]
+    if include_chat and "chat" not in chosen:
+        chosen.append("chat")
+    unknown = [s for s in chosen if s not in SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+
+    encode = _ndjson if format == "ndjson" else _csv
+    body = _chunked(encode(_records(owner_id, chosen)))
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    filename = f"export-{owner_id or 'anon'}-{date.today().isoformat()}.{format}"
+    if gzip:
+        body = _gzipped(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
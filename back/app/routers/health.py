@@ -1,9 +1,13 @@
 from fastapi import APIRouter
 
+from ..core.querybudget import query_budget
+
+
 router = APIRouter(tags=["health"])
 
 
 @router.get("/health")
+@query_budget(0)
 def health():
     return {"status": "ok"}
 
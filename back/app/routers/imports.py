@@ -0,0 +1,319 @@
+import codecs
+import csv
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from anyio import from_thread, to_thread
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from ..core.calendar_cache import invalidate_calendar
+from ..core.config import get_settings
+from ..core.querybudget import query_budget
+from ..db import shard_router
+from ..deps import get_current_user, get_owner_session, visible_rows
+from ..ical import iter_components, to_iso, unescape_text
+from ..models import Project, Task
+from ..schemas import ImportResult, ImportRowError
+from .tasks import _coerce_task_types
+
+
+logger = logging.getLogger("import")
+
+router = APIRouter(prefix="/import", tags=["import"])
+
+FORMATS = {"csv", "ndjson", "ics"}
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+    "text/calendar": "ics",
+}
+LEVELS = {"low", "medium", "high"}
+MAX_REPORTED_ERRORS = 1000
+
+
+class _RowError(ValueError):
+    pass
+
+
+class _DateFields:
+    # Just the attributes _coerce_task_types touches; building a full Task per row
+    # costs more than the rest of the import combined.
+    __slots__ = ("deadline", "event_start", "event_end")
+
+    def __init__(self, deadline: Any, event_start: Any, event_end: Any) -> None:
+        self.deadline = deadline
+        self.event_start = event_start
+        self.event_end = event_end
+
+
+def _split_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode ``chunks`` into ``\n``-terminated lines, ``\r\n`` folded to ``\n``.
+
+    Only ``\n`` ends a line: ``str.splitlines`` would also split on U+2028, form feeds
+    and the like, which are valid inside a JSON string or CSV field.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield (line[:-1] if line.endswith("\r") else line) + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _body_lines(request: Request) -> Iterator[str]:
+    """Decode the request body line by line; runs in a worker thread, pulling chunks from the event loop."""
+    chunks = request.stream()
+
+    async def next_chunk() -> Optional[bytes]:
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def pull() -> Iterator[bytes]:
+        while True:
+            chunk = from_thread.run(next_chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    return _split_lines(pull())
+
+
+def _csv_rows(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    reader = csv.DictReader(lines)
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, _RowError(str(e))
+            continue
+        yield reader.line_num, record
+
+
+def _ndjson_rows(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield n, _RowError(f"invalid JSON: {e}")
+            continue
+        yield n, record if isinstance(record, dict) else _RowError("expected a JSON object")
+
+
+def _ics_priority(value: str) -> str:
+    # RFC 5545 PRIORITY: 1-4 high, 5 medium, 6-9 low, 0 undefined
+    try:
+        p = int(value)
+    except ValueError:
+        return "medium"
+    if 1 <= p <= 4:
+        return "high"
+    return "low" if p >= 6 else "medium"
+
+
+def _ics_rows(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    for n, (component, props) in enumerate(iter_components(lines), 1):
+        def text(name: str) -> str:
+            return unescape_text(props[name][1]) if name in props else ""
+
+        record: Dict[str, Any] = {"title": text("SUMMARY"), "description": text("DESCRIPTION")}
+        try:
+            if component == "VEVENT":
+                record["kind"] = "event"
+                if "DTSTART" in props:
+                    record["event_start"] = to_iso(props["DTSTART"][1], props["DTSTART"][0])
+                    end = props.get("DTEND") or props["DTSTART"]
+                    record["event_end"] = to_iso(end[1], end[0])
+            else:
+                record["kind"] = "task"
+                if "DUE" in props:
+                    record["deadline"] = to_iso(props["DUE"][1], props["DUE"][0])[:10]
+                if "PRIORITY" in props:
+                    record["priority"] = _ics_priority(props["PRIORITY"][1])
+            if "CATEGORIES" in props:
+                record["project"] = text("CATEGORIES").split(",")[0].strip()
+        except (IndexError, ValueError) as e:
+            yield n, _RowError(f"invalid date: {e}")
+            continue
+        yield n, record
+
+
+PARSERS = {"csv": _csv_rows, "ndjson": _ndjson_rows, "ics": _ics_rows}
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+class _ProjectResolver:
+    """Maps project names to ids for one owner, creating missing projects on first use."""
+
+    def __init__(self, session: Session, owner_id: Optional[int]) -> None:
+        self.session = session
+        self.owner_id = owner_id
+        rows = visible_rows(session, Project, owner_id, lambda s, where: s.exec(
+            select(Project.name, Project.id, Project.owner_id).where(where)
+        ).all())
+        self.ids: Dict[str, int] = {name: pid for name, pid, owner in rows if owner == owner_id}
+        # Projects a numeric project_id may point at: the owner's own and global ones
+        self.visible: Set[int] = {pid for _, pid, _ in rows}
+        self.created = 0
+
+    def check(self, pid: int) -> int:
+        if pid not in self.visible:
+            raise _RowError(f"project {pid} does not exist")
+        return pid
+
+    def resolve(self, name: str) -> int:
+        pid = self.ids.get(name)
+        if pid is None:
+            project = Project(owner_id=self.owner_id, name=name)
+            values = dict(owner_id=project.owner_id, name=project.name, color=project.color, created_at=project.created_at)
+            if shard_router.sharded:
+                values["id"] = shard_router.new_ids(Project.__table__, 1, self.session.connection())[0]
+            result = self.session.execute(insert(Project.__table__).values(**values))
+            pid = self.ids[name] = result.inserted_primary_key[0]
+            self.visible.add(pid)
+            self.created += 1
+        return pid
+
+
+def _row_values(record: Dict[str, Any], owner_id: Optional[int], projects: _ProjectResolver) -> Dict[str, Any]:
+    title = _text(record.get("title"))
+    if not title:
+        raise _RowError("title is required")
+    kind = _text(record.get("kind")).lower() or "task"
+    if kind not in {"task", "event"}:
+        raise _RowError(f"kind must be task or event, got {kind!r}")
+    levels = {}
+    for field in ("priority", "importance"):
+        level = _text(record.get(field)).lower() or "medium"
+        if level not in LEVELS:
+            raise _RowError(f"{field} must be one of low|medium|high, got {level!r}")
+        levels[field] = level
+    raw_duration = record.get("duration_hours")
+    try:
+        duration = float(raw_duration) if _text(raw_duration) else 1.0
+    except (TypeError, ValueError):
+        raise _RowError(f"duration_hours must be a number, got {raw_duration!r}")
+
+    dates = _DateFields(*(_text(record.get(k)) or None for k in _DateFields.__slots__))
+    raw_dates = {k: getattr(dates, k) for k in _DateFields.__slots__}
+    _coerce_task_types(dates)  # type: ignore[arg-type]
+    for k, raw in raw_dates.items():
+        if raw and getattr(dates, k) is None:
+            raise _RowError(f"{k} is not an ISO date: {raw!r}")
+    if kind == "event" and (not dates.event_start or not dates.event_end):
+        raise _RowError("event_start and event_end are required for events")
+
+    values = {
+        "owner_id": owner_id,
+        "title": title,
+        "description": _text(record.get("description")),
+        "deadline": dates.deadline,
+        "duration_hours": duration,
+        "kind": kind,
+        "event_start": dates.event_start,
+        "event_end": dates.event_end,
+        "project_id": None,
+        "created_at": datetime.utcnow(),
+        **levels,
+    }
+    project_id = _text(record.get("project_id"))
+    project_name = _text(record.get("project"))
+    if project_id:
+        try:
+            pid = int(project_id)
+        except ValueError:
+            raise _RowError(f"project_id must be an integer, got {project_id!r}")
+        values["project_id"] = projects.check(pid)
+    elif project_name:
+        values["project_id"] = projects.resolve(project_name)
+    return values
+
+
+def run_import(session: Session, owner_id: Optional[int], fmt: str, lines: Iterable[str], batch_size: int) -> ImportResult:
+    """Parse, validate and insert rows in batched transactions; bad rows are reported, not fatal."""
+    started = time.perf_counter()
+    projects = _ProjectResolver(session, owner_id)
+    batch: List[Dict[str, Any]] = []
+    errors: List[ImportRowError] = []
+    rows = created = failed = batches = 0
+
+    def flush() -> None:
+        nonlocal created, batches
+        if batch:
+            if shard_router.sharded:
+                # Bulk inserts skip the ORM's before_insert, which gives ids unique across shards
+                for values, task_id in zip(batch, shard_router.new_ids(Task.__table__, len(batch), session.connection())):
+                    values["id"] = task_id
+            session.execute(insert(Task.__table__), batch)
+            created += len(batch)
+            batch.clear()
+        session.commit()
+        invalidate_calendar(owner_id)
+        batches += 1
+        logger.info("Import owner_id=%s: %s rows read, %s tasks created, %s failed", owner_id, rows, created, failed)
+
+    for row_no, record in PARSERS[fmt](lines):
+        rows += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append(_row_values(record, owner_id, projects))
+        except _RowError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(ImportRowError(row=row_no, error=str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch or projects.created:
+        flush()
+
+    return ImportResult(
+        format=fmt,
+        rows=rows,
+        created_tasks=created,
+        created_projects=projects.created,
+        failed=failed,
+        batches=batches,
+        seconds=round(time.perf_counter() - started, 3),
+        errors=errors,
+        errors_truncated=failed > len(errors),
+    )
+
+
+@router.post("", response_model=ImportResult)
+@query_budget(None)
+async def import_tasks(
+    request: Request,
+    session: Session = Depends(get_owner_session),
+    current_user=Depends(get_current_user),
+    format: Optional[str] = Query(default=None, description="csv|ndjson|ics; defaults from Content-Type"),
+    batch_size: Optional[int] = Query(default=None, ge=1, le=50000, description="Rows per transaction"),
+):
+    """Stream a CSV, NDJSON or iCalendar body into tasks and events without buffering it."""
+    fmt = (format or CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip().lower(), "")).lower()
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be one of csv|ndjson|ics")
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    size = batch_size or get_settings().import_batch_size
+    return await to_thread.run_sync(run_import, session, owner_id, fmt, _body_lines(request), size)
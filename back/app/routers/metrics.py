@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+
+from ..core.metrics import CONTENT_TYPE, register_collector, render, threadpool_queue_collector
+from ..core.querybudget import query_budget
+
+
+router = APIRouter(tags=["metrics"])
+register_collector(threadpool_queue_collector)
+
+
+@router.get("/metrics", include_in_schema=False)
+@query_budget(0)
+async def metrics():
+    return Response(content=render(), media_type=CONTENT_TYPE)
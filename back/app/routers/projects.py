@@ -1,25 +1,93 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlmodel import Session, select
-from sqlalchemy import delete as sa_delete
-from typing import List
+from sqlalchemy import and_, case, delete as sa_delete, func
+from typing import List, Union
 
-from ..db import get_session
-from ..deps import get_current_user
+from ..core.calendar_cache import invalidate_calendar
+from ..core.config import get_settings
+from ..core.fastjson import dumps, rows_as_dicts, rows_json, table_rows
+from ..core.querybudget import query_budget
+from ..deps import get_current_user, get_owner_session, global_rows_apart, visible_row, visible_rows, visible_to, wants_compact
 from ..models import Project, Task
+from ..schemas import ProjectWithStats
 
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
+# Tasks removed per transaction when deleting a project; keeps each SQLite write lock short
+DELETE_CHUNK = 2000
+
+
+STAT_KEYS = ("total", "overdue", "remaining_hours")
+
+
+def _task_totals():
+    is_task = Task.kind != "event"
+    return (
+        func.count(Task.id).label("total"),
+        func.coalesce(func.sum(case((and_(is_task, Task.deadline < date.today()), 1), else_=0)), 0).label("overdue"),
+        func.coalesce(func.sum(case((is_task, Task.duration_hours), else_=0)), 0).label("remaining_hours"),
+    )
+
+
+def _project_stats(session: Session, owner_id, where):
+    """Projects matching ``where`` with task totals, overdue counts and remaining hours, from one grouped LEFT JOIN."""
+    columns = list(Project.__table__.columns)
+    stmt = (
+        select(*columns, *_task_totals())
+        .select_from(Project)
+        .outerjoin(Task, and_(Task.project_id == Project.id, visible_to(Task, owner_id)))
+        .where(where)
+        .group_by(Project.id)
+    )
+    keys = [c.name for c in columns] + list(STAT_KEYS)
+    return rows_as_dicts(keys, session.execute(stmt))
+
+
+def _sharded_project_stats(session: Session, owner_id):
+    """``_project_stats`` across shards: a global project on shard 0 has tasks on the owner's shard too,
+    so projects and per-project task totals are read on each side and added up."""
+    columns = list(Project.__table__.columns)
+    projects = visible_rows(session, Project, owner_id, lambda s, where: table_rows(s, select(*columns).where(where), Project))
+    totals = visible_rows(session, Task, owner_id, lambda s, where: s.execute(
+        select(Task.project_id, *_task_totals()).where(where, Task.project_id.is_not(None)).group_by(Task.project_id)
+    ).all())
+    by_project = {}
+    for project_id, *values in totals:
+        summed = by_project.setdefault(project_id, [0] * len(STAT_KEYS))
+        for i, value in enumerate(values):
+            summed[i] += value
+    zero = [0] * len(STAT_KEYS)
+    return [dict(project, **dict(zip(STAT_KEYS, by_project.get(project["id"], zero)))) for project in projects]
 
-@router.get("/", response_model=List[Project])
-def list_projects(session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+
+# with_stats=1 lists ProjectWithStats (encoded directly, like the fast list responses)
+@router.get("/", response_model=Union[List[Project], List[ProjectWithStats]])
+@query_budget(4)  # 1 unless sharded: projects, then task totals, from the owner's shard and shard 0
+def list_projects(
+    session: Session = Depends(get_owner_session),
+    current_user=Depends(get_current_user),
+    compact: bool = Depends(wants_compact),
+    with_stats: bool = Query(default=False, description="Add total, overdue and remaining_hours per project"),
+):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
-    statement = select(Project).where((Project.owner_id == owner_id) | (Project.owner_id.is_(None)))
-    return session.exec(statement).all()
+    if with_stats:
+        if global_rows_apart(owner_id):
+            rows = _sharded_project_stats(session, owner_id)
+        else:
+            rows = _project_stats(session, owner_id, visible_to(Project, owner_id))
+        return Response(content=dumps(rows), media_type="application/json")
+    if compact or get_settings().fast_responses:
+        rows = visible_rows(session, Project, owner_id, lambda s, where: table_rows(s, select(Project).where(where), Project))
+        return rows_json(rows, Project, compact=compact)
+    return visible_rows(session, Project, owner_id, lambda s, where: s.exec(select(Project).where(where)).all())
 
 
 @router.post("/", response_model=Project)
-def create_project(project: Project, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(2)
+def create_project(project: Project, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     project.id = None
     project.owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     session.add(project)
@@ -29,22 +97,32 @@ def create_project(project: Project, session: Session = Depends(get_session), cu
 
 
 @router.get("/{project_id}", response_model=Project)
-def get_project(project_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    project = session.get(Project, project_id)
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    return project
+@query_budget(2)  # 1 unless sharded: a global project is read from shard 0
+def get_project(project_id: int, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    with visible_row(session, Project, project_id, owner_id) as (project, _):
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return project
 
 
 @router.delete("/{project_id}")
-def delete_project(project_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(None)  # one statement per DELETE_CHUNK tasks
+def delete_project(project_id: int, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     project = session.get(Project, project_id)
-    if not project:
+    if not project or project.owner_id != owner_id:
         raise HTTPException(status_code=404, detail="Project not found")
-    # Delete all tasks linked to this project, then delete the project itself
-    session.exec(sa_delete(Task).where(Task.project_id == project_id))
-    session.delete(project)
+    # Delete linked tasks in indexed chunks, committing between them so other writers
+    # get the SQLite lock, then the project itself. Bulk deletes skip the ORM (and its
+    # lazy load of Project.tasks), so the calendar is invalidated once at the end.
+    chunk = select(Task.id).where(Task.project_id == project_id).limit(DELETE_CHUNK).scalar_subquery()
+    while True:
+        deleted = session.exec(sa_delete(Task).where(Task.id.in_(chunk))).rowcount
+        session.commit()
+        if deleted < DELETE_CHUNK:
+            break
+    session.exec(sa_delete(Project).where(Project.id == project_id))
     session.commit()
+    invalidate_calendar(owner_id)
     return {"ok": True}
-
-
@@ -1,17 +1,22 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 
-from ..db import get_session
-from ..deps import get_current_user
-from ..models import UserSettings, AiSettings
-from ..schemas import AiSettingsUpdate
+from ..core.ai import invalidate_ai_settings, resolve_ai_settings
+from ..core.config import get_settings
+from ..core.querybudget import query_budget
+from ..deps import get_current_user, get_owner_session
+from ..models import UserSettings, AiSettings, ReminderSettings
+from ..schemas import AiSettingsRead, AiSettingsUpdate, ReminderSettingsUpdate
 
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 
 @router.get("/me", response_model=UserSettings)
-def get_my_settings(session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(3)
+def get_my_settings(session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     settings = session.exec(select(UserSettings).where(UserSettings.owner_id == owner_id)).first()
     if not settings:
@@ -23,7 +28,8 @@ def get_my_settings(session: Session = Depends(get_session), current_user=Depend
 
 
 @router.put("/me", response_model=UserSettings)
-def update_my_settings(update: UserSettings, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(3)
+def update_my_settings(update: UserSettings, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     settings = session.exec(select(UserSettings).where(UserSettings.owner_id == owner_id)).first()
     if not settings:
@@ -40,25 +46,17 @@ def update_my_settings(update: UserSettings, session: Session = Depends(get_sess
     return settings
 
 
-
-@router.get("/ai", response_model=AiSettings)
-def get_ai_settings(session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@router.get("/ai", response_model=AiSettingsRead)
+@query_budget(4)
+def get_ai_settings(session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
-    owner_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == owner_id)).first()
-    global_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == 0)).first()
-    def has_key(s: AiSettings | None) -> bool:
-        return bool(s and s.openai_api_key and len(s.openai_api_key) > 0)
-    chosen = owner_settings if has_key(owner_settings) else (global_settings if has_key(global_settings) else (owner_settings or global_settings))
-    if not chosen:
-        chosen = AiSettings(owner_id=owner_id or 0)
-        session.add(chosen)
-        session.commit()
-        session.refresh(chosen)
-    return chosen
+    resolved = resolve_ai_settings(session, owner_id)
+    return AiSettingsRead(owner_id=resolved.owner_id, openai_api_key=resolved.api_key, openai_model=resolved.model)
 
 
 @router.put("/ai", response_model=AiSettings)
-def update_ai_settings(update: AiSettingsUpdate, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(3)
+def update_ai_settings(update: AiSettingsUpdate, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     settings = session.exec(select(AiSettings).where(AiSettings.owner_id == owner_id)).first()
     if not settings:
@@ -81,5 +79,34 @@ def update_ai_settings(update: AiSettingsUpdate, session: Session = Depends(get_
     session.add(settings)
     session.commit()
     session.refresh(settings)
+    invalidate_ai_settings(settings.owner_id)
+    return settings
+
+
+def _reminder_settings(session: Session, owner_id: int) -> ReminderSettings:
+    settings = session.exec(select(ReminderSettings).where(ReminderSettings.owner_id == owner_id)).first()
+    if not settings:
+        settings = ReminderSettings(owner_id=owner_id, utc_offset_minutes=get_settings().reminder_utc_offset_minutes)
     return settings
 
+
+@router.get("/reminders", response_model=ReminderSettings)
+@query_budget(1)
+def get_reminder_settings(session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else 0
+    return _reminder_settings(session, owner_id)
+
+
+@router.put("/reminders", response_model=ReminderSettings)
+@query_budget(3)
+def update_reminder_settings(update: ReminderSettingsUpdate, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    if current_user.get("id") is None:
+        raise HTTPException(status_code=400, detail="Reminders need a signed-in user")
+    settings = _reminder_settings(session, int(current_user["id"]))
+    for k, v in update.dict(exclude_unset=True, exclude_none=True).items():
+        setattr(settings, k, v)
+    settings.updated_at = datetime.utcnow()
+    session.add(settings)
+    session.commit()
+    session.refresh(settings)
+    return settings
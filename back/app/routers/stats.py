@@ -1,9 +1,11 @@
 from datetime import date
 from fastapi import APIRouter, Depends
+from sqlalchemy import case
 from sqlmodel import Session, select, func
 
-from ..db import get_session
-from ..deps import get_current_user
+from ..core.compression import compression_stats
+from ..core.querybudget import query_budget
+from ..deps import get_current_user, get_owner_session, visible_rows
 from ..models import Task
 
 
@@ -11,10 +13,15 @@ router = APIRouter(prefix="/stats", tags=["stats"])
 
 
 @router.get("/summary")
-def stats_summary(session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(2)  # 1 unless sharded: the global rows are counted on shard 0
+def stats_summary(session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
-    total = session.exec(select(func.count()).select_from(Task).where((Task.owner_id == owner_id) | (Task.owner_id.is_(None)))).one()
-    overdue = session.exec(select(func.count()).select_from(Task).where(Task.deadline < date.today())).one()
-    return {"total": total, "overdue": overdue}
+    counts = select(func.count(), func.coalesce(func.sum(case((Task.deadline < date.today(), 1), else_=0)), 0))
+    parts = visible_rows(session, Task, owner_id, lambda s, where: s.exec(counts.select_from(Task).where(where)).all())
+    return {"total": sum(total for total, _ in parts), "overdue": sum(overdue for _, overdue in parts)}
 
 
+@router.get("/compression")
+@query_budget(0)
+def stats_compression():
+    return compression_stats()
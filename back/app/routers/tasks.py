@@ -1,32 +1,46 @@
 from datetime import date, datetime
+from operator import attrgetter, itemgetter
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import union_all
 from sqlmodel import Session, select
 
-from ..db import get_session
-from ..deps import get_current_user
-from ..models import Task, TaskUpdate
+from ..core.config import get_settings
+from ..core.fastjson import dumps, rows_as_dicts, rows_json, table_rows
+from ..core.querybudget import query_budget
+from ..db import global_session
+from ..deps import check_levels, get_current_user, get_owner_session, global_rows_apart, visible_row, visible_rows, wants_compact
+from ..models import LEVEL_CODES, LEVELS, Task, TaskUpdate
 
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
 @router.get("/", response_model=List[Task])
+@query_budget(2)  # 1 unless sharded: the global rows are read from shard 0
 def list_tasks(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_owner_session),
     current_user=Depends(get_current_user),
     project_id: Optional[int] = None,
     day: Optional[date] = Query(default=None, description="Filter by deadline date"),
+    compact: bool = Depends(wants_compact),
 ):
     owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
-    statement = select(Task).where((Task.owner_id == owner_id) | (Task.owner_id.is_(None)))
-    if project_id is not None:
-        statement = statement.where(Task.project_id == project_id)
-    if day is not None:
-        statement = statement.where(Task.deadline == day)
-    statement = statement.order_by(Task.created_at.desc())
-    return session.exec(statement).all()
+
+    def statement(where):
+        statement = select(Task).where(where)
+        if project_id is not None:
+            statement = statement.where(Task.project_id == project_id)
+        if day is not None:
+            statement = statement.where(Task.deadline == day)
+        return statement.order_by(Task.created_at.desc())
+
+    if compact or get_settings().fast_responses:
+        rows = visible_rows(session, Task, owner_id, lambda s, where: table_rows(s, statement(where), Task))
+        return rows_json(sorted(rows, key=itemgetter("created_at"), reverse=True), Task, compact=compact)
+    tasks = visible_rows(session, Task, owner_id, lambda s, where: s.exec(statement(where)).all())
+    return sorted(tasks, key=attrgetter("created_at"), reverse=True)
 
 
 def _coerce_task_types(task: Task) -> None:
@@ -51,7 +65,9 @@ def _coerce_task_types(task: Task) -> None:
 
 
 @router.post("/", response_model=Task)
-def create_task(task: Task, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+@query_budget(2)
+def create_task(task: Task, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    check_levels(task)
     task.id = None
     task.owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
     _coerce_task_types(task)
@@ -61,48 +77,118 @@ def create_task(task: Task, session: Session = Depends(get_session), current_use
     return task
 
 
+# Eisenhower quadrants: important = importance high, urgent = priority high.
+# Each is a set of (importance, priority) cells, listed in the order they rank.
+HIGH = LEVEL_CODES["high"]
+LOWER = [code for code in reversed(range(len(LEVELS))) if code != HIGH]
+QUADRANTS = {
+    "do_first": [(HIGH, HIGH)],
+    "schedule": [(HIGH, p) for p in LOWER],
+    "delegate": [(i, HIGH) for i in LOWER],
+    "eliminate": [(i, p) for i in LOWER for p in LOWER],
+}
+
+
+def _cell_queries(owner_id: Optional[int], importance: int, priority: int, limit: int):
+    """Top ``limit`` tasks of one cell for each visible owner key: dated ones by deadline, then undated."""
+    columns = list(Task.__table__.columns)
+    # The same rows as visible_to, one index seek per owner key
+    if owner_id is None:
+        owners = [Task.owner_id.is_(None)]
+    elif global_rows_apart(owner_id):
+        owners = [Task.owner_id == owner_id]
+    else:
+        owners = [Task.owner_id == owner_id, Task.owner_id.is_(None)]
+    for owner in owners:
+        # Equality on (owner_id, importance, priority) plus deadline order walks ix_task_matrix directly
+        base = select(*columns).where(owner, Task.importance == importance, Task.priority == priority, Task.kind != "event")
+        yield base.where(Task.deadline.is_not(None)).order_by(Task.deadline).limit(limit).subquery().select()
+        yield base.where(Task.deadline.is_(None)).order_by(Task.id).limit(limit).subquery().select()
+
+
+@router.get("/matrix")
+@query_budget(2)  # 1 unless sharded: the global rows are read from shard 0
+def tasks_matrix(
+    session: Session = Depends(get_owner_session),
+    current_user=Depends(get_current_user),
+    limit: int = Query(default=10, ge=1, le=100, description="Tasks per quadrant"),
+):
+    """Top tasks per Eisenhower quadrant, ranked by importance, priority, then deadline (undated last)."""
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    cells = [cell for quadrant in QUADRANTS.values() for cell in quadrant]
+    keys = [c.name for c in Task.__table__.columns]
+
+    def top_rows(s: Session, owner: Optional[int]):
+        return rows_as_dicts(keys, s.execute(union_all(*(q for i, p in cells for q in _cell_queries(owner, i, p, limit)))))
+
+    rows = top_rows(session, owner_id)
+    if global_rows_apart(owner_id):
+        with global_session(session) as home:
+            rows += top_rows(home, None)
+    by_cell = {}
+    for row in rows:
+        by_cell.setdefault((LEVEL_CODES[row["importance"]], LEVEL_CODES[row["priority"]]), []).append(row)
+
+    def rank(row):
+        return row["deadline"] is None, row["deadline"] or date.max, row["id"]
+
+    result = {}
+    for name, quadrant in QUADRANTS.items():
+        rows = []
+        for cell in quadrant:
+            rows.extend(sorted(by_cell.get(cell, []), key=rank))
+            if len(rows) >= limit:
+                break
+        result[name] = rows[:limit]
+    return Response(content=dumps(result), media_type="application/json")
+
+
 @router.get("/{task_id}", response_model=Task)
-def get_task(task_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    task = session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return task
+@query_budget(2)  # 1 unless sharded: a global task is read from shard 0
+def get_task(task_id: int, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    with visible_row(session, Task, task_id, owner_id) as (task, _):
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return task
 
 
 @router.put("/{task_id}", response_model=Task)
-def update_task(task_id: int, task_update: TaskUpdate, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    task = session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    data = task_update.dict(exclude_unset=True)
-    # coerce known fields
-    if isinstance(data.get("deadline"), str):
-        try:
-            data["deadline"] = date.fromisoformat(data["deadline"]) if data["deadline"] else None
-        except Exception:
-            data["deadline"] = None
-    for key in ("event_start", "event_end"):
-        if isinstance(data.get(key), str):
+@query_budget(4)  # 3 unless sharded: a global task is read from shard 0
+def update_task(task_id: int, task_update: TaskUpdate, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    with visible_row(session, Task, task_id, owner_id) as (task, home):
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        data = task_update.dict(exclude_unset=True)
+        # coerce known fields
+        if isinstance(data.get("deadline"), str):
             try:
-                s = data[key].replace("Z", "+00:00") if data[key] else None
-                data[key] = datetime.fromisoformat(s) if s else None
+                data["deadline"] = date.fromisoformat(data["deadline"]) if data["deadline"] else None
             except Exception:
-                data[key] = None
-    for k, v in data.items():
-        setattr(task, k, v)
-    session.add(task)
-    session.commit()
-    session.refresh(task)
-    return task
+                data["deadline"] = None
+        for key in ("event_start", "event_end"):
+            if isinstance(data.get(key), str):
+                try:
+                    s = data[key].replace("Z", "+00:00") if data[key] else None
+                    data[key] = datetime.fromisoformat(s) if s else None
+                except Exception:
+                    data[key] = None
+        for k, v in data.items():
+            setattr(task, k, v)
+        home.add(task)
+        home.commit()
+        home.refresh(task)
+        return task
 
 
 @router.delete("/{task_id}")
-def delete_task(task_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    task = session.get(Task, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    session.delete(task)
-    session.commit()
+@query_budget(3)  # 2 unless sharded: a global task is read from shard 0
+def delete_task(task_id: int, session: Session = Depends(get_owner_session), current_user=Depends(get_current_user)):
+    owner_id = int(current_user.get("id")) if current_user.get("id") is not None else None
+    with visible_row(session, Task, task_id, owner_id) as (task, home):
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        home.delete(task)
+        home.commit()
     return {"ok": True}
-
-
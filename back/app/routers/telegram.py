@@ -2,27 +2,29 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
 from datetime import datetime
+import time
 
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request
+from sqlmodel import Session, delete, select
 
+from ..core.admission import LlmBusy, chat_completion
+from ..core.ai import openai_available, resolve_ai_settings
 from ..core.config import get_settings
-from ..db import get_session
-from ..models import ChatMessage, AiSettings, Task, Project
+from ..core.coordination import LockTimeout, get_coordinator
+from ..core.metrics import OPENAI_LATENCY, TELEGRAM_SEND_LATENCY, record_openai_usage
+from ..core.querybudget import query_budget
+from ..db import session_for
+from ..deps import visible_rows
+from ..models import ChatMessage, Task, Project
 import logging
 
 logger = logging.getLogger("tg-webhook")
 
-try:
-    # openai>=1.0 client
-    from openai import OpenAI  # type: ignore
-except Exception:  # pragma: no cover - optional at runtime
-    OpenAI = None  # type: ignore
-
-
 router = APIRouter(prefix="/telegram", tags=["telegram"])
 
+BUSY_REPLY = "Сейчас слишком много запросов к ChatGPT. Попробуйте ещё раз через минуту."
+CHAT_BUSY_REPLY = "Ещё отвечаю на предыдущее сообщение. Отправьте это ещё раз чуть позже."
+
 
 def _reply_keyboard() -> Dict[str, Any]:
     # Regular keyboard (not inline)
@@ -37,20 +39,30 @@ async def _tg_send_message(chat_id: int, text: str) -> None:
     settings = get_settings()
     if not settings.telegram_bot_token:
         return
-    url = f"https://api.telegram.org/bot{settings.telegram_bot_token}/sendMessage"
-    async with httpx.AsyncClient(timeout=20) as client:
-        await client.post(url, json={
-            "chat_id": chat_id,
-            "text": text,
-            "reply_markup": _reply_keyboard(),
-        })
+    import httpx  # deferred with openai: only the webhook path sends
+
+    url = f"{settings.telegram_api_base}/bot{settings.telegram_bot_token}/sendMessage"
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        async with httpx.AsyncClient(timeout=20) as client:
+            resp = await client.post(url, json={
+                "chat_id": chat_id,
+                "text": text,
+                "reply_markup": _reply_keyboard(),
+            })
+        outcome = "ok" if resp.is_success else str(resp.status_code)
+    finally:
+        TELEGRAM_SEND_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
 
 
 async def _tg_set_webhook() -> None:
     settings = get_settings()
     if not settings.telegram_bot_token or not settings.public_url:
         return
-    url = f"https://api.telegram.org/bot{settings.telegram_bot_token}/setWebhook"
+    import httpx
+
+    url = f"{settings.telegram_api_base}/bot{settings.telegram_bot_token}/setWebhook"
     webhook_url = settings.public_url.rstrip("/") + "/telegram/webhook"
     async with httpx.AsyncClient(timeout=20) as client:
         await client.post(url, json={"url": webhook_url})
@@ -59,9 +71,10 @@ async def _tg_set_webhook() -> None:
 def _build_tasks_context(session: Session, owner_id: Optional[int]) -> str:
     # Include tasks for owner or global (owner_id is null)
     statement = select(Task, Project).join(Project, isouter=True)
-    if owner_id is not None:
-        statement = statement.where((Task.owner_id == owner_id) | (Task.owner_id.is_(None)))
-    rows = session.exec(statement).all()
+    if owner_id is None:
+        rows = session.exec(statement).all()
+    else:
+        rows = visible_rows(session, Task, owner_id, lambda s, where: s.exec(statement.where(where)).all())
     lines: List[str] = []
     for task, project in rows:
         lines.append(
@@ -85,24 +98,6 @@ def _build_tasks_context(session: Session, owner_id: Optional[int]) -> str:
     return "\n".join(["Текущие открытые задачи:"] + lines)
 
 
-def _get_ai_settings(session: Session, owner_id: Optional[int]) -> AiSettings:
-    owner_settings = None
-    if owner_id is not None:
-        owner_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == owner_id)).first()
-    global_settings = session.exec(select(AiSettings).where(AiSettings.owner_id == 0)).first()
-
-    def has_key(s: Optional[AiSettings]) -> bool:
-        return bool(s and s.openai_api_key and len(s.openai_api_key) > 0)
-
-    chosen = owner_settings if has_key(owner_settings) else (global_settings if has_key(global_settings) else (owner_settings or global_settings))
-    if not chosen:
-        chosen = AiSettings(owner_id=owner_id or 0)
-        session.add(chosen)
-        session.commit()
-        session.refresh(chosen)
-    return chosen
-
-
 def _estimate_context_usage_chars(messages: List[Dict[str, str]], max_chars: int) -> float:
     total = 0
     for m in messages:
@@ -110,24 +105,23 @@ def _estimate_context_usage_chars(messages: List[Dict[str, str]], max_chars: int
     return total / max_chars if max_chars > 0 else 0.0
 
 
-@router.post("/webhook")
-async def telegram_webhook(req: Request, session: Session = Depends(get_session)):
-    body = await req.json()
-    logger.info("Webhook update received: keys=%s", list(body.keys()))
-    message = (body.get("message") or body.get("edited_message") or {})
-    if not message:
-        logger.debug("No message in update")
-        return {"ok": True}
-    chat = message.get("chat") or {}
-    chat_id = chat.get("id")
+def _update_message(body: Dict[str, Any]) -> Dict[str, Any]:
+    return body.get("message") or body.get("edited_message") or {}
+
+
+def _sender_id(message: Dict[str, Any]) -> Optional[int]:
     from_user = message.get("from") or {}
-    owner_id = int(from_user.get("id")) if from_user.get("id") is not None else None
-    text = message.get("text") or ""
-    logger.info("Incoming webhook message from=%s chat=%s len=%s", owner_id, chat_id, len(text))
+    return int(from_user.get("id")) if from_user.get("id") is not None else None
 
-    if not chat_id:
-        return {"ok": True}
 
+async def _sender_session(req: Request):
+    """Session on the sender's shard (Starlette caches the parsed body for the handler)."""
+    body = await req.json()
+    with session_for(_sender_id(_update_message(body))) as session:
+        yield session
+
+
+async def _handle_message(session: Session, chat_id: int, owner_id: Optional[int], text: str) -> None:
     # /start greeting
     if text.strip().lower().startswith("/start"):
         await _tg_send_message(chat_id, (
@@ -136,18 +130,16 @@ async def telegram_webhook(req: Request, session: Session = Depends(get_session)
             "— Нажмите кнопку \"Очистить контекст\" чтобы начать заново."
         ))
         logger.debug("Handled /start")
-        return {"ok": True}
+        return
 
     # Handle clear context command via regular keyboard
     if text.strip().lower() in {"очистить контекст", "/clear", "clear"}:
-        # Bulk delete by querying first to avoid FULL DELETE without filter
-        msgs = session.exec(select(ChatMessage).where(ChatMessage.owner_id == (owner_id or 0))).all()
-        for m in msgs:
-            session.delete(m)
+        # One filtered DELETE instead of loading and deleting row by row
+        removed = session.exec(delete(ChatMessage).where(ChatMessage.owner_id == (owner_id or 0))).rowcount
         session.commit()
-        logger.info("Cleared context for owner_id=%s, removed=%s", owner_id, len(msgs))
+        logger.info("Cleared context for owner_id=%s, removed=%s", owner_id, removed)
         await _tg_send_message(chat_id, "Контекст очищен.")
-        return {"ok": True}
+        return
 
     # Persist user message
     if text:
@@ -155,15 +147,15 @@ async def telegram_webhook(req: Request, session: Session = Depends(get_session)
         session.commit()
 
     # Fetch AI settings
-    ai = _get_ai_settings(session, owner_id)
-    logger.info("AiSettings: owner_id=%s has_key=%s model=%s", ai.owner_id, bool(ai.openai_api_key), ai.openai_model)
-    if not ai.openai_api_key:
+    ai = resolve_ai_settings(session, owner_id)
+    logger.info("AiSettings: owner_id=%s has_key=%s model=%s", ai.owner_id, bool(ai.api_key), ai.model)
+    if not ai.api_key:
         await _tg_send_message(chat_id, "Не задан API токен ChatGPT. Задайте его в настройках приложения.")
-        return {"ok": True}
+        return
 
-    if OpenAI is None:
+    if not openai_available():
         await _tg_send_message(chat_id, "OpenAI клиент не установлен на сервере.")
-        return {"ok": True}
+        return
 
     # Build context: system with tasks + recent chat history
     system_context = _build_tasks_context(session, owner_id)
@@ -180,18 +172,28 @@ async def telegram_webhook(req: Request, session: Session = Depends(get_session)
         await _tg_send_message(chat_id, "Внимание: контекст диалога достиг 85% от лимита. Рекомендуется очистить контекст.")
 
     # Call OpenAI
+    model = ai.model or "gpt-4o"
+    started = time.perf_counter()
     try:
-        client = OpenAI(api_key=ai.openai_api_key)
-        completion = client.chat.completions.create(
-            model=ai.openai_model or "gpt-4o",
+        completion = await chat_completion(
+            ai.api_key,
+            owner_id,
+            model=model,
             messages=messages,
             temperature=0.2,
         )
         answer = completion.choices[0].message.content or ""
+        OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="ok")
+        record_openai_usage(model, getattr(completion, "usage", None))
+    except LlmBusy:
+        OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="busy")
+        await _tg_send_message(chat_id, BUSY_REPLY)
+        return
     except Exception as e:  # runtime robustness
+        OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="error")
         logger.exception("OpenAI call failed: %s", e)
         await _tg_send_message(chat_id, f"Ошибка при обращении к ChatGPT API: {e}")
-        return {"ok": True}
+        return
 
     # Persist assistant message
     session.add(ChatMessage(owner_id=owner_id or 0, role="assistant", content=answer, created_at=datetime.utcnow()))
@@ -199,10 +201,51 @@ async def telegram_webhook(req: Request, session: Session = Depends(get_session)
 
     await _tg_send_message(chat_id, answer)
     logger.info("Answer sent len=%s", len(answer))
+
+
+@router.post("/webhook")
+@query_budget(8)
+async def telegram_webhook(req: Request, session: Session = Depends(_sender_session)):
+    body = await req.json()
+    logger.info("Webhook update received: keys=%s", list(body.keys()))
+    message = _update_message(body)
+    if not message:
+        logger.debug("No message in update")
+        return {"ok": True}
+    chat = message.get("chat") or {}
+    chat_id = chat.get("id")
+    owner_id = _sender_id(message)
+    text = message.get("text") or ""
+    logger.info("Incoming webhook message from=%s chat=%s len=%s", owner_id, chat_id, len(text))
+
+    if not chat_id:
+        return {"ok": True}
+
+    settings = get_settings()
+    coordinator = get_coordinator()
+    # Telegram redelivers an update until it gets a 2xx; any worker may receive the retry
+    update_id = body.get("update_id")
+    update_key = f"telegram:update:{update_id}"
+    if update_id is not None and not await coordinator.claim(update_key, settings.webhook_dedup_ttl):
+        logger.info("Duplicate update %s ignored", update_id)
+        return {"ok": True}
+    try:
+        # One update per chat at a time, so history is written and answered in order
+        async with coordinator.lock(f"telegram:chat:{chat_id}", ttl=settings.chat_lock_ttl, timeout=settings.chat_lock_wait):
+            await _handle_message(session, chat_id, owner_id, text)
+    except LockTimeout:
+        # Holding the request (and Telegram's delivery queue) for a long turn helps nobody
+        logger.warning("Chat %s busy; update %s dropped with a busy reply", chat_id, update_id)
+        await _tg_send_message(chat_id, CHAT_BUSY_REPLY)
+    except Exception:
+        # Let the redelivery be handled
+        await coordinator.unclaim(update_key)
+        raise
     return {"ok": True}
 
 
 @router.get("/set_webhook")
+@query_budget(0)
 async def set_webhook():
     await _tg_set_webhook()
     return {"ok": True}
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends
 
+from ..core.querybudget import query_budget
 from ..deps import get_current_user
 from ..schemas import MeResponse
 
@@ -8,6 +9,7 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me", response_model=MeResponse)
+@query_budget(0)
 def me(current_user=Depends(get_current_user)):
     return {"user": current_user}
 
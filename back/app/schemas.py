@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Any, Dict, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 
 class AuthRequest(BaseModel):
@@ -28,3 +29,45 @@ class AiSettingsUpdate(BaseModel):
     openai_api_key: Optional[str] = None
     openai_model: Optional[str] = None
 
+
+class AiSettingsRead(BaseModel):
+    """The caller's effective AI settings: their own row, else the global one (``owner_id`` 0)."""
+    owner_id: int
+    openai_api_key: Optional[str] = None
+    openai_model: str
+
+
+class ReminderSettingsUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    utc_offset_minutes: Optional[int] = Field(default=None, ge=-14 * 60, le=14 * 60)
+    quiet_start: Optional[int] = Field(default=None, ge=0, le=23)
+    quiet_end: Optional[int] = Field(default=None, ge=0, le=23)
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    format: str
+    rows: int
+    created_tasks: int
+    created_projects: int
+    failed: int
+    batches: int
+    seconds: float
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+
+
+class ProjectWithStats(BaseModel):
+    """A project as listed by ``GET /projects/?with_stats=1``."""
+    id: int
+    owner_id: Optional[int] = None
+    name: str
+    color: str
+    created_at: datetime
+    total: int = Field(description="Tasks and events in the project")
+    overdue: int = Field(description="Tasks whose deadline has passed")
+    remaining_hours: float = Field(description="Sum of duration_hours over tasks")
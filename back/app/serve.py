@@ -0,0 +1,29 @@
+"""Serve the API with ``WORKERS`` uvicorn processes: ``python -m app.serve``.
+
+Workers share state through the coordination backend (``COORDINATION_URL``); an
+in-memory backend is refused when there is more than one.
+"""
+import logging
+import os
+
+import uvicorn
+
+from .core.config import get_settings
+from .core.coordination import MemoryCoordinator, get_coordinator
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    workers = get_settings().workers
+    if workers > 1 and isinstance(get_coordinator(), MemoryCoordinator):
+        raise SystemExit("WORKERS > 1 needs a shared COORDINATION_URL (sqlite:///path or redis://...)")
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
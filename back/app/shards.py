@@ -0,0 +1,257 @@
+"""Shard maintenance: cross-shard aggregates and moving owners between shards.
+
+Run from ``back/``::
+
+    python -m app.shards status
+    python -m app.shards sync                  # directory routing: record where existing owners live
+    python -m app.shards move OWNER SHARD      # directory routing
+    python -m app.shards rebalance [--dry-run] [--max-moves N]
+
+A move copies the owner's rows to the target shard in one transaction, repoints the
+directory, then deletes the originals. Row ids are kept unless they are taken on the
+target, in which case those rows are renumbered. Run moves while the API and bot are
+stopped or idle for the moved owners. Workers sharing the coordination backend
+(``COORDINATION_URL``) drop their cached directory entry at once; others keep it for
+up to ``SHARD_DIRECTORY_TTL`` seconds.
+"""
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select, union
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from .core.coordination import get_coordinator
+from .db import ShardRouter, hash_shard, init_shards, shard_router
+from .models import AiSettings, ChatMessage, Project, ReminderSettings, SentReminder, ShardAssignment, Task, UserSettings
+
+
+logger = logging.getLogger("shards")
+
+# Every table with per-owner rows, parents before children
+OWNER_TABLES = (Project, Task, ChatMessage, UserSettings, AiSettings, ReminderSettings, SentReminder)
+# Tables whose row counts stand in for an owner's load when balancing
+LOAD_TABLES = (Task, ChatMessage)
+COUNTED_TABLES = (Project, Task, ChatMessage)
+ID_CHUNK = 500
+
+Move = Tuple[int, int, int]  # owner_id, source shard, target shard
+
+
+def _owners_query():
+    # Owner 0 / NULL are the global rows, which always stay on shard 0
+    return union(*(
+        select(model.owner_id).where(model.owner_id.is_not(None), model.owner_id != 0) for model in OWNER_TABLES
+    ))
+
+
+def shard_stats(router: ShardRouter = shard_router) -> Dict[str, Any]:
+    """Row and owner counts per shard plus totals."""
+    shards = []
+    for index, bind in enumerate(router.engines):
+        with bind.connect() as conn:
+            row: Dict[str, Any] = {
+                "shard": index,
+                "url": bind.url.render_as_string(hide_password=True),
+                "owners": conn.execute(select(func.count()).select_from(_owners_query().subquery())).scalar_one(),
+            }
+            for model in COUNTED_TABLES:
+                row[model.__tablename__] = conn.execute(select(func.count()).select_from(model)).scalar_one()
+        shards.append(row)
+    keys = ["owners"] + [model.__tablename__ for model in COUNTED_TABLES]
+    return {
+        "routing": router.mode,
+        "shards": shards,
+        "totals": {key: sum(row[key] for row in shards) for key in keys},
+    }
+
+
+def _owner_loads(conn: Connection) -> Dict[int, int]:
+    loads = {owner: 0 for owner in conn.execute(_owners_query()).scalars()}
+    for model in LOAD_TABLES:
+        stmt = select(model.owner_id, func.count()).where(model.owner_id.is_not(None), model.owner_id != 0)
+        for owner, rows in conn.execute(stmt.group_by(model.owner_id)):
+            loads[owner] += rows
+    return loads
+
+
+def _delete_owner(conn: Connection, owner_id: int) -> None:
+    for model in reversed(OWNER_TABLES):
+        conn.execute(delete(model.__table__).where(model.owner_id == owner_id))
+
+
+def _insert_keeping_ids(conn: Connection, table: Any, rows: List[Dict[str, Any]], router: ShardRouter) -> Dict[int, int]:
+    """Insert ``rows``; returns old id -> new id (the same id unless it was taken)."""
+    ids = [row["id"] for row in rows]
+    taken = set()
+    for i in range(0, len(ids), ID_CHUNK):
+        taken.update(conn.execute(select(table.c.id).where(table.c.id.in_(ids[i:i + ID_CHUNK]))).scalars())
+    keep = [row for row in rows if row["id"] not in taken]
+    if keep:
+        conn.execute(insert(table), keep)
+    mapping = {row["id"]: row["id"] for row in keep}
+    clashes = [row for row in rows if row["id"] in taken]
+    if clashes and table in (Project.__table__, Task.__table__):
+        # Listed next to rows from other shards: renumber to ids no shard uses
+        new_ids = router.new_ids(table, len(clashes), conn)
+    else:
+        new_ids = [None] * len(clashes)
+    for row, new_id in zip(clashes, new_ids):
+        values = {key: value for key, value in row.items() if key != "id"}
+        if new_id is not None:
+            values["id"] = new_id
+        mapping[row["id"]] = conn.execute(insert(table).values(values).returning(table.c.id)).scalar_one()
+    return mapping
+
+
+def _copy_owner(source: Connection, target: Connection, owner_id: int, router: ShardRouter) -> int:
+    ids: Dict[str, Dict[int, int]] = {}
+    copied = 0
+    for model in OWNER_TABLES:
+        table = model.__table__
+        rows = [dict(row) for row in source.execute(select(table).where(table.c.owner_id == owner_id)).mappings()]
+        if not rows:
+            continue
+        if model is Task:
+            # Links to projects the owner doesn't own (global ones) can't follow them
+            projects = ids.get("project", {})
+            unlinked = [row["id"] for row in rows if row["project_id"] is not None and row["project_id"] not in projects]
+            for row in rows:
+                row["project_id"] = projects.get(row["project_id"])
+            if unlinked:
+                logger.warning("Owner %s: %s tasks lose their link to a global project: %s",
+                               owner_id, len(unlinked), unlinked[:20])
+        elif model is SentReminder:
+            tasks = ids.get("task", {})
+            rows = [dict(row, task_id=tasks[row["task_id"]]) for row in rows if row["task_id"] in tasks]
+        ids[table.name] = _insert_keeping_ids(target, table, rows, router)
+        copied += len(rows)
+    return copied
+
+
+def move_owner(owner_id: int, target: int, router: ShardRouter = shard_router, source: Optional[int] = None) -> int:
+    """Move every row of ``owner_id`` to shard ``target``; returns the number of rows copied."""
+    source = router.shard_for(owner_id) if source is None else source
+    if source == target:
+        return 0
+    with router.engines[source].connect() as src, router.engines[target].begin() as dst:
+        # Leftovers of an interrupted move would otherwise be duplicated
+        _delete_owner(dst, owner_id)
+        copied = _copy_owner(src, dst, owner_id, router)
+    if router.mode == "directory":
+        with Session(router.engines[0]) as session:
+            session.merge(ShardAssignment(owner_id=owner_id, shard=target, assigned_at=datetime.utcnow()))
+            session.commit()
+        router.forget(owner_id)
+        if router is shard_router:
+            get_coordinator().broadcast("shard_directory", str(owner_id))
+    with router.engines[source].begin() as src:
+        _delete_owner(src, owner_id)
+    logger.info("Moved owner %s from shard %s to %s (%s rows)", owner_id, source, target, copied)
+    return copied
+
+
+def sync_directory(router: ShardRouter = shard_router) -> int:
+    """Record owners that have rows but no directory entry at the shard holding them."""
+    with Session(router.engines[0]) as session:
+        known = dict(session.execute(select(ShardAssignment.owner_id, ShardAssignment.shard)).all())
+    added = 0
+    for index, bind in enumerate(router.engines):
+        with bind.connect() as conn:
+            owners = list(conn.execute(_owners_query()).scalars())
+        with Session(router.engines[0]) as session:
+            for owner in owners:
+                if owner not in known:
+                    known[owner] = index
+                    session.add(ShardAssignment(owner_id=owner, shard=index, assigned_at=datetime.utcnow()))
+                    added += 1
+                elif known[owner] != index:
+                    logger.warning("Owner %s has rows on shard %s but is assigned to %s", owner, index, known[owner])
+            session.commit()
+    router.forget()
+    if router is shard_router:
+        get_coordinator().broadcast("shard_directory")
+    return added
+
+
+def _balance_moves(loads: Sequence[Dict[int, int]], max_moves: int) -> List[Move]:
+    """Greedy: move the owner closest to half the gap from the heaviest to the lightest shard."""
+    loads = [dict(shard) for shard in loads]
+    totals = [sum(shard.values()) for shard in loads]
+    moves: List[Move] = []
+    while len(moves) < max_moves:
+        heavy = max(range(len(loads)), key=totals.__getitem__)
+        light = min(range(len(loads)), key=totals.__getitem__)
+        gap = totals[heavy] - totals[light]
+        candidates = [(rows, owner) for owner, rows in loads[heavy].items() if 0 < rows < gap]
+        if not candidates:
+            break
+        rows, owner = min(candidates, key=lambda c: abs(gap / 2 - c[0]))
+        loads[light][owner] = loads[heavy].pop(owner)
+        totals[heavy] -= rows
+        totals[light] += rows
+        moves.append((owner, heavy, light))
+    return moves
+
+
+def plan_rebalance(router: ShardRouter = shard_router, max_moves: int = 1000) -> List[Move]:
+    """Hash routing: owners not on their hash shard. Directory routing: moves that even out load."""
+    loads = []
+    for bind in router.engines:
+        with bind.connect() as conn:
+            loads.append(_owner_loads(conn))
+    if router.mode != "directory":
+        count = len(router.engines)
+        return [(owner, index, hash_shard(owner, count))
+                for index, shard in enumerate(loads) for owner in sorted(shard)
+                if hash_shard(owner, count) != index][:max_moves]
+    return _balance_moves(loads, max_moves)
+
+
+def rebalance(router: ShardRouter = shard_router, max_moves: int = 1000, dry_run: bool = False) -> List[Move]:
+    if router.mode == "directory":
+        sync_directory(router)
+    moves = plan_rebalance(router, max_moves)
+    if not dry_run:
+        for owner, source, target in moves:
+            move_owner(owner, target, router, source)
+    return moves
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    commands.add_parser("sync")
+    move = commands.add_parser("move")
+    move.add_argument("owner_id", type=int)
+    move.add_argument("shard", type=int)
+    balance = commands.add_parser("rebalance")
+    balance.add_argument("--dry-run", action="store_true")
+    balance.add_argument("--max-moves", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    init_shards()
+    if args.command == "status":
+        print(json.dumps(shard_stats(), indent=2))
+    elif args.command == "sync":
+        print(f"Recorded {sync_directory()} owners")
+    elif args.command == "move":
+        if shard_router.mode != "directory":
+            parser.error("move needs SHARD_ROUTING=directory; with hash routing owners are placed by rebalance")
+        if not 0 <= args.shard < len(shard_router.engines):
+            parser.error(f"shard must be 0..{len(shard_router.engines) - 1}")
+        print(f"Copied {move_owner(args.owner_id, args.shard)} rows")
+    else:
+        moves = rebalance(max_moves=args.max_moves, dry_run=args.dry_run)
+        for owner, source, target in moves:
+            print(f"{'would move' if args.dry_run else 'moved'} owner {owner}: shard {source} -> {target}")
+        print(f"{len(moves)} moves")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Snapshot throughput and writer latency while a snapshot runs.
+
+Writer processes insert one task per transaction (with a short think time) into a
+dedicated SQLite file while the parent snapshots it over and over:
+
+* ``idle``: no snapshots, the writers' baseline.
+* ``full``: the whole database copied in one backup step, which holds the read lock for
+  the entire copy, like copying the file under a lock.
+* ``stepped``: ``app.backup.copy_online`` with ``--pages`` per step and ``--pause`` between.
+
+Run from ``back/``: ``python -m bench.backup --rows 200000 --writers 2 --duration 5 [--journal wal]``.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from .common import DATA_DIR, add_baseline_args, handle_baseline, print_results, summarize
+
+
+DB = DATA_DIR / "backup.db"
+COPY = DATA_DIR / "backup-copy.db"
+
+
+def _unlink(path: Path) -> None:
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def prepare(rows: int, journal: str) -> int:
+    from sqlmodel import SQLModel
+    from app.db import _create_engine
+
+    DATA_DIR.mkdir(exist_ok=True)
+    _unlink(DB)
+    engine = _create_engine(f"sqlite:///{DB}")
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+    rng = random.Random(1)
+    with sqlite3.connect(DB) as conn:
+        conn.execute(f"PRAGMA journal_mode={journal}")
+        conn.executemany(
+            "INSERT INTO task (owner_id, title, description, duration_hours, priority, importance, kind, created_at)"
+            " VALUES (?, ?, ?, 1.0, 1, 1, 'task', '2025-01-01 00:00:00')",
+            ((rng.randrange(1, 1000), f"task {i}", "x" * rng.randrange(50, 300)) for i in range(rows)),
+        )
+    return os.path.getsize(DB)
+
+
+def _writer(seed: int, duration: float, think: float, ready: Any) -> Tuple[List[float], int]:
+    conn = sqlite3.connect(DB, timeout=30)
+    rng = random.Random(seed)
+    samples: List[float] = []
+    failed = 0
+    ready.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            conn.execute(
+                "INSERT INTO task (owner_id, title, description, duration_hours, priority, importance, kind, created_at)"
+                " VALUES (?, 'bench', '', 1.0, 1, 1, 'task', '2025-01-01 00:00:00')",
+                (rng.randrange(1, 1000),),
+            )
+            conn.commit()
+        except sqlite3.OperationalError:
+            # "database is locked" once the busy timeout runs out
+            conn.rollback()
+            failed += 1
+            continue
+        samples.append(time.perf_counter() - t0)
+        time.sleep(think)
+    conn.close()
+    return samples, failed
+
+
+def run(mode: str, writers: int, duration: float, think: float, pages: int, pause: float) -> Dict[str, Dict[str, float]]:
+    from app.backup import copy_online
+
+    context = multiprocessing.get_context("spawn")
+    copies: List[float] = []
+    restarts = 0
+    with context.Manager() as manager, context.Pool(writers) as pool:
+        ready = manager.Barrier(writers + 1)
+        pending = pool.starmap_async(_writer, [(seed, duration, think, ready) for seed in range(writers)])
+        ready.wait()
+        deadline = time.perf_counter() + duration
+        while mode != "idle" and time.perf_counter() < deadline:
+            _unlink(COPY)
+            t0 = time.perf_counter()
+            restarts += copy_online(str(DB), str(COPY), -1 if mode == "full" else pages, 0.0 if mode == "full" else pause)
+            copies.append(time.perf_counter() - t0)
+        results = pending.get()
+    _unlink(COPY)
+    samples = [sample for part, _ in results for sample in part]
+    out = {f"writes_{mode}": summarize(samples, duration, sum(failed for _, failed in results))}
+    if copies:
+        out[f"snapshot_{mode}"] = dict(summarize(copies), restarts=restarts)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--think-ms", type=float, default=5.0, help="Pause between a writer's transactions")
+    parser.add_argument("--pages", type=int, default=256)
+    parser.add_argument("--pause", type=float, default=0.005)
+    parser.add_argument("--journal", choices=["delete", "wal"], default="delete")
+    parser.add_argument("--modes", nargs="+", default=["idle", "full", "stepped"])
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    size = prepare(args.rows, args.journal)
+    results: Dict[str, Dict[str, float]] = {}
+    for mode in args.modes:
+        results.update(run(mode, args.writers, args.duration, args.think_ms / 1000, args.pages, args.pause))
+    print_results(results)
+    print(f"\ndatabase {size / 1e6:.1f} MB, journal_mode={args.journal}")
+    for name, r in results.items():
+        if name.startswith("snapshot_") and r["p50_ms"]:
+            print(f"{name:<28} {size / 1e6 / (r['p50_ms'] / 1000):>8.1f} MB/s (median copy), {r['restarts']} restarts")
+    handle_baseline(args, f"backup-{args.journal}", results, {
+        "rows": args.rows, "writers": args.writers, "duration": args.duration, "pages": args.pages, "pause": args.pause,
+    })
+
+
+if __name__ == "__main__":
+    main()
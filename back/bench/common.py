@@ -0,0 +1,103 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+DATA_DIR = BENCH_DIR / ".data"
+BASELINE_DIR = BENCH_DIR / "baselines"
+DEFAULT_DB = DATA_DIR / "bench.db"
+
+
+def use_bench_database(path: Optional[str] = None) -> str:
+    """Point DATABASE_URL at the benchmark database; call before importing ``app``."""
+    DATA_DIR.mkdir(exist_ok=True)
+    url = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{path or DEFAULT_DB}"
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("ALLOW_ANON", "1")
+    return url
+
+
+def percentile(sorted_samples: Sequence[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, int(round(q / 100 * (len(sorted_samples) - 1)))))
+    return sorted_samples[idx]
+
+
+def summarize(samples: List[float], wall_seconds: Optional[float] = None, errors: int = 0) -> Dict[str, float]:
+    """Latency samples in seconds -> throughput and p50/p95/p99 in milliseconds."""
+    ordered = sorted(samples)
+    wall = wall_seconds if wall_seconds is not None else sum(samples)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "throughput": len(samples) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+    }
+
+
+def run_timed(fn: Callable[[], object], repeat: int, warmup: int = 3) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'benchmark':<28} {'count':>7} {'err':>5} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<28} {r['count']:>7} {r.get('errors', 0):>5} {r['throughput']:>10.1f} "
+            f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        )
+
+
+def save_baseline(name: str, results: Dict[str, Dict[str, float]], meta: Optional[Dict] = None) -> Path:
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    path.write_text(json.dumps({"meta": meta or {}, "results": results}, indent=2, sort_keys=True) + "\n")
+    return path
+
+
+def compare_baseline(name: str, results: Dict[str, Dict[str, float]]) -> None:
+    """Print the change against ``baselines/<name>.json``; latency up or throughput down is a regression."""
+    path = BASELINE_DIR / f"{name}.json"
+    if not path.exists():
+        # Timings only compare on the same machine and data, so no baselines ship with the repo
+        raise SystemExit(f"No baseline at {path}; run with --save-baseline first, on this machine and data set.")
+    baseline = json.loads(path.read_text())["results"]
+    print(f"\nAgainst {path.name}:")
+    print(f"{'benchmark':<28} {'ops/s':>10} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for bench, r in results.items():
+        b = baseline.get(bench)
+        if not b:
+            print(f"{bench:<28} {'(new)':>10}")
+            continue
+
+        def delta(key: str) -> str:
+            return f"{(r[key] - b[key]) / b[key] * 100:+.1f}%" if b[key] else "n/a"
+
+        print(f"{bench:<28} {delta('throughput'):>10} {delta('p50_ms'):>9} {delta('p95_ms'):>9} {delta('p99_ms'):>9}")
+    for bench in sorted(set(baseline) - set(results)):
+        print(f"{bench:<28} {'(missing)':>10}")
+
+
+def add_baseline_args(parser) -> None:
+    parser.add_argument("--save-baseline", action="store_true", help="Write results to bench/baselines/")
+    parser.add_argument("--compare", action="store_true", help="Diff results against the stored baseline")
+
+
+def handle_baseline(args, name: str, results: Dict[str, Dict[str, float]], meta: Optional[Dict] = None) -> None:
+    if args.compare:
+        compare_baseline(name, results)
+    if args.save_baseline:
+        print(f"Saved baseline to {save_baseline(name, results, meta)}")
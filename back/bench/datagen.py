@@ -0,0 +1,185 @@
+"""Fill the benchmark database with synthetic owners, projects, tasks, events and chat history.
+
+Run from ``back/``: ``python -m bench.datagen --owners 200 --tasks 300 --messages 1000 --reset``.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+
+from .common import use_bench_database
+
+
+FIRST_OWNER_ID = 100_000
+BENCH_OPENAI_KEY = "sk-bench-local"
+LEVELS = ("low", "medium", "high")
+WORDS = (
+    "отчёт", "встреча", "релиз", "ревью", "бюджет", "клиент", "дизайн", "тесты",
+    "report", "sync", "deploy", "invoice", "roadmap", "hiring", "refactor", "demo",
+)
+
+
+def owner_ids(owners: int) -> List[int]:
+    return list(range(FIRST_OWNER_ID, FIRST_OWNER_ID + owners))
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+
+
+def _batches(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(
+    engine,
+    owners: int = 100,
+    projects: int = 5,
+    tasks: int = 200,
+    events: int = 20,
+    messages: int = 300,
+    seed: int = 1,
+    batch_size: int = 5000,
+) -> Dict[str, int]:
+    """Insert rows per owner with Core executemany batches; returns row counts per table."""
+    from sqlalchemy import func, insert, select
+    from app.models import AiSettings, ChatMessage, Project, Task, UserSettings
+
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+    ids = owner_ids(owners)
+    counts = {"project": 0, "task": 0, "chatmessage": 0, "usersettings": 0}
+
+    with engine.begin() as conn:
+        next_project_id = (conn.execute(select(func.max(Project.id))).scalar() or 0) + 1
+        project_rows = []
+        owner_projects: Dict[int, List[int]] = {}
+        for owner in ids:
+            owner_projects[owner] = []
+            for i in range(projects):
+                project_rows.append({
+                    "id": next_project_id, "owner_id": owner, "name": f"Project {i} of {owner}",
+                    "color": "#BBF7D0", "created_at": now,
+                })
+                owner_projects[owner].append(next_project_id)
+                next_project_id += 1
+        for batch in _batches(iter(project_rows), batch_size):
+            conn.execute(insert(Project.__table__), batch)
+        counts["project"] = len(project_rows)
+
+        def task_rows() -> Iterator[Dict]:
+            for owner in ids:
+                for _ in range(tasks):
+                    yield {
+                        "owner_id": owner,
+                        "title": _title(rng),
+                        "description": _title(rng) * rng.randint(0, 3),
+                        "deadline": today + timedelta(days=rng.randint(-60, 90)) if rng.random() < 0.8 else None,
+                        "duration_hours": rng.choice((0.5, 1.0, 2.0, 4.0, 8.0)),
+                        "priority": rng.choice(LEVELS),
+                        "importance": rng.choice(LEVELS),
+                        "kind": "task",
+                        "event_start": None,
+                        "event_end": None,
+                        "project_id": rng.choice(owner_projects[owner]) if owner_projects[owner] and rng.random() < 0.7 else None,
+                        "created_at": now - timedelta(minutes=rng.randint(0, 500_000)),
+                    }
+                for _ in range(events):
+                    start = now + timedelta(hours=rng.randint(-24 * 30, 24 * 60))
+                    yield {
+                        "owner_id": owner,
+                        "title": _title(rng),
+                        "description": "",
+                        "deadline": None,
+                        "duration_hours": 1.0,
+                        "priority": "medium",
+                        "importance": "medium",
+                        "kind": "event",
+                        "event_start": start,
+                        "event_end": start + timedelta(minutes=rng.choice((30, 60, 90))),
+                        "project_id": None,
+                        "created_at": now - timedelta(minutes=rng.randint(0, 500_000)),
+                    }
+
+        for batch in _batches(task_rows(), batch_size):
+            conn.execute(insert(Task.__table__), batch)
+            counts["task"] += len(batch)
+
+        def message_rows() -> Iterator[Dict]:
+            for owner in ids:
+                start = now - timedelta(minutes=messages)
+                for i in range(messages):
+                    yield {
+                        "owner_id": owner,
+                        "role": "user" if i % 2 == 0 else "assistant",
+                        "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60))),
+                        "created_at": start + timedelta(minutes=i),
+                    }
+
+        for batch in _batches(message_rows(), batch_size):
+            conn.execute(insert(ChatMessage.__table__), batch)
+            counts["chatmessage"] += len(batch)
+
+        settings_rows = [{"owner_id": owner, "created_at": now, "updated_at": now} for owner in ids]
+        for batch in _batches(iter(settings_rows), batch_size):
+            conn.execute(insert(UserSettings.__table__), batch)
+        counts["usersettings"] = len(settings_rows)
+
+        # Global key so webhook turns reach the (stubbed) model call
+        has_global = conn.execute(select(AiSettings.id).where(AiSettings.owner_id == 0)).first()
+        if not has_global:
+            conn.execute(insert(AiSettings.__table__), [{
+                "owner_id": 0, "openai_api_key": BENCH_OPENAI_KEY, "openai_model": "gpt-4o-mini",
+                "created_at": now, "updated_at": now,
+            }])
+    return counts
+
+
+def reset(engine) -> None:
+    from sqlmodel import SQLModel
+    import app.models  # noqa: F401  registers tables
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--owners", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=5, help="Projects per owner")
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks per owner")
+    parser.add_argument("--events", type=int, default=20, help="Events per owner")
+    parser.add_argument("--messages", type=int, default=300, help="Chat messages per owner")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    parser.add_argument("--db", help="SQLite file (default bench/.data/bench.db)")
+    args = parser.parse_args()
+
+    url = use_bench_database(args.db)
+    from app.db import engine
+
+    if args.reset:
+        reset(engine)
+    else:
+        from app.db import init_db
+        init_db()
+    t0 = time.perf_counter()
+    counts = generate(
+        engine, owners=args.owners, projects=args.projects, tasks=args.tasks, events=args.events,
+        messages=args.messages, seed=args.seed, batch_size=args.batch_size,
+    )
+    print(f"{url}: inserted {counts} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
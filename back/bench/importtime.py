@@ -0,0 +1,91 @@
+"""Cold-start cost of importing the app, measured with ``python -X importtime``.
+
+Each run is a fresh interpreter, so nothing is cached in ``sys.modules``. Reports the
+whole process wall time, the cumulative import time of the target module, and the
+top-level packages that cost the most (summed self time, so nothing is counted twice).
+
+Run from ``back/``: ``python -m bench.importtime [--module app.main] [--compare] [--save-baseline]``.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from .common import BENCH_DIR, add_baseline_args, handle_baseline, print_results, summarize, use_bench_database
+
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """``-X importtime`` output -> (module, self us, cumulative us, depth) in import order."""
+    entries = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def import_once(module: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BENCH_DIR.parent, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return wall, parse_importtime(proc.stderr)
+
+
+def by_package(entries: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = defaultdict(int)
+    for module, self_us, _, _ in entries:
+        totals[module.split(".")[0]] += self_us
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="Packages to list by import time")
+    parser.add_argument("--db", help="SQLite file (default bench/.data/bench.db)")
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    use_bench_database(args.db)
+    env = dict(os.environ)
+    walls: List[float] = []
+    imports: List[float] = []
+    packages: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(args.repeat):
+        wall, entries = import_once(args.module, env)
+        walls.append(wall)
+        imports.append(next(c for m, _, c, _ in entries if m == args.module) / 1e6)
+        for package, us in by_package(entries).items():
+            packages[package].append(us)
+
+    results = {
+        "process_wall": summarize(walls),
+        f"import_{args.module}": summarize(imports),
+    }
+    print_results(results)
+
+    print(f"\n{'package':<28} {'median ms':>10} {'share':>7}")
+    total = sorted(imports)[len(imports) // 2] * 1000
+    medians = {p: sorted(v)[len(v) // 2] / 1000 for p, v in packages.items()}
+    for package, ms in sorted(medians.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{package:<28} {ms:>10.1f} {ms / total * 100 if total else 0:>6.1f}%")
+
+    handle_baseline(args, "importtime", results, {"module": args.module, "repeat": args.repeat})
+
+
+if __name__ == "__main__":
+    main()
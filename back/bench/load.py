@@ -0,0 +1,175 @@
+"""End-to-end load driver for the REST API and ``/telegram/webhook``.
+
+Starts local Telegram/OpenAI stubs and a uvicorn server on the benchmark database,
+then runs a weighted mix of requests from many owners at fixed concurrency.
+
+Run from ``back/``: ``python -m bench.load --duration 20 --concurrency 32 [--compare] [--save-baseline]``.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date
+from typing import Callable, Dict, List, Tuple
+
+from .common import BENCH_DIR, add_baseline_args, handle_baseline, print_results, summarize, use_bench_database
+from .datagen import owner_ids
+from .stubs import openai_stub, telegram_stub
+
+
+JWT_SECRET = "bench-secret"
+
+# name -> (weight, request builder)
+Scenario = Tuple[int, Callable[[int, random.Random], Tuple[str, str, Dict]]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    "GET /tasks/": (30, lambda owner, rng: ("GET", "/tasks/", {})),
+    "GET /tasks/?day": (10, lambda owner, rng: ("GET", f"/tasks/?day={date.today().isoformat()}", {})),
+    "GET /events/": (15, lambda owner, rng: ("GET", "/events/", {})),
+    "GET /projects/": (10, lambda owner, rng: ("GET", "/projects/", {})),
+    "GET /stats/summary": (10, lambda owner, rng: ("GET", "/stats/summary", {})),
+    "POST /tasks/": (10, lambda owner, rng: ("POST", "/tasks/", {"json": {"title": f"load {rng.random():.6f}", "deadline": date.today().isoformat()}})),
+    "POST /telegram/webhook": (15, lambda owner, rng: ("POST", "/telegram/webhook", {"json": {
+        "update_id": rng.randint(1, 10**9),
+        "message": {"message_id": 1, "chat": {"id": owner}, "from": {"id": owner}, "text": "Что у меня на сегодня?"},
+    }})),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tokens(owners: List[int]) -> Dict[int, str]:
+    os.environ["JWT_SECRET"] = JWT_SECRET
+    from app.core.security import create_access_token
+
+    return {o: create_access_token({"user": {"id": o, "first_name": "Load"}}) for o in owners}
+
+
+def start_server(port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BENCH_DIR.parent, env={**os.environ, **env})
+
+
+async def wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(base_url + "/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+async def drive(base_url: str, tokens: Dict[int, str], duration: float, concurrency: int, seed: int,
+                only: List[str]) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    names = [n for n in SCENARIOS if not only or n in only]
+    weights = [SCENARIOS[n][0] for n in names]
+    samples: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    owners = list(tokens)
+    stop_at = time.perf_counter() + duration
+
+    async def worker(idx: int, client: "httpx.AsyncClient") -> None:
+        rng = random.Random(seed + idx)
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            owner = rng.choice(owners)
+            method, path, kwargs = SCENARIOS[name][1](owner, rng)
+            headers = {"Authorization": f"Bearer {tokens[owner]}"}
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(method, path, headers=headers, **kwargs)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples[name].append(time.perf_counter() - t0)
+            if not ok:
+                errors[name] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    results = {n: summarize(samples[n], wall, errors[n]) for n in names if samples[n]}
+    everything = [s for n in names for s in samples[n]]
+    results["TOTAL"] = summarize(everything, wall, sum(errors.values()))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--owners", type=int, default=100, help="Distinct owners to spread requests over")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Artificial Telegram/OpenAI latency")
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios")
+    parser.add_argument("--generate", action="store_true", help="Reset and fill the database first")
+    parser.add_argument("--url", help="Drive an already running server instead of starting one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="SQLite file (default bench/.data/bench.db)")
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    db_url = use_bench_database(args.db)
+    if args.generate:
+        from app.db import engine
+        from .datagen import generate, reset
+        reset(engine)
+        generate(engine, owners=args.owners)
+
+    tokens = _tokens(owner_ids(args.owners))
+    server = None
+    tg = ai = None
+    base_url = args.url
+    try:
+        if not base_url:
+            tg = telegram_stub(latency_ms=args.stub_latency_ms).start()
+            ai = openai_stub(latency_ms=args.stub_latency_ms).start()
+            port = _free_port()
+            server = start_server(port, args.workers, {
+                "DATABASE_URL": db_url,
+                "JWT_SECRET": JWT_SECRET,
+                "ALLOW_ANON": "0",
+                "TELEGRAM_BOT_TOKEN": "bench:token",
+                "TELEGRAM_API_BASE": tg.url,
+                "OPENAI_BASE_URL": ai.url + "/v1",
+                "OPENAI_API_KEY": "sk-bench-local",
+            })
+            base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(wait_ready(base_url))
+        results = asyncio.run(drive(base_url, tokens, args.duration, args.concurrency, args.seed, args.only or []))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        for stub in (tg, ai):
+            if stub is not None:
+                stub.stop()
+
+    print_results(results)
+    handle_baseline(args, "load", results, {
+        "duration": args.duration, "concurrency": args.concurrency, "workers": args.workers, "owners": args.owners,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Micro-benchmarks of hot handler paths, called directly without HTTP.
+
+Run from ``back/``: ``python -m bench.micro [--generate] [--compare] [--save-baseline]``.
+"""
+import argparse
+from typing import Callable, Dict
+
+from .common import add_baseline_args, handle_baseline, print_results, run_timed, use_bench_database
+from .datagen import FIRST_OWNER_ID
+
+
+def benchmarks(engine, owner_id: int) -> Dict[str, Callable[[], object]]:
+    from sqlmodel import Session
+    from app.core.security import create_access_token
+    from app.deps import get_current_user
+    from app.routers.events import list_events
+    from app.routers.stats import stats_summary
+    from app.routers.tasks import list_tasks
+    from app.routers.telegram import _build_tasks_context
+
+    user = {"id": owner_id, "first_name": "Bench"}
+    authorization = "Bearer " + create_access_token({"user": user})
+
+    def in_session(fn: Callable[[Session], object]) -> Callable[[], object]:
+        def run() -> object:
+            with Session(engine) as session:
+                return fn(session)
+        return run
+
+    return {
+        "build_tasks_context": in_session(lambda s: _build_tasks_context(s, owner_id)),
+        "list_tasks": in_session(lambda s: list_tasks(session=s, current_user=user, project_id=None, day=None, compact=False)),
+        "list_events": in_session(lambda s: list_events(session=s, current_user=user, start=None, end=None, compact=False)),
+        "stats_summary": in_session(lambda s: stats_summary(session=s, current_user=user)),
+        "get_current_user": lambda: get_current_user(authorization=authorization),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks")
+    parser.add_argument("--generate", action="store_true", help="Reset and fill the database with default datagen scale")
+    parser.add_argument("--db", help="SQLite file (default bench/.data/bench.db)")
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    use_bench_database(args.db)
+    from app.db import engine, init_db
+
+    if args.generate:
+        from .datagen import generate, reset
+        reset(engine)
+        generate(engine)
+    else:
+        init_db()
+
+    results = {}
+    for name, fn in benchmarks(engine, FIRST_OWNER_ID).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = run_timed(fn, args.repeat)
+    print_results(results)
+    handle_baseline(args, "micro", results, {"repeat": args.repeat})
+
+
+if __name__ == "__main__":
+    main()
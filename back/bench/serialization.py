@@ -0,0 +1,64 @@
+"""Compare the default list response path against FAST_RESPONSES.
+
+Run from ``back/``: ``python -m bench.serialization [--rows 1000 10000]``.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def _seed(engine, rows: int) -> None:
+    from sqlmodel import Session
+    from app.models import Task
+
+    with Session(engine) as session:
+        session.add_all(
+            Task(owner_id=None, title=f"task {i}", description="x" * 40, priority="high")
+            for i in range(rows)
+        )
+        session.commit()
+
+
+def _time(client, path: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        resp = client.get(path)
+        samples.append(time.perf_counter() - t0)
+        resp.raise_for_status()
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["ALLOW_ANON"] = "1"
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import SQLModel
+    from app.core.config import get_settings
+    from app.db import engine
+    from app.main import create_app
+
+    client = TestClient(create_app())
+    settings = get_settings()
+    for rows in args.rows:
+        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.create_all(engine)
+        _seed(engine, rows)
+        settings.fast_responses = False
+        default = _time(client, "/tasks/", args.repeat)
+        settings.fast_responses = True
+        fast = _time(client, "/tasks/", args.repeat)
+        print(f"rows={rows:>6}  default={default * 1000:8.1f}ms  fast={fast * 1000:8.1f}ms  speedup={default / fast:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
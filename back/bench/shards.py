@@ -0,0 +1,90 @@
+"""Write throughput against the number of shards.
+
+Writer processes (like uvicorn workers and the bot) insert one task per transaction
+for random owners, routed by a ``ShardRouter`` over 1, 2, 4... fresh SQLite files.
+With one file every commit queues on the same write lock; with N files up to N
+commits proceed at once.
+
+Run from ``back/``: ``python -m bench.shards --shards 1 2 4 --writers 8 --duration 5``.
+"""
+import argparse
+import multiprocessing
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from .common import DATA_DIR, add_baseline_args, handle_baseline, print_results, summarize
+
+
+def _paths(shard_count: int) -> List[str]:
+    return [str(DATA_DIR / f"shard-{shard_count}-{i}.db") for i in range(shard_count)]
+
+
+def _writer(paths: List[str], seed: int, duration: float, owners: int, ready: Any) -> Tuple[List[float], int]:
+    from sqlalchemy import insert
+    from app.db import ShardRouter, _create_engine
+    from app.models import Task
+
+    router = ShardRouter([_create_engine(f"sqlite:///{path}") for path in paths], "hash")
+    rng = random.Random(seed)
+    samples: List[float] = []
+    failed = 0
+    # Start together once every writer has finished importing
+    ready.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        owner = rng.randrange(1, owners + 1)
+        t0 = time.perf_counter()
+        try:
+            with router.engine_for(owner).begin() as conn:
+                conn.execute(insert(Task.__table__).values(
+                    owner_id=owner, title="bench", description="", duration_hours=1.0,
+                    priority="medium", importance="medium", kind="task", created_at=datetime.utcnow(),
+                ))
+        except Exception:
+            # "database is locked" once the busy timeout runs out
+            failed += 1
+            continue
+        samples.append(time.perf_counter() - t0)
+    return samples, failed
+
+
+def run(shard_count: int, writers: int, duration: float, owners: int) -> Dict[str, float]:
+    from sqlmodel import SQLModel
+    from app.db import _create_engine
+
+    DATA_DIR.mkdir(exist_ok=True)
+    paths = _paths(shard_count)
+    for path in paths:
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            Path(path + suffix).unlink(missing_ok=True)
+        engine = _create_engine(f"sqlite:///{path}")
+        SQLModel.metadata.create_all(engine)
+        engine.dispose()
+
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, context.Pool(writers) as pool:
+        ready = manager.Barrier(writers)
+        results = pool.starmap(_writer, [(paths, seed, duration, owners, ready) for seed in range(writers)])
+    samples = [sample for part, _ in results for sample in part]
+    return summarize(samples, duration, sum(failed for _, failed in results))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--owners", type=int, default=1000)
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    results = {f"insert_{n}_shards": run(n, args.writers, args.duration, args.owners) for n in args.shards}
+    print_results(results)
+    handle_baseline(args, "shards", results, {"writers": args.writers, "duration": args.duration})
+
+
+if __name__ == "__main__":
+    main()
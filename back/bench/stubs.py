@@ -0,0 +1,109 @@
+"""Local stand-ins for the Telegram Bot API and the OpenAI chat completions API.
+
+Both answer instantly (or after ``latency_ms``) with minimal valid payloads so load
+tests exercise our code rather than the network. Run standalone with
+``python -m bench.stubs --telegram-port 8081 --openai-port 8082``.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+
+Handler = Callable[[str, Dict], Tuple[int, Dict]]
+
+
+def _telegram(path: str, body: Dict) -> Tuple[int, Dict]:
+    method = path.rsplit("/", 1)[-1]
+    if method in {"sendMessage", "setWebhook", "getMe"}:
+        return 200, {"ok": True, "result": {"message_id": 1, "chat": {"id": body.get("chat_id")}}}
+    return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+
+def _openai(path: str, body: Dict) -> Tuple[int, Dict]:
+    if not path.endswith("/chat/completions"):
+        return 404, {"error": {"message": "not found"}}
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    content = "Готово: вот краткий план на сегодня."
+    return 200, {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": 12, "total_tokens": prompt_chars // 4 + 12},
+    }
+
+
+class StubServer:
+    def __init__(self, handler: Handler, port: int = 0, latency_ms: float = 0.0) -> None:
+        latency = latency_ms / 1000
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    body = {}
+                if latency:
+                    time.sleep(latency)
+                status, payload = handler(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), RequestHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.server.serve_forever, name=f"stub-{self.port}", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def telegram_stub(port: int = 0, latency_ms: float = 0.0) -> StubServer:
+    return StubServer(_telegram, port, latency_ms)
+
+
+def openai_stub(port: int = 0, latency_ms: float = 0.0) -> StubServer:
+    return StubServer(_openai, port, latency_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--openai-port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    tg = telegram_stub(args.telegram_port, args.latency_ms).start()
+    ai = openai_stub(args.openai_port, args.latency_ms).start()
+    print(f"TELEGRAM_API_BASE={tg.url}")
+    print(f"OPENAI_BASE_URL={ai.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import itertools
+import os
+import tempfile
+
+# Settings and engines are read at import time: point them at a scratch database first
+_tmp = tempfile.mkdtemp(prefix="task-back-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["DATABASE_SHARD_URLS"] = ""
+os.environ["TELEGRAM_BOT_TOKEN"] = ""
+os.environ["ADMIN_TOKEN"] = "test-admin"
+os.environ["ALLOW_ANON"] = "1"
+os.environ["COORDINATION_URL"] = "memory://"
+os.environ["BACKUP_INTERVAL"] = "0"
+
+import pytest
+
+from app.core.security import create_access_token
+
+pytest_plugins = ["app.core.pytest_plugin"]
+
+_owner_ids = itertools.count(1_000_001)
+
+
+@pytest.fixture
+def tmp_dir() -> str:
+    return _tmp
+
+
+@pytest.fixture
+def owner_id() -> int:
+    """A fresh owner per test, so tests sharing the database don't see each other's rows."""
+    return next(_owner_ids)
+
+
+@pytest.fixture
+def auth(owner_id):
+    return {"Authorization": "Bearer " + create_access_token({"user": {"id": owner_id}})}
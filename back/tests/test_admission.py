@@ -0,0 +1,62 @@
+"""LLM admission control around chat completions."""
+import asyncio
+import contextlib
+import hashlib
+import time
+
+import pytest
+
+from app.core import admission
+from app.core.ai import _ClientPool
+from app.core.admission import LlmBusy, chat_completion, key_gate
+from app.core.config import get_settings
+from app.core.coordination import MemoryCoordinator
+
+
+def test_full_shared_window_frees_the_slot_and_reports_busy(monkeypatch):
+    # Another worker already used the key's requests for this minute
+    coordinator = MemoryCoordinator()
+    coordinator.shared = True
+    monkeypatch.setattr(admission, "get_coordinator", lambda: coordinator)
+    monkeypatch.setattr(admission, "get_settings", lambda: get_settings().model_copy(update={"llm_queue_timeout": 0.5}))
+    calls = []
+    monkeypatch.setattr(admission, "openai_client", lambda api_key: contextlib.nullcontext(calls.append(api_key)))
+
+    async def main():
+        gate = key_gate("sk-shared")
+        for key in _window_keys("sk-shared"):
+            await coordinator.incr(key, 10_000, ttl=120)
+        with pytest.raises(LlmBusy):
+            await asyncio.wait_for(chat_completion("sk-shared", 7, model="m", messages=[]), 2)
+        assert gate.in_flight == 0 and gate.running == {}
+
+    asyncio.run(main())
+    assert len(calls) == 1  # the client was looked up, never used
+
+
+def _window_keys(api_key):
+    # The current window and the next, in case the minute turns during the test
+    digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    window = int(time.time() // 60)
+    return f"llm:{digest}:{window}", f"llm:{digest}:{window + 1}"
+
+
+def test_evicted_client_is_closed_after_its_last_lease():
+    pytest.importorskip("openai")
+
+    async def main():
+        pool = _ClientPool(max_clients=1)
+        with pool.lease("sk-a") as first:
+            with pool.lease("sk-a") as again:
+                assert again is first
+                with pool.lease("sk-b"):
+                    pass  # evicts sk-a's client, still leased twice
+                await asyncio.sleep(0)
+                assert not first.is_closed()
+            await asyncio.sleep(0)
+            assert not first.is_closed()
+        await asyncio.sleep(0.05)
+        assert first.is_closed()
+        await pool.aclose()
+
+    asyncio.run(main())
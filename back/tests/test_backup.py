@@ -0,0 +1,73 @@
+"""Snapshot names: unique per source file and per take, never overwritten."""
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pytest
+
+from app import backup
+
+
+def _database(path, rows=1):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(rows)])
+    return str(path)
+
+
+def _rows(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+
+
+def test_snapshots_in_the_same_second_are_kept_apart(tmp_path):
+    source = _database(tmp_path / "data.db")
+    first = backup.snapshot_database(source, tmp_path / "backups", "gzip")
+    second = backup.snapshot_database(source, tmp_path / "backups", "gzip")
+    assert first.path != second.path
+    listed = backup.list_snapshots(tmp_path / "backups")
+    assert [s.path for s in listed] == [first.path, second.path]
+    assert {s.database for s in listed} == {backup.database_key(source)}
+
+
+def test_same_named_shards_are_pruned_and_restored_apart(tmp_path):
+    directory = tmp_path / "backups"
+    a = _database(tmp_path / "a" / "data.db", rows=1)
+    b = _database(tmp_path / "b" / "data.db", rows=2)
+    for _ in range(3):
+        backup.snapshot_database(a, directory, "none")
+    newest_b = backup.snapshot_database(b, directory, "none")
+    deleted = backup.prune(directory, keep=1)
+    assert len(deleted) == 2 and all(s.database == backup.database_key(a) for s in deleted)
+    remaining = backup.list_snapshots(directory)
+    assert {s.database for s in remaining} == {backup.database_key(a), backup.database_key(b)}
+
+    parsed = backup.parse_snapshot(newest_b.path)
+    assert parsed.database == backup.database_key(b) != backup.database_key(a)
+    target = str(tmp_path / "restored.db")
+    backup.restore(newest_b.path, target)
+    assert _rows(target) == 2
+
+
+def test_existing_snapshot_is_not_overwritten(tmp_path, monkeypatch):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+    directory = tmp_path / "backups"
+    source = _database(tmp_path / "data.db", rows=1)
+    monkeypatch.setattr(backup, "datetime", FrozenDatetime)
+    first = backup.snapshot_database(source, directory, "none")
+    with closing(sqlite3.connect(source)) as conn, conn:
+        conn.execute("INSERT INTO t VALUES (99)")
+    with pytest.raises(FileExistsError):
+        backup.snapshot_database(source, directory, "none")
+    assert _rows(first.path) == 1
+    assert [p.name for p in directory.iterdir()] == [first.path.name]
+    # The check before copying can race with another process; the final rename refuses too
+    (directory / "spare.db").write_bytes(b"")
+    with pytest.raises(FileExistsError):
+        backup._publish(directory / "spare.db", first.path)
+    assert _rows(first.path) == 1
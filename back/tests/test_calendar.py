@@ -0,0 +1,26 @@
+"""Calendar feed caching and its invalidation on commits."""
+from sqlmodel import Session
+
+from app.core import calendar_cache
+from app.db import engine
+from app.models import Task
+
+
+def test_commits_invalidate_only_cached_feeds(budgeted_client, auth, owner_id, monkeypatch):
+    client = budgeted_client
+    sent = []
+    monkeypatch.setattr(calendar_cache, "invalidate_calendar", lambda *owners: sent.append(owners))
+
+    assert client.post("/tasks/", json={"title": "before", "deadline": "2030-01-01"}, headers=auth).status_code == 200
+    assert sent == []  # no feed of this owner anywhere yet
+
+    token = client.get("/calendar/token", headers=auth).json()["token"]
+    assert "SUMMARY:before" in client.get(f"/calendar/{token}.ics").text
+    task_id = client.post("/tasks/", json={"title": "after", "deadline": "2030-01-02"}, headers=auth).json()["id"]
+    assert sent == [(owner_id,)]
+
+    # Sessions outside the app's factory are not watched
+    with Session(engine) as session:
+        session.get(Task, task_id).title = "renamed"
+        session.commit()
+    assert sent == [(owner_id,)]
@@ -0,0 +1,186 @@
+"""Coordination backends (memory, SQLite, Redis via fakeredis) and the webhook's update dedup."""
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app.core.coordination import LockTimeout, MemoryCoordinator, RedisCoordinator, SqliteCoordinator, subscribe
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_pair(request, tmp_path):
+    """Factory of two coordinators sharing state, as two processes would (one for memory)."""
+    if request.param == "memory":
+        def pair():
+            coordinator = MemoryCoordinator()
+            return coordinator, coordinator
+    elif request.param == "sqlite":
+        def pair():
+            return tuple(SqliteCoordinator(str(tmp_path / "coordination.db"), poll_interval=0.02) for _ in range(2))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+
+        def pair():
+            server = fakeredis.FakeServer()
+            return tuple(RedisCoordinator(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+                         for _ in range(2))
+    return pair
+
+
+def _run(make_pair, body):
+    async def main():
+        first, second = make_pair()
+        await first.start()
+        await second.start()
+        try:
+            await body(first, second)
+        finally:
+            await first.close()
+            if second is not first:
+                await second.close()
+    asyncio.run(main())
+
+
+def test_lock(make_pair):
+    async def body(first, second):
+        async with first.lock("job", ttl=5):
+            with pytest.raises(LockTimeout):
+                async with second.lock("job", timeout=0.05):
+                    pass
+        async with second.lock("job", timeout=0.05):
+            pass
+        # A holder that never releases only blocks others for its ttl
+        assert await first.try_acquire("crashed", "a", 0.1)
+        assert not await second.try_acquire("crashed", "b", 5)
+        assert await first.try_acquire("crashed", "a", 0.1)  # the holder may extend it
+        await asyncio.sleep(0.15)
+        assert await second.try_acquire("crashed", "b", 5)
+        await first.release("crashed", "a")  # not the holder: no effect
+        assert not await first.try_acquire("crashed", "a", 5)
+
+    _run(make_pair, body)
+
+
+def test_claim_and_unclaim(make_pair):
+    async def body(first, second):
+        assert await first.claim("update:1", 5)
+        assert not await second.claim("update:1", 5)
+        await first.unclaim("update:1")
+        assert await second.claim("update:1", 5)
+        assert await first.claim("update:2", 0.1)
+        await asyncio.sleep(0.15)
+        assert await second.claim("update:2", 5)
+
+    _run(make_pair, body)
+
+
+def test_incr(make_pair):
+    async def body(first, second):
+        assert await first.incr("calls") == 1
+        assert await second.incr("calls", 2) == 3
+        assert await first.incr("window", ttl=0.1) == 1
+        assert await second.incr("window", ttl=0.1) == 2
+        await asyncio.sleep(0.15)
+        assert await first.incr("window", ttl=0.1) == 1
+
+    _run(make_pair, body)
+
+
+def test_broadcast(make_pair):
+    channel = f"test:{uuid.uuid4().hex}"
+    received = []
+    subscribe(channel)(received.append)
+
+    async def body(first, second):
+        first.broadcast(channel, "changed")
+        # Handlers run in the sending process at once, and once more where the other listener runs
+        expected = 2 if second is not first else 1
+        deadline = time.monotonic() + 2
+        while len(received) < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.05)
+        assert received == ["changed"] * expected
+
+    _run(make_pair, body)
+
+
+def test_memory_prunes_expired_entries(monkeypatch):
+    coordinator = MemoryCoordinator()
+    monkeypatch.setattr(coordinator, "PRUNE_INTERVAL", 0.0)
+
+    async def body():
+        for i in range(100):
+            await coordinator.claim(f"update:{i}", 0.01)
+            await coordinator.incr(f"counter:{i}", ttl=0.01)
+            await coordinator.try_acquire(f"lock:{i}", "token", 0.01)
+        await asyncio.sleep(0.02)
+        await coordinator.claim("update:last", 5)
+
+    asyncio.run(body())
+    assert list(coordinator._claims) == ["update:last"]
+    assert coordinator._counters == {} and coordinator._locks == {}
+
+
+def _update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "from": {"id": chat_id}, "text": "hi"}}
+
+
+def test_webhook_ignores_duplicate_updates(budgeted_client, owner_id, monkeypatch):
+    handled = []
+
+    async def handle(session, chat_id, owner, text):
+        handled.append(chat_id)
+
+    monkeypatch.setattr("app.routers.telegram._handle_message", handle)
+    update = _update(owner_id * 100, owner_id)
+    for _ in range(3):
+        assert budgeted_client.post("/telegram/webhook", json=update).json() == {"ok": True}
+    assert handled == [owner_id]
+
+
+def test_webhook_failure_unclaims_the_update(budgeted_client, owner_id, monkeypatch):
+    handled = []
+
+    async def handle(session, chat_id, owner, text):
+        handled.append(chat_id)
+        if len(handled) == 1:
+            raise RuntimeError("OpenAI is down")
+
+    monkeypatch.setattr("app.routers.telegram._handle_message", handle)
+    update = _update(owner_id * 100, owner_id)
+    with pytest.raises(RuntimeError):
+        budgeted_client.post("/telegram/webhook", json=update)
+    # Telegram's redelivery is handled, once
+    assert budgeted_client.post("/telegram/webhook", json=update).json() == {"ok": True}
+    assert budgeted_client.post("/telegram/webhook", json=update).json() == {"ok": True}
+    assert handled == [owner_id, owner_id]
+
+
+def test_webhook_answers_busy_chat_without_waiting(budgeted_client, owner_id, monkeypatch):
+    from app.core.config import get_settings
+    from app.core.coordination import get_coordinator
+    from app.routers import telegram
+
+    handled, sent = [], []
+
+    async def handle(session, chat_id, owner, text):
+        handled.append(chat_id)
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    monkeypatch.setattr(telegram, "_handle_message", handle)
+    monkeypatch.setattr(telegram, "_tg_send_message", send)
+    monkeypatch.setattr(telegram, "get_settings", lambda: get_settings().model_copy(update={"chat_lock_wait": 0.1}))
+    # Another worker is still answering this chat
+    lock = f"telegram:chat:{owner_id}"
+    assert asyncio.run(get_coordinator().try_acquire(lock, "other", 60))
+    try:
+        started = time.monotonic()
+        response = budgeted_client.post("/telegram/webhook", json=_update(owner_id * 100 + 1, owner_id))
+        assert (response.status_code, response.json()) == (200, {"ok": True})
+        assert time.monotonic() - started < 5
+    finally:
+        asyncio.run(get_coordinator().release(lock, "other"))
+    assert handled == [] and sent == [(owner_id, telegram.CHAT_BUSY_REPLY)]
@@ -0,0 +1,46 @@
+from app.core.security import create_access_token
+
+
+def _import(client, headers, body: str):
+    response = client.post("/import?format=ndjson", content=body.encode(), headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_project_id_must_be_visible(budgeted_client, auth, owner_id):
+    client = budgeted_client
+    other = {"Authorization": "Bearer " + create_access_token({"user": {"id": owner_id + 500_000}})}
+    foreign = client.post("/projects/", json={"name": "theirs"}, headers=other).json()["id"]
+    own = client.post("/projects/", json={"name": "mine"}, headers=auth).json()["id"]
+
+    result = _import(client, auth, f'{{"title": "a", "project_id": {own}}}\n{{"title": "b", "project_id": {foreign}}}\n')
+    assert result["created_tasks"] == 1
+    assert result["failed"] == 1
+    assert result["errors"] == [{"row": 2, "error": f"project {foreign} does not exist"}]
+    assert [t["project_id"] for t in client.get("/tasks/", headers=auth).json()] == [own]
+    assert client.get(f"/tasks/?project_id={foreign}", headers=other).json() == []
+
+
+def test_named_projects_are_created_once(budgeted_client, auth):
+    result = _import(budgeted_client, auth, '{"title": "a", "project": "new"}\n{"title": "b", "project": "new"}\n')
+    assert result["created_projects"] == 1
+    ids = {t["project_id"] for t in budgeted_client.get("/tasks/", headers=auth).json()}
+    assert len(ids) == 1 and None not in ids
+
+
+def test_only_newlines_end_rows(budgeted_client, auth):
+    # U+2028, U+2029 and NEL are valid inside a JSON string; str.splitlines would cut the row there
+    body = '{"title": "a\u2028b"}\n{"title": "c\u2029d\u0085e"}\n'
+    result = _import(budgeted_client, auth, body)
+    assert (result["rows"], result["created_tasks"], result["failed"]) == (2, 2, 0)
+    titles = {t["title"] for t in budgeted_client.get("/tasks/", headers=auth).json()}
+    assert {"a\u2028b", "c\u2029d\u0085e"} <= titles
+
+
+def test_crlf_split_across_chunks():
+    from app.routers.imports import _csv_rows, _split_lines
+
+    chunks = [b"title,priority\r", b"\nok,high\r", b"\n\"two\r\nlines\",low\r\n", b"bad,\"x"]
+    assert list(_split_lines(chunks)) == ["title,priority\n", "ok,high\n", '"two\n', 'lines",low\n', 'bad,"x']
+    # CSV line numbers (used in error reports) count each physical line once
+    assert [(n, row["title"]) for n, row in _csv_rows(_split_lines(chunks))] == [(2, "ok"), (4, "two\nlines"), (5, "bad")]
@@ -0,0 +1,65 @@
+"""Task levels: validated at the API, stored as 0|1|2, and migrated atomically from strings."""
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+from app.db import _create_engine
+from app.migrations import migrate
+from app.models import Level, SchemaVersion, Task
+
+
+def test_unknown_levels_are_rejected(budgeted_client, auth):
+    client = budgeted_client
+    response = client.post("/tasks/", json={"title": "t", "priority": "bogus"}, headers=auth)
+    assert response.status_code == 422, response.text
+    task = client.post("/tasks/", json={"title": "t", "importance": "high"}, headers=auth).json()
+    response = client.put(f"/tasks/{task['id']}", json={"importance": "urgent"}, headers=auth)
+    assert response.status_code == 422, response.text
+    assert client.get(f"/tasks/{task['id']}", headers=auth).json()["importance"] == "high"
+
+
+def test_level_type_never_coerces():
+    level = Level()
+    assert level.process_bind_param("High", None) == 2
+    assert level.process_result_value(0, None) == "low"
+    with pytest.raises(ValueError):
+        level.process_bind_param("bogus", None)
+    with pytest.raises(ValueError):
+        level.process_bind_param(3, None)
+    with pytest.raises(ValueError):
+        level.process_result_value(7, None)
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """A database from before migration 1: levels stored as strings."""
+    engine = _create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    ddl = str(CreateTable(Task.__table__).compile(engine)).replace("SMALLINT", "VARCHAR")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(
+            "INSERT INTO task (owner_id, title, description, duration_hours, priority, importance, kind, created_at)"
+            " VALUES (1, 'old', '', 1.0, 'High', 'low', 'task', '2025-01-01 00:00:00')"
+        )
+    SchemaVersion.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_failed_migration_leaves_the_table_alone(legacy_engine, monkeypatch):
+    def broken(bind, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(Task.__table__, "create", broken)
+    with pytest.raises(RuntimeError):
+        migrate(legacy_engine, {"task", "schemaversion"})
+    assert set(inspect(legacy_engine).get_table_names()) == {"task", "schemaversion"}
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT priority, importance FROM task")).all() == [("High", "low")]
+        assert conn.execute(text("SELECT count(*) FROM schemaversion")).scalar() == 0
+
+    monkeypatch.undo()
+    migrate(legacy_engine, {"task", "schemaversion"})
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT priority, importance FROM task")).all() == [(2, 0)]
+        assert conn.execute(text("SELECT version FROM schemaversion")).scalars().all() == [1]
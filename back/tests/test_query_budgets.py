@@ -0,0 +1,127 @@
+"""Every budgeted route, exercised with enough rows that an N+1 would blow its ``@query_budget``."""
+import pytest
+from sqlmodel import Session, func, select
+
+from app.core.querybudget import routes_without_budget
+from app.db import engine
+from app.main import create_app
+from app.models import ChatMessage
+
+
+ADMIN = {"X-Admin-Token": "test-admin"}
+
+
+@pytest.fixture
+def seeded(budgeted_client, auth):
+    """Three projects, each with tasks and an event, for the signed-in owner."""
+    projects = []
+    for i in range(3):
+        project = budgeted_client.post("/projects/", json={"name": f"p{i}"}, headers=auth)
+        assert project.status_code == 200, project.text
+        projects.append(project.json()["id"])
+        for j in range(3):
+            task = budgeted_client.post("/tasks/", json={
+                "title": f"t{i}{j}", "project_id": project.json()["id"], "deadline": "2030-01-0%d" % (j + 1),
+                "priority": "high" if j else "low", "importance": "high" if i else "low",
+            }, headers=auth)
+            assert task.status_code == 200, task.text
+        event = budgeted_client.post("/events/", json={
+            "title": f"e{i}", "event_start": "2030-01-01T10:00:00", "event_end": "2030-01-01T11:00:00",
+            "project_id": project.json()["id"],
+        }, headers=auth)
+        assert event.status_code == 200, event.text
+    return projects
+
+
+def _ok(response, status=200):
+    # Over budget answers 500 with the repeated statement shapes
+    assert response.status_code == status, response.text
+    return response
+
+
+def test_every_route_declares_a_budget():
+    assert routes_without_budget(create_app()) == []
+
+
+def test_read_routes(budgeted_client, auth, seeded):
+    client = budgeted_client
+    # Tasks and events
+    assert len(_ok(client.get("/tasks/", headers=auth)).json()) == 12
+    assert len(_ok(client.get(f"/tasks/?project_id={seeded[0]}", headers=auth)).json()) == 4
+    assert len(_ok(client.get("/events/", headers=auth)).json()) == 3
+    assert len(_ok(client.get("/projects/", headers=auth)).json()) == 3
+    _ok(client.get("/projects/?with_stats=1", headers=auth))
+    _ok(client.get(f"/projects/{seeded[0]}", headers=auth))
+    matrix = _ok(client.get("/tasks/matrix?limit=5", headers=auth)).json()
+    assert sum(len(cell) for cell in matrix.values()) == 9
+    task_id = client.get("/tasks/", headers=auth).json()[0]["id"]
+    _ok(client.get(f"/tasks/{task_id}", headers=auth))
+    _ok(client.get("/stats/summary", headers=auth))
+    _ok(client.get("/stats/compression", headers=auth))
+    _ok(client.get("/users/me", headers=auth))
+    _ok(client.get("/health"))
+    _ok(client.get("/"))
+    _ok(client.get("/metrics"))
+
+
+def test_write_routes(budgeted_client, auth, seeded):
+    client = budgeted_client
+    task = next(t for t in client.get("/tasks/", headers=auth).json() if t["project_id"] == seeded[1])
+    _ok(client.put(f"/tasks/{task['id']}", json={"title": "renamed", "priority": "medium"}, headers=auth))
+    _ok(client.delete(f"/tasks/{task['id']}", headers=auth))
+    _ok(client.delete(f"/projects/{seeded[0]}", headers=auth))
+    # 12 rows, minus the deleted task, minus project 0's three tasks and event
+    assert len(client.get("/tasks/", headers=auth).json()) == 7
+
+
+def test_settings_routes(budgeted_client, auth):
+    client = budgeted_client
+    _ok(client.get("/settings/me", headers=auth))
+    _ok(client.put("/settings/me", json={"theme": "dark"}, headers=auth))
+    _ok(client.get("/settings/ai", headers=auth))
+    _ok(client.put("/settings/ai", json={"openai_model": "gpt-4o-mini"}, headers=auth))
+    _ok(client.get("/settings/reminders", headers=auth))
+    _ok(client.put("/settings/reminders", json={"enabled": True, "quiet_start": 22, "quiet_end": 7}, headers=auth))
+
+
+def test_calendar_import_export(budgeted_client, auth, seeded):
+    client = budgeted_client
+    token = _ok(client.get("/calendar/token", headers=auth)).json()["token"]
+    feed = _ok(client.get(f"/calendar/{token}.ics"))
+    assert "BEGIN:VCALENDAR" in feed.text
+    _ok(client.get(f"/calendar/{token}.ics"))  # served from the cache
+    rows = "".join('{"title": "imp%d", "project": "imported"}\n' % i for i in range(20))
+    result = _ok(client.post("/import?format=ndjson", content=rows.encode(), headers=auth)).json()
+    assert result["created_tasks"] == 20
+    exported = _ok(client.get("/export?format=ndjson", headers=auth))
+    assert exported.text.count('"type": "task"') + exported.text.count('"type":"task"') == 29
+
+
+def test_debug_routes(budgeted_client):
+    _ok(budgeted_client.get("/debug/profiles", headers=ADMIN))
+    _ok(budgeted_client.get("/debug/shards", headers=ADMIN))
+
+
+def test_webhook_and_clear_context(budgeted_client, owner_id):
+    client = budgeted_client
+    for i in range(5):
+        update = {"update_id": owner_id * 100 + i,
+                  "message": {"chat": {"id": owner_id}, "from": {"id": owner_id}, "text": f"hello {i}"}}
+        _ok(client.post("/telegram/webhook", json=update))
+    with Session(engine) as session:
+        count = select(func.count()).select_from(ChatMessage).where(ChatMessage.owner_id == owner_id)
+        assert session.exec(count).one() == 5
+        clear = {"update_id": owner_id * 100 + 99,
+                 "message": {"chat": {"id": owner_id}, "from": {"id": owner_id}, "text": "Очистить контекст"}}
+        _ok(client.post("/telegram/webhook", json=clear))
+        assert session.exec(count).one() == 0
+
+
+def test_project_stats_match_their_schema(budgeted_client, auth, seeded):
+    from app.schemas import ProjectWithStats
+
+    projects = _ok(budgeted_client.get("/projects/?with_stats=1", headers=auth)).json()
+    stats = [ProjectWithStats.model_validate(p) for p in projects]
+    assert [(s.total, s.remaining_hours) for s in stats] == [(4, 3.0)] * 3
+    schema = budgeted_client.get("/openapi.json").json()["paths"]["/projects/"]["get"]["responses"]["200"]
+    assert "ProjectWithStats" in str(schema)
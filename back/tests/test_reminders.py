@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import pytest
+from sqlmodel import Session
+
+from app.db import engine, init_db
+from app.models import ReminderSettings, Task
+from app.reminders import ReminderScheduler
+
+
+class FakeSender:
+    def __init__(self) -> None:
+        self.sent: List[Dict[int, str]] = []
+
+    async def send_many(self, messages: Dict[int, str]) -> Dict[int, str]:
+        self.sent.append(messages)
+        return {chat_id: "ok" for chat_id in messages}
+
+
+@pytest.fixture
+def event(owner_id):
+    init_db(engine)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    with Session(engine) as session:
+        # No quiet hours, UTC, so the reminder fires lead minutes before the start
+        session.add(ReminderSettings(owner_id=owner_id, enabled=True, utc_offset_minutes=0, quiet_start=0, quiet_end=0))
+        task = Task(owner_id=owner_id, title="standup", kind="event",
+                    event_start=now + timedelta(minutes=30), event_end=now + timedelta(minutes=45))
+        session.add(task)
+        session.commit()
+        session.refresh(task)
+    return task.id, now
+
+
+def _move(task_id: int, start: datetime) -> None:
+    with Session(engine) as session:
+        task = session.get(Task, task_id)
+        task.event_start, task.event_end = start, start + timedelta(minutes=15)
+        session.add(task)
+        session.commit()
+
+
+def _cycle(scheduler: ReminderScheduler, sender: FakeSender, now: datetime) -> None:
+    scheduler.resynced_at = None  # force a full re-read, as the periodic resync does
+    scheduler.scan(now)
+    asyncio.run(scheduler.deliver(scheduler.pop_due(now), sender, now))
+
+
+def test_rescheduled_and_moved_back_event_is_still_reminded(event, owner_id):
+    task_id, now = event
+    scheduler = ReminderScheduler(engine)
+    sender = FakeSender()
+    scheduler.scan(now)
+    original = next(key for key in scheduler.queued if key[0] == task_id)
+
+    _move(task_id, now + timedelta(minutes=90))
+    # The original fire time comes: the stale reminder is dropped, and its key with it
+    _cycle(scheduler, sender, now + timedelta(minutes=16))
+    assert not any(owner_id in messages for messages in sender.sent)
+    assert original not in scheduler.queued
+
+    _move(task_id, now + timedelta(minutes=30))
+    _cycle(scheduler, sender, now + timedelta(minutes=17))
+    assert [messages[owner_id] for messages in sender.sent if owner_id in messages] == [
+        f"⏰ Напоминание:\n• {original[2]:%H:%M} — standup"
+    ]
+
+
+def test_deleted_task_does_not_leak_its_key(event):
+    task_id, now = event
+    scheduler = ReminderScheduler(engine)
+    scheduler.scan(now)
+    with Session(engine) as session:
+        session.delete(session.get(Task, task_id))
+        session.commit()
+    later = now + timedelta(minutes=16)
+    asyncio.run(scheduler.deliver(scheduler.pop_due(later), FakeSender(), later))
+    assert not any(key[0] == task_id for key in scheduler.queued)
@@ -0,0 +1,183 @@
+"""With several shards, owners still see the global rows, which live on shard 0."""
+import itertools
+import logging
+
+import pytest
+from sqlalchemy import func, insert
+from sqlmodel import Session, select
+
+from app.core import querybudget
+from app.db import _create_engine, engine, hash_shard, init_db, shard_router
+from app.models import Project, Task
+from app.routers.telegram import _build_tasks_context
+from app.shards import move_owner
+
+
+_owners = itertools.count(2_000_001)
+
+
+@pytest.fixture
+def second_shard(tmp_path, monkeypatch):
+    shard = _create_engine(f"sqlite:///{tmp_path / 'shard1.db'}")
+    init_db(shard)
+    querybudget.install(shard)
+    monkeypatch.setattr(shard_router, "engines", [engine, shard])
+    # Id reservations seen by this process are per shard set
+    monkeypatch.setattr(shard_router, "_id_blocks", {})
+    monkeypatch.setattr(shard_router, "_id_floors", set())
+    yield shard
+    shard.dispose()
+
+
+@pytest.fixture
+def global_rows(second_shard):
+    with Session(engine) as session:
+        project = Project(name="global project")
+        session.add(project)
+        session.flush()
+        task = Task(title="global task", project_id=project.id, priority="high", importance="high")
+        session.add(task)
+        session.commit()
+        ids = project.id, task.id
+    yield ids
+    _delete(Task, ids[1])
+    _delete(Project, ids[0])
+
+
+def _delete(model, row_id):
+    with Session(engine) as session:
+        row = session.get(model, row_id)
+        if row is not None:
+            session.delete(row)
+        session.commit()
+
+
+def _owner_on(shard):
+    return next(owner for owner in _owners if hash_shard(owner, 2) == shard)
+
+
+def _auth(owner):
+    from app.core.security import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token({'user': {'id': owner}})}"}
+
+
+@pytest.mark.parametrize("shard", [0, 1])
+def test_global_rows_are_listed(budgeted_client, second_shard, global_rows, shard):
+    owner = _owner_on(shard)
+    auth = _auth(owner)
+    client = budgeted_client
+    own = client.post("/tasks/", json={"title": "own task", "priority": "high", "importance": "high"}, headers=auth)
+    assert own.status_code == 200, own.text
+    with Session(shard_router.engine_for(owner)) as session:
+        assert session.get(Task, own.json()["id"]).title == "own task"
+
+    for compact in ("", "?compact=1"):
+        titles = {t["title"] for t in client.get(f"/tasks/{compact}", headers=auth).json()}
+        assert {"own task", "global task"} <= titles
+    matrix = client.get("/tasks/matrix", headers=auth).json()
+    assert {"own task", "global task"} <= {t["title"] for t in matrix["do_first"]}
+    projects = client.get("/projects/?with_stats=1", headers=auth).json()
+    assert [p["total"] for p in projects if p["id"] == global_rows[0]] == [1]
+    with Session(shard_router.engine_for(owner)) as session:
+        context = _build_tasks_context(session, owner)
+    assert "own task" in context and "global task" in context
+
+
+def test_moved_tasks_report_lost_global_links(second_shard, global_rows, caplog):
+    owner = _owner_on(0)
+    with Session(engine) as session:
+        session.add(Task(owner_id=owner, title="linked", project_id=global_rows[0]))
+        session.commit()
+    with caplog.at_level(logging.WARNING, logger="shards"):
+        assert move_owner(owner, 1, source=0) == 1
+    assert "1 tasks lose their link to a global project" in caplog.text
+    with Session(second_shard) as session:
+        assert session.exec(select(Task.project_id).where(Task.owner_id == owner)).all() == [None]
+
+
+def test_ids_are_unique_across_shards(budgeted_client, second_shard):
+    owner = _owner_on(1)
+    auth = _auth(owner)
+    # Rows from before the reservations, holding the ids shard 0 would hand out next on its own
+    with Session(engine) as session:
+        after = (session.exec(select(func.max(Task.id))).one() or 0) + 1
+    with second_shard.begin() as conn:
+        conn.execute(insert(Task.__table__), [
+            {"id": after + i, "owner_id": owner, "title": f"old {i}", "description": "", "duration_hours": 1.0,
+             "priority": "medium", "importance": "medium", "kind": "task"} for i in range(3)
+        ])
+    with Session(engine) as session:
+        shared = Task(title="shared")
+        session.add(shared)
+        session.commit()
+        shared_id = shared.id
+    own_id = budgeted_client.post("/tasks/", json={"title": "mine"}, headers=auth).json()["id"]
+    assert len({shared_id, own_id, after, after + 1, after + 2}) == 5
+
+    # Ids from the merged list reach the right row on either shard
+    listed = {t["id"]: t["title"] for t in budgeted_client.get("/tasks/", headers=auth).json()}
+    assert listed[shared_id] == "shared" and listed[own_id] == "mine" and listed[after] == "old 0"
+    assert budgeted_client.get(f"/tasks/{shared_id}", headers=auth).json()["title"] == "shared"
+    renamed = budgeted_client.put(f"/tasks/{shared_id}", json={"title": "renamed"}, headers=auth)
+    assert renamed.status_code == 200, renamed.text
+    assert budgeted_client.delete(f"/tasks/{shared_id}", headers=auth).status_code == 200
+    with Session(engine) as session:
+        assert session.get(Task, shared_id) is None
+    assert budgeted_client.get(f"/tasks/{own_id}", headers=auth).json()["title"] == "mine"
+    assert budgeted_client.get(f"/tasks/{shared_id}", headers=auth).status_code == 404
+
+    # Bulk imports reserve ids too
+    body = "".join('{"title": "imp%d", "project": "bulk"}\n' % i for i in range(5))
+    imported = budgeted_client.post("/import?format=ndjson", content=body.encode(), headers=auth).json()
+    assert imported["created_tasks"] == 5
+    with Session(second_shard) as session:
+        ids = session.exec(select(Task.id).where(Task.title.startswith("imp"))).all()
+    with Session(engine) as session:
+        assert not session.exec(select(Task.id).where(Task.id.in_(ids))).all()
+
+
+def test_global_project_stats_count_tasks_on_every_shard(budgeted_client, global_rows):
+    owner = _owner_on(1)
+    auth = _auth(owner)
+    assert budgeted_client.get(f"/projects/{global_rows[0]}", headers=auth).json()["name"] == "global project"
+    own = budgeted_client.post("/tasks/", json={"title": "linked", "project_id": global_rows[0], "duration_hours": 2},
+                               headers=auth)
+    assert own.status_code == 200, own.text
+    stats = {p["id"]: p for p in budgeted_client.get("/projects/?with_stats=1", headers=auth).json()}
+    assert (stats[global_rows[0]]["total"], stats[global_rows[0]]["remaining_hours"]) == (2, 3.0)
+
+
+@pytest.mark.parametrize("shard", [0, 1])
+def test_stats_export_feed_and_import_see_global_rows(budgeted_client, global_rows, shard, request):
+    import json
+    from datetime import date
+
+    owner = _owner_on(shard)
+    auth = _auth(owner)
+    client = budgeted_client
+    with Session(engine) as session:
+        dated = Task(title="global deadline", deadline=date(2000, 1, 1))
+        session.add(dated)
+        session.commit()
+        dated_id = dated.id
+    request.addfinalizer(lambda: _delete(Task, dated_id))
+    own = client.post("/tasks/", json={"title": "own deadline", "deadline": "2000-01-02"}, headers=auth)
+    assert own.status_code == 200, own.text
+
+    listed = client.get("/tasks/", headers=auth).json()
+    summary = client.get("/stats/summary", headers=auth).json()
+    assert summary["total"] == len(listed)
+    assert summary["overdue"] == sum(1 for t in listed if t["deadline"] and t["deadline"] < date.today().isoformat())
+
+    exported = [json.loads(line) for line in client.get("/export?format=ndjson", headers=auth).text.splitlines()]
+    assert {r["data"]["id"] for r in exported if r["type"] == "task"} == {t["id"] for t in listed}
+    assert global_rows[0] in {r["data"]["id"] for r in exported if r["type"] == "project"}
+
+    token = client.get("/calendar/token", headers=auth).json()["token"]
+    feed = client.get(f"/calendar/{token}.ics").text
+    assert "SUMMARY:global deadline" in feed and "SUMMARY:own deadline" in feed
+
+    imported = client.post("/import?format=ndjson", content=f'{{"title": "x", "project_id": {global_rows[0]}}}\n'.encode(),
+                           headers=auth).json()
+    assert (imported["created_tasks"], imported["failed"]) == (1, 0)